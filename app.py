@@ -1,25 +1,38 @@
-from flask import Flask, render_template, request, jsonify, redirect
+from flask import Flask, g, render_template, request, jsonify, redirect, Response, stream_with_context
 import requests
 import os
+import gzip
 import json
-import pandas as pd
-import numpy as np
+import time
 from dotenv import load_dotenv
 import logging
-from datetime import datetime
 import google.generativeai as genai
 
-# Load environment variables
+# Load environment variables (before importing the mpcdc package, whose settings are read at import)
 load_dotenv()
 
+from mpcdc import config  # noqa: E402
+from mpcdc.chat_sessions import ChatSessionManager, MemorySessionStore, SqliteSessionStore, new_session_id, valid_session_id  # noqa: E402
+from mpcdc.classifier import (  # noqa: E402
+    backend_status, classification_unavailable, classify_rows, encoding_status, endpoint_protection_status,
+    get_equivalence_reloader, get_feature_encoder, get_prediction_cache, get_regression_client, parse_change_batch,
+    retry_after_headers, score_change, warm_up
+)
+from mpcdc.idempotency import (  # noqa: E402
+    IdempotencyConflict, IdempotencyStore, SqliteResponseStore, request_fingerprint, valid_idempotency_key
+)
+from mpcdc.label_catalog import DEFAULT_LIMIT, MAX_LIMIT  # noqa: E402
+from mpcdc.lazy import lazy  # noqa: E402
+from mpcdc.metrics import REGISTRY, STAGE_SECONDS  # noqa: E402
+from mpcdc.prediction_cache import MemoryCache  # noqa: E402
+from mpcdc.risk_assessment import AssessmentValidationError, RiskAssessor, build_assessment_prompt, prompt_version  # noqa: E402
+
 app = Flask(__name__)
 
-# Get Databricks token from environment variable (still needed for regression endpoint)
-DATABRICKS_TOKEN = os.getenv("DATABRICKS_TOKEN")
-# Databricks regression endpoint URL for change classification
-MPCDC_REGRESSION_ENDPOINT = os.getenv("MPCDC_REGRESSION_ENDPOINT", "https://adb-2869758279805397.17.azuredatabricks.net/serving-endpoints/New_MPCDC_Regression_Endpoint/invocations")
-# Databricks serving endpoint URL (No longer used for chatbot)
-# DATABRICKS_ENDPOINT = os.getenv("DATABRICKS_ENDPOINT")
+# Get Databricks token from environment variable (only used by the /mpcdc/status probe below)
+DATABRICKS_TOKEN = config.DATABRICKS_TOKEN
+# Databricks serving endpoint URL (No longer used for chatbot; only probed by /mpcdc/status when set)
+DATABRICKS_ENDPOINT = os.getenv("DATABRICKS_ENDPOINT")
 # Databricks preprocessing pipeline endpoint URL (Updated)
 # PREPROCESSING_PIPELINE_ENDPOINT = os.getenv("PREPROCESSING_PIPELINE_ENDPOINT", "https://adb-2869758279805397.17.azuredatabricks.net/serving-endpoints/PipelineEndpointNewV2/invocations")
 
@@ -41,51 +54,40 @@ generation_config = {
 # Using empty safety settings as in astra_gemini.py's model initialization
 safety_settings = []
 
-genai.configure(api_key=GENAI_API_KEY)
-
-# Initialize the Gemini model
-model = genai.GenerativeModel(
-    model_name="gemini-2.5-flash-preview-04-17",
-    # system_instruction will be handled in the chat history messages
-    generation_config=generation_config,
-    safety_settings=safety_settings
-)
-
-# Start the chat session
-chat_session = model.start_chat()
-
-# Path to the equivalence CSV
-EQUIVALENCE_CSV_PATH = "AI_Failure_Prediction_and_Prevention_for_CTTI.csv"
-
-# Define the feature columns that the new model expects as input (before indexing)
-# These are the raw names from your form/data.
-MODEL_INPUT_FEATURES = [
-    "submit_date", "scheduled_start_date", "scheduled_end_date", "f01_chr_serviceid",
-    "serviceci", "ASORG", "ASGRP", "categorization_tier_1", "categorization_tier_2",
-    "categorization_tier_3", "product_cat_tier_1", "product_cat_tier_2", "product_cat_tier_3",
-    "change_request_status", "f01_chr_tipoafectacion"
-]
-
-# Define the order of features expected by the Databricks model endpoint.
-# These are the *indexed* versions of the MODEL_INPUT_FEATURES.
-FEATURE_ORDER = [col + "_index" for col in MODEL_INPUT_FEATURES]
-
-# CATEGORICAL_COLUMNS are the raw feature names used to look up values in `raw_data`
-# and then in `EQUIVALENCE_MAP`. For the new model, all input features are treated as categorical first.
-CATEGORICAL_COLUMNS = MODEL_INPUT_FEATURES
-
-# NUMERICAL_COLUMNS is now empty as the new model string-indexes all its input features.
-NUMERICAL_COLUMNS = []
-
-# Mapping for the final prediction output (Priority)
-# Mapping for the final prediction output (Priority)
-# Model predicts P1 (High Priority) and P3 (Medium Priority).
-# P3 maps to 0.0, P1 maps to 1.0.
-PREDICTION_TYPE_MAPPING = {
-    0.0: "P3",  # Medium Priority
-    1.0: "P1"   # High Priority
-}
-
+# Latency metrics exported by /mpcdc/metrics (stage timers are in mpcdc/metrics.py)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram("mpcdc_http_request_seconds", "Request latency by route and status code.",
+                                          ["method", "route", "status"])
+GEMINI_SECONDS = REGISTRY.histogram("mpcdc_gemini_seconds", "Gemini call latency until the whole reply, by call.", ["call"])
+GEMINI_FIRST_TOKEN_SECONDS = REGISTRY.histogram("mpcdc_gemini_first_token_seconds",
+                                                "Time until Gemini streams the first chunk of a reply, by call.", ["call"])
+
+# Per-conversation chat sessions: each client session ID keeps its own bounded history
+# (CHAT_MAX_TURNS user/model exchanges are re-sent to Gemini; older ones are dropped, or summarized
+# when CHAT_SUMMARIZE_HISTORY is enabled). CHAT_SESSION_STORE=sqlite shares sessions between workers
+# (gunicorn.conf.py makes it the default under gunicorn, which runs several workers).
+CHAT_SESSION_STORE = os.getenv("CHAT_SESSION_STORE", "memory")
+CHAT_SESSION_DB_PATH = os.getenv("CHAT_SESSION_DB_PATH", "/tmp/mpcdc_chat_sessions.sqlite")
+CHAT_MAX_TURNS = int(os.getenv("CHAT_MAX_TURNS", "10"))
+CHAT_SESSION_IDLE_TTL = float(os.getenv("CHAT_SESSION_IDLE_TTL", "1800"))
+CHAT_MAX_SESSIONS = int(os.getenv("CHAT_MAX_SESSIONS", "1000"))
+CHAT_MAX_STORE_BYTES = int(os.getenv("CHAT_MAX_STORE_BYTES", str(50 * 1024 * 1024)))
+CHAT_SUMMARIZE_HISTORY = os.getenv("CHAT_SUMMARIZE_HISTORY", "false").lower() in ("1", "true", "yes")
+
+# LLM risk assessment stage (/mpcdc/classify_change?assess=true). Validated assessments are cached
+# per (feature vector, predicted label, prompt version); RISK_ASSESSMENT_CACHE_SIZE=0 disables the cache.
+RISK_ASSESSMENT_CACHE_SIZE = int(os.getenv("RISK_ASSESSMENT_CACHE_SIZE", "1024"))
+RISK_ASSESSMENT_CACHE_TTL = float(os.getenv("RISK_ASSESSMENT_CACHE_TTL", "86400"))
+# Total LLM calls per assessment when the reply does not match the JSON contract
+RISK_ASSESSMENT_MAX_ATTEMPTS = int(os.getenv("RISK_ASSESSMENT_MAX_ATTEMPTS", "2"))
+
+# Responses of /mpcdc/classify_change requests sent with an Idempotency-Key header are replayed to
+# repeats of the request for IDEMPOTENCY_TTL seconds (see mpcdc/idempotency.py);
+# IDEMPOTENCY_MAX_ENTRIES=0 ignores the header. IDEMPOTENCY_STORE=sqlite (file at IDEMPOTENCY_DB_PATH)
+# shares the stored responses between workers (the default under gunicorn); "memory" keeps them per worker.
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "600"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_STORE = os.getenv("IDEMPOTENCY_STORE", "memory")
+IDEMPOTENCY_DB_PATH = os.getenv("IDEMPOTENCY_DB_PATH", "/tmp/mpcdc_idempotency.sqlite")
 
 # Mock responses for the chatbot part
 mock_responses = {
@@ -170,200 +172,118 @@ Your response **MUST be a single, valid JSON object** with the following structu
     }
 ]
 
-system_message = """
-You are an AI assistant specialized in IT risk assessment and prevention for the Centre de Telecomunicacions i Tecnologies de la Informació (CTTI). Your purpose is to help CTTI operators proactively manage critical application changes to minimize incidents and downtime.
-
-You will receive contextual information derived from Machine Learning models trained on historical CTTI data regarding IT changes ('canvis') and incidents ('incidencies'). This context includes:
-
-1.  **Changes Clusters (`canvis_clusters`):**
-    *   These clusters group historical IT changes based on characteristics like `Categorization_tier_1` (type of change, e.g., DESPLEGAMENT, INFRAESTRUCTURA, SEGURETAT) and `change_time` (duration of the change window in hours).
-    *   You are given `canvis_clusters_summary`: Statistical summaries (count, mean, stddev, min, max) of variables within these change clusters. Pay attention to means and deviations for `change_time` and the distribution across `Categorization_tier_1_indexed` (which maps to `Categorization_tier_1` labels).
-    *   You are given `canvis_corr`: Correlation matrix showing relationships between `Categorization_tier_1_indexed`, `change_time`, and the `prediction` (the assigned cluster ID for changes). Note how change duration correlates with cluster assignment.
-    *   You are given `canvis_clusters_translated`: Examples of actual change records, showing their features and assigned cluster (`prediction`). Use these to understand the typical content of each cluster.
-
-2.  **Incidents Clusters (`incidencies_clusters`):**
-    *   These clusters group historical IT incidents based on characteristics like `Assigned_Support_Organization_Group` (the team resolving the incident, e.g., CPD, AM, SC, XOC) and `incident_time` (duration of the incident in hours).
-    *   You are given `incidencies_clusters_summary`: Statistical summaries for incident clusters. Note means and deviations for `incident_time` and the distribution across `Assigned_Support_Organization_Group_indexed` (which maps to `Assigned_Support_Organization_Group` labels).
-    *   You are given `incidencies_corr`: Correlation matrix showing relationships between `Assigned_Support_Organization_Group_indexed`, `incident_time`, and the `prediction` (the assigned cluster ID for incidents). Note how incident duration and assigned team correlate with cluster assignment.
-    *   You are given `incidencies_clusters_translated`: Examples of actual incident records, showing their features and assigned cluster (`prediction`). Use these to understand typical incident types/resolutions within each cluster.
+@lazy
+def gemini_model():
+    """Gemini model with the risk assessment system prompt, configured and built on first use."""
+    genai.configure(api_key=GENAI_API_KEY)
+    return genai.GenerativeModel(
+        model_name="gemini-2.5-flash-preview-04-17",
+        system_instruction=chat_history[0]["content"],
+        generation_config=generation_config,
+        safety_settings=safety_settings
+    )
+
+
+def summarize_chat_turns(previous_summary, dropped_turns):
+    """Folds chat exchanges that left the history window into a short running summary."""
+    transcript = "\n".join(f"{turn['role'].upper()}: {turn['text']}" for turn in dropped_turns)
+    prompt = ("Summarize the following conversation excerpt in at most 5 sentences, keeping any change "
+              "details, predicted priorities and agreed action plans.\n\n"
+              f"Previous summary: {previous_summary or '(none)'}\n\n{transcript}")
+    genai.configure(api_key=GENAI_API_KEY)
+    summary_model = genai.GenerativeModel(model_name="gemini-2.5-flash-preview-04-17", generation_config=generation_config)
+    with GEMINI_SECONDS.time("summary"):
+        return summary_model.generate_content(prompt).text
+
+
+def create_chat_session_store():
+    """Builds the chat session store from the CHAT_SESSION_* settings."""
+    if CHAT_SESSION_STORE == "sqlite":
+        try:
+            return SqliteSessionStore(CHAT_SESSION_DB_PATH, max_sessions=CHAT_MAX_SESSIONS, idle_ttl=CHAT_SESSION_IDLE_TTL)
+        except Exception as e:
+            app.logger.error(f"Could not open chat session store at {CHAT_SESSION_DB_PATH}: {e}. Using in-memory sessions.")
+    return MemorySessionStore(max_sessions=CHAT_MAX_SESSIONS, idle_ttl=CHAT_SESSION_IDLE_TTL, max_bytes=CHAT_MAX_STORE_BYTES)
 
-**Your Task:**
 
-In addition to this cluster context, you will receive information about a **specific, planned IT change** and the output of a **predictive model** (e.g., a Random Forest classifier, referred to as 'regression model prediction' in inputs). This prediction will specify the *potential type of incident* (affectation) that the planned change might cause, along with a *confidence score* or probability associated with that prediction.
+CHAT_SESSIONS = ChatSessionManager(
+    create_chat_session_store(),
+    max_turns=CHAT_MAX_TURNS,
+    summarizer=summarize_chat_turns if CHAT_SUMMARIZE_HISTORY else None
+)
 
-You must:
 
-1.  **Analyze:** Carefully examine the details of the *planned change* and its associated *prediction* (potential incident type and confidence).
-2.  **Synthesize:** Interpret this specific information within the broader *context provided by the historical change and incident clusters*. Consider questions like:
-    *   Does the planned change resemble changes in a cluster known for long durations or specific issues?
-    *   Does the predicted incident type align with incidents commonly found in clusters associated with certain change types or resolution teams?
-    *   How do the characteristics of the planned change (e.g., duration, type) compare to the cluster averages?
-3.  **Output:** Generate a JSON object containing:
-    *   `overall_explanation`: A concise (2-4 sentences) textual explanation summarizing your assessment. Integrate insights from both the specific prediction and the relevant cluster context to explain the potential risks and why they might occur.
-    *   `actionable_plans`: A list containing exactly **two** distinct, detailed, and *preventative* action plans. These plans should be practical steps a CTTI operator could take *before* implementing the change to mitigate the specific risks identified in your analysis and the prediction. Each plan in the list must be an object with:
-        *   `plan_description`: (string) The detailed steps of the action plan.
-        *   `confidence`: (float between 0.0 and 1.0) Your assessed confidence that *this specific plan*, if implemented, will effectively mitigate the predicted incident type, considering the overall context.
+@GEMINI_SECONDS.timed("risk_assessment")
+def generate_risk_assessment(prompt):
+    """One stateless Gemini call for the risk assessment stage, asking for a JSON reply."""
+    response = gemini_model().generate_content(prompt, generation_config={"response_mime_type": "application/json"})
+    return response.text
 
-**Example JSON Output Structure:**
 
-```json
-{
-  "overall_explanation": "The planned 'DESPLEGAMENT' change has a high predicted risk (0.85 confidence) of causing a 'Performance Degradation' incident. This aligns with historical 'DESPLEGAMENT' changes in Cluster 0, which often involve code rollouts (like this one) and show a moderate correlation with longer incident resolution times handled by the 'CPD' group (Cluster 3 incidents).",
-  "actionable_plans": [
-    {
-      "plan_description": "Plan 1: Implement enhanced performance monitoring focused on JVM Heap and CPU usage for the target application ('SCL PLATAFORMA') starting 1 hour before the change window and continuing for 4 hours post-deployment. Pre-allocate additional memory resources temporarily during the change window.",
-      "confidence": 0.90
-    },
-    {
-      "plan_description": "Plan 2: Prepare a detailed rollback script specifically for this code version ('11.5.0'). Conduct a dry run of the rollback procedure in the staging environment before the production deployment. Ensure the 'AM10_23-N2-CANVIS' team is on standby during the deployment window for immediate rollback if performance thresholds are breached.",
-      "confidence": 0.75
-    }
-  ]
-}
-```
-Focus on providing clear, data-informed, and preventative guidance to the CTTI operators. Ensure the action plans are distinct and offer practical mitigation strategies.
-"""
+@GEMINI_SECONDS.timed("risk_assessment")
+async def generate_risk_assessment_async(prompt):
+    """Coroutine version of generate_risk_assessment, used by the ASGI app (asgi.py)."""
+    response = await gemini_model().generate_content_async(prompt, generation_config={"response_mime_type": "application/json"})
+    return response.text
 
-# --- Helper Functions ---
-
-def load_equivalence_map(csv_path):
-    """Loads the equivalence CSV into a lookup dictionary."""
-    app.logger.info(f"Loading equivalence map from: {csv_path}")
-    equiv_map = {}
-    try:
-        # IMPORTANT: Assuming the CSV is not excessively large for memory
-        df_equiv = pd.read_csv(csv_path)
-        for _, row in df_equiv.iterrows():
-            equiv_map[(row['Column'], row['Label'])] = row['Index']
-        app.logger.info(f"Successfully loaded {len(equiv_map)} mappings.")
-        return equiv_map
-    except FileNotFoundError:
-        app.logger.error(f"Equivalence CSV not found at: {csv_path}")
-        return None
-    except Exception as e:
-        app.logger.error(f"Error loading or processing equivalence CSV: {e}")
-        return None
-
-# Load the equivalence map at startup
-EQUIVALENCE_MAP = load_equivalence_map(EQUIVALENCE_CSV_PATH)
-if not EQUIVALENCE_MAP:
-    app.logger.warning("Equivalence map failed to load. Change classification endpoint will not work.")
-    # Optionally exit or disable the endpoint if the map is critical
-    # exit(1)
 
+RISK_ASSESSOR = RiskAssessor(
+    generate_risk_assessment,
+    prompt_version(chat_history[0]["content"]),
+    cache=MemoryCache(RISK_ASSESSMENT_CACHE_SIZE, RISK_ASSESSMENT_CACHE_TTL) if RISK_ASSESSMENT_CACHE_SIZE > 0 else None,
+    max_attempts=RISK_ASSESSMENT_MAX_ATTEMPTS,
+    generate_async=generate_risk_assessment_async
+)
 
-def create_feature_vector(raw_data):
-    """
-    Converts raw data labels (for all MODEL_INPUT_FEATURES) to their corresponding indices
-    using the global EQUIVALENCE_MAP and assembles the feature vector in the order
-    defined by FEATURE_ORDER.
-    """
-    if not EQUIVALENCE_MAP:
-        app.logger.error("Equivalence map is not loaded. Cannot create feature vector.")
-        return None
 
-    if not EQUIVALENCE_MAP:
-        app.logger.error("Equivalence map is not loaded. Cannot create feature vector.")
+def create_idempotency_store():
+    """Builds the Idempotency-Key store from the IDEMPOTENCY_* settings (None if disabled)."""
+    if IDEMPOTENCY_MAX_ENTRIES <= 0:
         return None
+    responses = None
+    if IDEMPOTENCY_STORE == "sqlite":
+        try:
+            responses = SqliteResponseStore(IDEMPOTENCY_DB_PATH, IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL)
+        except Exception as e:
+            app.logger.error(f"Could not open idempotency store at {IDEMPOTENCY_DB_PATH}: {e}. Keeping responses per worker.")
+    return IdempotencyStore(IDEMPOTENCY_MAX_ENTRIES, IDEMPOTENCY_TTL, responses)
+
+
+IDEMPOTENCY = create_idempotency_store()
+
+@REGISTRY.collector
+def app_metrics():
+    """Risk assessment and chat session figures, read at every /mpcdc/metrics scrape."""
+    risk_stats = RISK_ASSESSOR.stats()
+    chat_stats = CHAT_SESSIONS.stats()
+    return [
+        ("mpcdc_risk_assessment_cache_lookups_total", "counter", "Risk assessment cache lookups by result.",
+         [({"result": "hit"}, risk_stats["hits"]), ({"result": "miss"}, risk_stats["misses"])]),
+        ("mpcdc_risk_assessment_llm_calls_total", "counter", "Gemini calls made by the risk assessment stage.",
+         [({}, risk_stats["llm_calls"])]),
+        ("mpcdc_risk_assessment_invalid_replies_total", "counter", "Risk assessment replies that failed validation.",
+         [({}, risk_stats["invalid_replies"])]),
+        # Workers sharing a sqlite store all count the same sessions
+        ("mpcdc_chat_sessions", "gauge", "Chat sessions in the session store.", [({}, chat_stats["sessions"])],
+         "max" if chat_stats["backend"] == "sqlite" else "sum"),
+        ("mpcdc_idempotent_requests_total", "counter", "Classify requests with an Idempotency-Key, by outcome.",
+         [({"outcome": outcome}, getattr(IDEMPOTENCY, outcome)) for outcome in ("stored", "replays", "conflicts")] if IDEMPOTENCY else []),
+    ]
 
-    feature_vector_dict = {}
-
-    # Process all MODEL_INPUT_FEATURES as categorical, converting them to their indexed versions.
-    # The FEATURE_ORDER list already contains the target *_index names.
-    for raw_feature_name in MODEL_INPUT_FEATURES:
-        indexed_feature_name = raw_feature_name + "_index"
-        label_value = raw_data.get(raw_feature_name)
-
-        # Handle datetime-local format from frontend for date fields if necessary
-        # The EQUIVALENCE_MAP should contain these exact string values as keys.
-        # Example: '2024-07-02T14:00' for a datetime-local input.
-        # If your model was trained with dates in a different format (e.g., '12/12/2024 15:53:06'),
-        # the EQUIVALENCE_MAP must map the form's datetime-local string to the index
-        # that corresponds to the training data's format/value.
-        # Or, you'd need a conversion step here BEFORE lookup if the map uses the training format.
-        # For simplicity, assuming EQUIVALENCE_MAP handles the form's direct string values for dates.
-
-        if label_value is not None and label_value != "": # Treat empty strings from form as missing
-            # For date fields, ensure the string format matches what's in EQUIVALENCE_MAP
-            # For 'change_request_status', it's sent as a string from JS if not parsed to int there,
-            # ensure EQUIVALENCE_MAP has string keys like "11" for this column.
-            # If it was parsed to int in JS (e.g. 11), then map should have (col, 11) as key.
-            # Current JS sends it as string if not 'change_request_status', which is parsed to int.
-            # Let's assume for 'change_request_status', the label_value will be an int/float from raw_data
-            # if it was parsed, or string if not. The EQUIVALENCE_MAP must match this.
-            # Given the model structure (all StringIndexed), all inputs are effectively treated as strings
-            # before indexing. So, ensure label_value is string for lookup.
-            
-            current_label_for_lookup = str(label_value)
-
-            index = EQUIVALENCE_MAP.get((raw_feature_name, current_label_for_lookup))
-            if index is not None:
-                feature_vector_dict[indexed_feature_name] = float(index) # Ensure index is float
-            else:
-                # Log a warning and default to 0.0 if a specific label for a feature isn't in the map.
-                # This is crucial for debugging missing entries in your equivalence CSV.
-                app.logger.warning(f"Label '{current_label_for_lookup}' for column '{raw_feature_name}' not found in equivalence map. Defaulting index to 0.0 for {indexed_feature_name}.")
-                feature_vector_dict[indexed_feature_name] = 0.0 # Default for unmapped labels
-        else:
-            # If the feature is missing in raw_data or is an empty string, default its index to 0.0.
-            # Your model's StringIndexer (handleInvalid="skip" or "keep") determines how it handles
-            # unseen values or this default 0.0 if it's not a valid index from training.
-            # "skip" would mean rows with this 0.0 (if it's not a valid category index) might be filtered.
-            app.logger.warning(f"Missing or empty value for categorical column '{raw_feature_name}'. Defaulting index to 0.0 for {indexed_feature_name}.")
-            feature_vector_dict[indexed_feature_name] = 0.0
-
-    # Assemble the final feature vector in the exact order specified by FEATURE_ORDER
-    final_feature_vector = []
-    for ordered_feature_name in FEATURE_ORDER: # FEATURE_ORDER contains the *_index names
-        value = feature_vector_dict.get(ordered_feature_name)
-        if value is None:
-            # This case should ideally not be hit if the loop above correctly processes all MODEL_INPUT_FEATURES
-            # and FEATURE_ORDER is derived correctly from it.
-            app.logger.error(f"Critical internal error: Indexed feature '{ordered_feature_name}' was not calculated. Defaulting to 0.0. This indicates a mismatch between MODEL_INPUT_FEATURES and FEATURE_ORDER logic.")
-            final_feature_vector.append(0.0)
-        else:
-            final_feature_vector.append(value)
-
-    app.logger.info(f"Assembled feature vector for new model: {final_feature_vector}")
-    return final_feature_vector
-
-
-def call_databricks_endpoint(endpoint_url, payload):
-    """Helper function to call a Databricks endpoint."""
-    headers = {'Authorization': f'Bearer {DATABRICKS_TOKEN}', 'Content-Type': 'application/json'}
-    try:
-        # Using standard json, handle potential NaN/Inf if necessary
-        def default_serializer_std(obj):
-             if isinstance(obj, np.integer):
-                 return int(obj)
-             elif isinstance(obj, np.floating):
-                 # Convert NaN to None for standard JSON
-                 return float(obj) if not np.isnan(obj) else None
-             elif isinstance(obj, np.ndarray):
-                 return obj.tolist()
-             elif isinstance(obj, np.bool_):
-                 return bool(obj)
-             raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
-
-        # Be strict with NaN/Inf during serialization
-        payload_json = json.dumps(payload, default=default_serializer_std, allow_nan=False)
-
-        response = requests.post(endpoint_url, headers=headers, data=payload_json)
-        response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        app.logger.error(f"Error calling endpoint {endpoint_url}: {e}")
-        if e.response is not None:
-            app.logger.error(f"Response status code: {e.response.status_code}")
-            app.logger.error(f"Response text: {e.response.text}")
-        return None
-    except (TypeError, ValueError) as e: # Catch JSON encoding errors
-        app.logger.error(f"Error encoding payload to JSON: {e}")
-        app.logger.error(f"Payload causing error (sample): {str(payload)[:500]}...") # Log sample of payload
-        return None
+# --- Flask Routes ---
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
 
-# --- Flask Routes ---
+@app.after_request
+def observe_request_time(response):
+    # Streamed responses (chat SSE) are timed until their headers; the whole reply is in mpcdc_gemini_seconds
+    started = g.get("request_started")
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route, str(response.status_code))
+    return response
 
 @app.route('/')
 def root(): # Redirect root to /mpcdc
@@ -372,9 +292,40 @@ def root(): # Redirect root to /mpcdc
 @app.route('/mpcdc')
 def index(): # Main page route
     # Pass the status of the equivalence map loading to the template
-    map_loaded = bool(EQUIVALENCE_MAP)
+    map_loaded = bool(get_feature_encoder())
     return render_template('index.html', use_mock=USE_MOCK_RESPONSES, map_loaded=map_loaded)
 
+def chat_request_session_id():
+    """Session ID of the chat request; a new one if the client sent none (or an invalid one)."""
+    session_id = request.json.get('session_id') or request.headers.get('X-Session-ID')
+    if not valid_session_id(session_id):
+        session_id = new_session_id()
+    return session_id
+
+
+def stream_chat_reply(session_id, user_input):
+    """
+    Sends the user message within the conversation and yields the reply text chunk by chunk as
+    Gemini streams it. The exchange is recorded in the session once the reply is complete.
+    """
+    # No lock is held while Gemini answers: the exchange is appended atomically once complete
+    chat_session = gemini_model().start_chat(history=CHAT_SESSIONS.history(session_id))
+
+    # Send the user query to the chat session and get the streaming response
+    started = time.perf_counter()
+    response = chat_session.send_message(user_input, stream=True)
+
+    ai_response = ""
+    for position, chunk in enumerate(response):
+        if position == 0:
+            GEMINI_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started, "chat")
+        ai_response += chunk.text
+        yield chunk.text
+    GEMINI_SECONDS.observe(time.perf_counter() - started, "chat")
+
+    CHAT_SESSIONS.record(session_id, user_input, ai_response)
+
+
 @app.route('/mpcdc/chat', methods=['POST'])
 def chat(): # Chatbot endpoint (uses separate logic/endpoint)
     user_input = request.json.get('message', '')
@@ -382,36 +333,70 @@ def chat(): # Chatbot endpoint (uses separate logic/endpoint)
     if not user_input:
         return jsonify({"error": "Message cannot be empty"}), 400
 
+    # Each conversation is keyed by the client's session ID
+    session_id = chat_request_session_id()
+
     # If using mock responses, return a predefined response based on keywords
     if USE_MOCK_RESPONSES:
         response = get_mock_response(user_input)
-        return jsonify({"response": response})
-
-    # Make a copy of the chat history for this request
-    current_chat_history = list(chat_history)
-
-    # Append user message to chat history
-    current_chat_history.append({"role": "user", "content": user_input})
+        return jsonify({"response": response, "session_id": session_id})
 
     try:
-        # Send the user query to the chat session and get the streaming response
-        response = chat_session.send_message(user_input, stream=True)
-
-        # Initialize an empty string to store the response as it's being generated
-        ai_response = ""
-
-        # Process the streamed response chunk by chunk
-        for chunk in response:
-            ai_response += chunk.text  # Append the chunk to the full response
-
-        return jsonify({"response": ai_response})
+        # Collect the whole streamed reply (see /mpcdc/chat/stream for incremental delivery)
+        ai_response = "".join(stream_chat_reply(session_id, user_input))
+        return jsonify({"response": ai_response, "session_id": session_id})
 
     except Exception as e:
         app.logger.error(f"Exception when calling Gemini API: {str(e)}")
         return jsonify({
-            "response": f"I encountered an error: {str(e)}. Using demo mode instead.\n\n{get_mock_response(user_input)}"
+            "response": f"I encountered an error: {str(e)}. Using demo mode instead.\n\n{get_mock_response(user_input)}",
+            "session_id": session_id
         })
 
+def sse_event(event_type, **fields):
+    """Formats one Server-Sent Events message carrying a JSON object."""
+    return f"data: {json.dumps({'type': event_type, **fields})}\n\n"
+
+@app.route('/mpcdc/chat/stream', methods=['POST'])
+def chat_stream(): # Streaming chatbot endpoint: forwards Gemini chunks as Server-Sent Events
+    """
+    Same request body as /mpcdc/chat. Responds with text/event-stream; every event is a JSON object:
+    {"type": "session", "session_id"} first, then {"type": "chunk", "text"} per chunk as it arrives,
+    and finally {"type": "done"} (or {"type": "error", "message"} if generation fails).
+    """
+    user_input = request.json.get('message', '')
+
+    if not user_input:
+        return jsonify({"error": "Message cannot be empty"}), 400
+
+    session_id = chat_request_session_id()
+
+    def generate():
+        yield sse_event("session", session_id=session_id)
+        if USE_MOCK_RESPONSES:
+            yield sse_event("chunk", text=get_mock_response(user_input))
+            yield sse_event("done")
+            return
+        try:
+            for text in stream_chat_reply(session_id, user_input):
+                if text:
+                    yield sse_event("chunk", text=text)
+            yield sse_event("done")
+        except Exception as e:
+            app.logger.error(f"Exception when streaming from Gemini API: {str(e)}")
+            yield sse_event("error", message=f"I encountered an error: {str(e)}.")
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no" # Keep reverse proxies (nginx ingress) from buffering the stream
+    })
+
+@app.route('/mpcdc/chat/<session_id>', methods=['DELETE'])
+def reset_chat(session_id): # Forget a conversation's history
+    if valid_session_id(session_id):
+        CHAT_SESSIONS.reset(session_id)
+    return jsonify({"status": "success", "session_id": session_id})
+
 def get_mock_response(user_input):
     """Return a mock response for the chatbot based on keywords"""
     user_input_lower = user_input.lower()
@@ -452,24 +437,41 @@ def get_mock_response(user_input):
     # Default response if no keywords are matched
     return mock_responses["default"]
 
+# Extra /mpcdc/status sections registered by other entry points (e.g. asgi.py): name -> callable
+STATUS_PROVIDERS = {}
+
+def status_details():
+    """Fields included in every /mpcdc/status response."""
+    return {
+        "equivalence_map_status": "loaded" if get_feature_encoder() else "error",
+        "equivalence_map": get_equivalence_reloader().stats(),
+        "regression_client": get_regression_client().stats(),
+        "regression_endpoint_protection": endpoint_protection_status(),
+        "prediction_cache": get_prediction_cache().stats() if get_prediction_cache() else None,
+        "prediction_backend": backend_status(),
+        "feature_encoding": encoding_status(),
+        "chat_sessions": CHAT_SESSIONS.stats(),
+        "risk_assessment": RISK_ASSESSOR.stats(),
+        "idempotency": IDEMPOTENCY.stats() if IDEMPOTENCY else None,
+        **{name: provider() for name, provider in STATUS_PROVIDERS.items()}
+    }
+
 @app.route('/mpcdc/status')
 def status(): # Status endpoint (checks chatbot API, not regression)
     """Endpoint to check if the Databricks *Chatbot* API is accessible"""
     if USE_MOCK_RESPONSES:
-        map_status = "loaded" if EQUIVALENCE_MAP else "error"
         return jsonify({
             "status": "demo",
             "message": "Chatbot is running in demo mode. Set a valid DATABRICKS_TOKEN in the .env file to enable full functionality.",
-            "equivalence_map_status": map_status
+            **status_details()
         })
 
     # Check equivalence map status first
-    map_status = "loaded" if EQUIVALENCE_MAP else "error"
-    if not EQUIVALENCE_MAP:
+    if not get_feature_encoder():
          return jsonify({
             "status": "error",
             "message": "Equivalence map failed to load. Change classification is unavailable.",
-            "equivalence_map_status": map_status
+            **status_details()
         }), 500 # Indicate server error if map is critical
 
     # Test connection to the *chatbot* endpoint if token exists
@@ -483,36 +485,77 @@ def status(): # Status endpoint (checks chatbot API, not regression)
                 return jsonify({
                     "status": "connected",
                     "message": "Successfully connected to Databricks Chatbot API.",
-                    "equivalence_map_status": map_status
+                    **status_details()
                 })
             else:
                 return jsonify({
                     "status": "error",
                     "message": f"Error connecting to Databricks Chatbot API: {response.status_code}",
                     "details": response.text[:200], # Limit error detail length
-                    "equivalence_map_status": map_status
+                    **status_details()
                 })
         except requests.exceptions.Timeout:
              return jsonify({
                 "status": "error",
                 "message": "Timeout connecting to Databricks Chatbot API.",
-                "equivalence_map_status": map_status
+                **status_details()
             })
         except Exception as e:
             return jsonify({
                 "status": "error",
                 "message": f"Exception connecting to Databricks Chatbot API: {str(e)}",
-                "equivalence_map_status": map_status
+                **status_details()
             })
     else:
          # If chatbot endpoint is not defined, but token exists
          return jsonify({
             "status": "connected", # Technically connected if token exists
             "message": "Databricks token is set, but Chatbot endpoint URL (DATABRICKS_ENDPOINT) is not defined.",
-            "equivalence_map_status": map_status
+            **status_details()
         })
 
 
+@STAGE_SECONDS.timed("risk_assessment")
+def risk_assessment_fields(change_data, predicted_label, session_id, map_version):
+    """
+    Runs the LLM risk assessment stage for a change classified with equivalence map `map_version`
+    and returns the fields to add to the classification response. The assessment is also recorded in the client's chat conversation
+    (X-Session-ID, or a new one) so follow-up chat questions have the context.
+    """
+    if USE_MOCK_RESPONSES:
+        # No Gemini key: the client falls back to the chatbot's demo responses
+        return {}
+    try:
+        assessment, cached = RISK_ASSESSOR.assess(change_data, predicted_label, config.MODEL_INPUT_FEATURES,
+                                                  scope=map_version)
+    except Exception as e:
+        return risk_assessment_error_fields(e)
+    return record_risk_assessment(change_data, predicted_label, assessment, cached, session_id)
+
+
+def risk_assessment_error_fields(error):
+    """Response fields for a failed risk assessment (the prediction itself is still returned)."""
+    if isinstance(error, AssessmentValidationError):
+        app.logger.error(f"Risk assessment reply did not match the expected JSON structure: {error}")
+        return {"risk_assessment": None, "risk_assessment_error": "The AI's response could not be processed into the expected format."}
+    app.logger.error(f"Exception when calling Gemini API for the risk assessment: {str(error)}")
+    return {"risk_assessment": None, "risk_assessment_error": f"Risk assessment failed: {str(error)}"}
+
+
+def record_risk_assessment(change_data, predicted_label, assessment, cached, session_id):
+    """Records the assessment in the chat conversation and returns the response fields."""
+    app.logger.info(f"Risk assessment {'served from cache' if cached else 'generated'} for predicted label {predicted_label}")
+    if not valid_session_id(session_id):
+        session_id = new_session_id()
+    CHAT_SESSIONS.record(session_id, build_assessment_prompt(change_data, predicted_label, config.MODEL_INPUT_FEATURES),
+                         json.dumps(assessment))
+    return {"risk_assessment": assessment, "risk_assessment_cached": cached, "session_id": session_id}
+
+
+def assess_requested():
+    return request.args.get('assess', '').lower() in ('1', 'true', 'yes')
+
+
 @app.route('/mpcdc/classify_change', methods=['POST'])
 def classify_change_endpoint():
     """
@@ -520,26 +563,16 @@ def classify_change_endpoint():
     1. Receives raw change data (labels).
     2. Converts labels to indices using the local equivalence map.
     3. Assembles the feature vector.
-    4. Calls the Databricks Regression endpoint.
-    5. Returns the prediction.
+    4. Calls the Databricks Regression endpoint (or the local model, see PREDICTION_BACKEND_MODE).
+    5. With ?assess=true, runs the LLM risk assessment for the predicted priority.
+    6. Returns the prediction (and assessment).
+    Repeats of a request sent with an Idempotency-Key header get its stored response (see mpcdc/idempotency.py).
     """
     app.logger.info("Received request for /mpcdc/classify_change")
 
-    # Check if equivalence map is loaded
-    if not EQUIVALENCE_MAP:
-        app.logger.error("Equivalence map not loaded, cannot classify change.")
-        return jsonify({
-            "status": "error",
-            "message": "Equivalence map is not loaded. Please check server logs."
-        }), 500
-
-    # Check if regression endpoint URL is configured
-    if not MPCDC_REGRESSION_ENDPOINT:
-        app.logger.error("MPCDC_REGRESSION_ENDPOINT is not configured.")
-        return jsonify({
-            "status": "error",
-            "message": "Regression endpoint URL is not configured on the server."
-        }), 500
+    unavailable = classification_unavailable()
+    if unavailable:
+        return jsonify(unavailable[0]), unavailable[1]
 
     # Get change data from request
     change_data = request.json
@@ -547,78 +580,140 @@ def classify_change_endpoint():
         app.logger.warning("No change data provided in request.")
         return jsonify({"status": "error", "message": "No change data provided"}), 400
 
-    app.logger.debug(f"Received change data: {change_data}")
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(f"Received change data: {change_data}")
 
-    # --- Step 1: Create Feature Vector ---
-    feature_vector = create_feature_vector(change_data)
-    if feature_vector is None:
-        # Error already logged in create_feature_vector
-        return jsonify({
-            "status": "error",
-            "message": "Failed to create feature vector. Check logs for details (e.g., missing map)."
-        }), 500
+    assess, session_id = assess_requested(), request.headers.get('X-Session-ID')
+    idempotency_key = request.headers.get('Idempotency-Key') if IDEMPOTENCY else None
+    if idempotency_key is None:
+        response, status_code = classify_change_response(change_data, assess, session_id)
+        return jsonify(response), status_code, retry_after_headers(response)
 
-    # --- Step 2: Prepare Payload for Databricks ---
+    # --- Repeats of a request with the same Idempotency-Key get its stored response ---
+    if not valid_idempotency_key(idempotency_key):
+        return jsonify({"status": "error", "message": "Invalid Idempotency-Key header (1 to 255 printable ASCII characters)."}), 400
     try:
-        regression_payload_df = pd.DataFrame({'features': [feature_vector]})
-        regression_payload_dict_raw = regression_payload_df.to_dict(orient='split')
-        regression_payload = {'dataframe_split': regression_payload_dict_raw}
-        if 'index' in regression_payload['dataframe_split']:
-            del regression_payload['dataframe_split']['index']
-        app.logger.debug(f"Prepared payload for regression endpoint: {json.dumps(regression_payload)}")
-    except Exception as e:
-        app.logger.error(f"Error preparing payload for regression model: {e}")
-        return jsonify({"status": "error", "message": "Error preparing data for the model."}), 500
+        response, status_code, replayed = IDEMPOTENCY.run(
+            idempotency_key, request_fingerprint(change_data, assess, session_id),
+            lambda: classify_change_response(change_data, assess, session_id))
+    except IdempotencyConflict as e:
+        return jsonify({"status": "error", "message": str(e)}), 422
+    return jsonify(response), status_code, idempotency_headers(response, replayed)
 
-    # --- Step 3: Call Databricks Regression Endpoint ---
-    regression_result = call_databricks_endpoint(MPCDC_REGRESSION_ENDPOINT, regression_payload)
 
-    if not regression_result:
-        # Error already logged in call_databricks_endpoint
-        return jsonify({
-            "status": "error",
-            "message": "Failed to get response from the regression model endpoint."
-        }), 502 # Bad Gateway might be appropriate
+def classify_change_response(change_data, assess, session_id):
+    """(response, status code) of /mpcdc/classify_change for a change record."""
+    # --- Steps 1-3: Feature vector, prediction cache, prediction backend (see mpcdc.classifier) ---
+    response, status_code, _ = score_change(change_data)
+
+    # --- Step 4: Risk assessment of the predicted priority (optional) ---
+    if assess and status_code == 200:
+        response.update(risk_assessment_fields(change_data, response["predicted_label"], session_id,
+                                               response["equivalence_version"]))
+    return response, status_code
 
-    app.logger.debug(f"Received regression result: {json.dumps(regression_result)}")
 
-    # --- Step 4: Parse Prediction ---
+def idempotency_headers(response, replayed):
+    """Response headers of a request made with an Idempotency-Key (Idempotent-Replayed on a replay)."""
+    headers = retry_after_headers(response)
+    if replayed:
+        headers["Idempotent-Replayed"] = "true"
+    return headers
+
+
+@app.route('/mpcdc/classify_changes', methods=['POST'])
+def classify_changes_endpoint():
+    """
+    Batch endpoint to classify many changes in one call:
+    1. Receives a JSON array (or NDJSON body) of raw change records.
+    2. Converts all rows to feature vectors in one pass of the feature encoder.
+    3. Serves rows whose feature vector is in the prediction cache, then scores the remaining
+       rows in chunks of MPCDC_BATCH_CHUNK_SIZE (one multi-row dataframe_split request per chunk
+       for the Databricks endpoint).
+    4. Returns one result per input row, in input order, including per-row errors.
+    """
+    app.logger.info("Received request for /mpcdc/classify_changes")
+
+    unavailable = classification_unavailable()
+    if unavailable:
+        return jsonify(unavailable[0]), unavailable[1]
+
     try:
-        final_prediction_value = None
-        if 'predictions' in regression_result and isinstance(regression_result['predictions'], list) and regression_result['predictions']:
-            pred_output = regression_result['predictions'][0]
-            if isinstance(pred_output, (int, float)):
-                final_prediction_value = float(pred_output)
-            elif isinstance(pred_output, dict) and 'prediction' in pred_output: # Handle nested prediction if needed
-                 final_prediction_value = pred_output['prediction']
-            else:
-                app.logger.warning(f"Unexpected prediction format in regression response: {pred_output}")
+        rows = parse_change_batch(request.get_data(as_text=True), request.mimetype)
+    except ValueError as e:
+        app.logger.warning(f"Invalid batch request body: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-        if final_prediction_value is not None:
-            predicted_label = PREDICTION_TYPE_MAPPING.get(final_prediction_value, f"UNKNOWN_CODE_{final_prediction_value}")
-            app.logger.info(f"Prediction successful: Label={predicted_label}, Raw={final_prediction_value}")
-            return jsonify({
-                "status": "success",
-                "predicted_label": predicted_label,
-                "raw_prediction": final_prediction_value
-            })
-        else:
-            app.logger.warning("Could not extract final prediction from regression model response.")
-            return jsonify({
-                "status": "error",
-                "message": "Could not parse prediction from model response.",
-                "raw_response": regression_result # Include raw response for debugging
-            }), 500
-    except (ValueError, KeyError, IndexError, TypeError) as e:
-        app.logger.error(f"Error parsing regression model response: {e}")
+    if not rows:
+        return jsonify({"status": "error", "message": "No change data provided"}), 400
+    if len(rows) > config.MPCDC_BATCH_MAX_ROWS:
         return jsonify({
             "status": "error",
-            "message": "Error processing the model's prediction response.",
-            "raw_response": regression_result
-        }), 500
+            "message": f"Too many changes in one request ({len(rows)}). The maximum is {config.MPCDC_BATCH_MAX_ROWS}."
+        }), 413
+
+    return jsonify(classify_rows(rows))
+
+
+# Label catalog responses only change with the equivalence map version (their ETag), so browsers
+# may reuse them for a while and revalidate cheaply afterwards
+LABELS_MAX_AGE = int(os.getenv("LABELS_MAX_AGE", "60"))
+# Smaller bodies are sent uncompressed: gzip would not save a packet
+COMPRESS_MIN_BYTES = 512
+
+
+def compressed_json_response(payload, headers):
+    """JSON response, gzip-compressed when the client accepts it and the body is worth compressing (`headers` should vary on Accept-Encoding)."""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    if len(body) >= COMPRESS_MIN_BYTES and "gzip" in request.accept_encodings:
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype="application/json", headers=headers)
+
+
+@app.route('/mpcdc/metrics')
+def metrics():
+    """Latency histograms and counters in the Prometheus text format, summed over the workers under gunicorn (see mpcdc/metrics.py)."""
+    return Response(REGISTRY.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.route('/mpcdc/labels/<column>')
+def labels_endpoint(column):
+    """
+    Typeahead for the change form: labels of `column` in the equivalence map matching ?prefix=
+    (see mpcdc/label_catalog.py), a page of ?limit= (default 20, at most 100) from ?offset=.
+    The ETag is the equivalence map version, so a revalidation costs no lookup.
+    """
+    encoder = get_feature_encoder()
+    if not encoder or encoder.catalog is None:
+        return jsonify({"status": "error", "message": "Equivalence map is not loaded. Please check server logs."}), 500
+    if column not in encoder.catalog:
+        return jsonify({"status": "error", "message": f"No label catalog for column '{column}'."}), 404
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(max(1, int(request.args.get('limit', DEFAULT_LIMIT))), MAX_LIMIT)
+    except ValueError:
+        return jsonify({"status": "error", "message": "offset and limit must be integers."}), 400
+
+    etag = f'"{encoder.version}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={LABELS_MAX_AGE}", "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains_weak(encoder.version):
+        return Response(status=304, headers=headers)
+
+    prefix = request.args.get('prefix', '')
+    labels, has_more = encoder.catalog.search(column, prefix, offset, limit)
+    return compressed_json_response({
+        "column": column,
+        "prefix": prefix,
+        "labels": labels,
+        "offset": offset,
+        "next_offset": offset + len(labels) if has_more else None,
+        "equivalence_version": encoder.version
+    }, headers)
 
 
 if __name__ == '__main__':
     # Setup basic logging if running directly
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    warm_up()
     app.run(debug=True, host='0.0.0.0', port=5000) # Specify port
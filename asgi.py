@@ -0,0 +1,346 @@
+"""
+ASGI entry point for the MPCDC app.
+
+/mpcdc/classify_change runs on the event loop here. The Databricks call goes through a shared
+httpx connection pool (AsyncDatabricksClient), and the Gemini risk assessment (?assess=true) is
+started concurrently with it whenever the predicted priority is known before the endpoint answers:
+on a prediction cache hit, or speculatively from the local model's label in the fallback/shadow
+modes (the speculative assessment is discarded if the endpoint disagrees). Many in-flight
+classifications are multiplexed per process instead of each one holding a worker thread for the
+sum of both latencies. Every other route is served by the Flask app (app.py) through a WSGI adapter.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import time
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+import app as web
+from mpcdc import classifier, config
+from mpcdc.circuit_breaker import AsyncConcurrencyLimiter, CallRejected
+from mpcdc.databricks_client import AsyncDatabricksClient
+from mpcdc.idempotency import IdempotencyConflict, request_fingerprint, valid_idempotency_key
+from mpcdc.lazy import lazy
+from mpcdc.metrics import REGISTRY, STAGE_SECONDS
+from mpcdc.micro_batcher import AsyncMicroBatcher
+from mpcdc.single_flight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Start the risk assessment for the local model's label while the Databricks call is in flight
+RISK_ASSESSMENT_SPECULATIVE = os.getenv("RISK_ASSESSMENT_SPECULATIVE", "true").lower() in ("1", "true", "yes")
+# Threads serving the Flask (WSGI) routes in each process
+WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", "10"))
+
+# Concurrent classifications of the same feature vector on the event loop share one prediction
+# (MPCDC_SINGLE_FLIGHT); the Flask routes' threads use classifier.PREDICTION_FLIGHTS
+PREDICTION_FLIGHTS = AsyncSingleFlight()
+
+
+@lazy
+def get_async_regression_client():
+    """Shared async keep-alive client for the regression endpoint (one connection pool per process)."""
+    return AsyncDatabricksClient(
+        config.DATABRICKS_TOKEN,
+        pool_size=config.DATABRICKS_POOL_SIZE,
+        connect_timeout=config.DATABRICKS_CONNECT_TIMEOUT,
+        read_timeout=config.DATABRICKS_READ_TIMEOUT,
+        max_retries=config.DATABRICKS_MAX_RETRIES,
+        backoff_base=config.DATABRICKS_BACKOFF_BASE,
+        backoff_max=config.DATABRICKS_BACKOFF_MAX
+    )
+
+
+@lazy
+def get_async_regression_limiter():
+    """
+    Bound on the regression endpoint calls in flight from this process's event loop (None if
+    unlimited); built on first use, inside the loop. The circuit breaker is shared with the Flask routes.
+    """
+    if config.MPCDC_MAX_IN_FLIGHT <= 0:
+        return None
+    return AsyncConcurrencyLimiter(config.MPCDC_MAX_IN_FLIGHT, config.MPCDC_MAX_QUEUE, config.MPCDC_QUEUE_TIMEOUT)
+
+
+@lazy
+def get_async_micro_batcher():
+    """Coalesces concurrent single-change endpoint calls of this process's event loop (None if disabled)."""
+    if config.MPCDC_MICRO_BATCH_SIZE <= 1:
+        return None
+    return AsyncMicroBatcher(predict_remote_async, config.MPCDC_MICRO_BATCH_SIZE, config.MPCDC_MICRO_BATCH_WAIT_MS / 1000)
+
+
+def built_stats(getter):
+    """stats() of a lazily built object for /mpcdc/status (None until the first async call builds it, or if disabled)."""
+    built = getter() if getter.is_built() else None
+    return built.stats() if built else None
+
+
+web.STATUS_PROVIDERS["async_regression_client"] = lambda: get_async_regression_client().stats()
+web.STATUS_PROVIDERS["async_regression_concurrency"] = lambda: built_stats(get_async_regression_limiter)
+web.STATUS_PROVIDERS["async_micro_batching"] = lambda: built_stats(get_async_micro_batcher)
+web.STATUS_PROVIDERS["async_single_flight"] = lambda: PREDICTION_FLIGHTS.stats() if config.MPCDC_SINGLE_FLIGHT else None
+
+
+@REGISTRY.collector
+def async_client_metrics():
+    """Async regression client and single-flight figures for /mpcdc/metrics (once built)."""
+    collected = [classifier.flight_metrics("async", PREDICTION_FLIGHTS)]
+    if get_async_regression_client.is_built():
+        collected += classifier.client_metrics("async_regression", get_async_regression_client().stats())
+    return collected
+
+
+async def call_databricks_endpoint_async(endpoint_url, payload):
+    """
+    Async counterpart of classifier.call_databricks_endpoint: (parsed JSON response or None,
+    whether the call failed because of the endpoint).
+    """
+    try:
+        payload_json = payload if isinstance(payload, bytes) else classifier.serialize_regression_payload(payload)
+    except (TypeError, ValueError) as e: # JSON encoding errors
+        logger.error(f"Error encoding payload to JSON: {e}")
+        return None, False
+    try:
+        with STAGE_SECONDS.time("upstream"):
+            response = await get_async_regression_client().post(endpoint_url, payload_json)
+        with STAGE_SECONDS.time("decode_response"):
+            return response.json(), False
+    except httpx.HTTPStatusError as e:
+        logger.error(f"Error calling endpoint {endpoint_url}: {e}")
+        logger.error(f"Response status code: {e.response.status_code}")
+        logger.error(f"Response text: {e.response.text}")
+        return None, classifier.upstream_failure(e.response.status_code)
+    except httpx.HTTPError as e:
+        # Several httpx transport errors have an empty message, so log the type as well
+        logger.error(f"Error calling endpoint {endpoint_url}: {type(e).__name__} {e}")
+        return None, True
+    except ValueError as e: # A response body that is not JSON
+        logger.error(f"Error decoding response of endpoint {endpoint_url}: {e}")
+        return None, True
+
+
+async def call_regression_endpoint_async(endpoint_url, payload):
+    """Async counterpart of classifier.call_regression_endpoint (concurrency limit and circuit breaker)."""
+    limiter = get_async_regression_limiter()
+    breaker = classifier.get_regression_breaker()
+    try:
+        if limiter:
+            with STAGE_SECONDS.time("queue_wait"):
+                await limiter.acquire()
+    except CallRejected as e:
+        raise classifier.rejected_call_error(e)
+    try:
+        if breaker:
+            breaker.before_call()
+        start = time.perf_counter()
+        upstream_failed = True
+        try:
+            regression_result, upstream_failed = await call_databricks_endpoint_async(endpoint_url, payload)
+        finally:
+            if breaker:
+                # Only failures of the endpoint count (see classifier.upstream_failure)
+                breaker.record(not upstream_failed, time.perf_counter() - start)
+        return regression_result
+    except CallRejected as e:
+        raise classifier.rejected_call_error(e)
+    finally:
+        if limiter:
+            limiter.release()
+
+
+async def predict_remote_async(feature_vectors):
+    """Raw predictions of the regression endpoint for the feature vectors (one dataframe_split request)."""
+    backend = classifier.REMOTE_BACKEND
+    regression_result = await call_regression_endpoint_async(backend.endpoint_url, backend.build_payload(feature_vectors))
+    return backend.parse_result(regression_result, feature_vectors)
+
+
+async def predict_feature_vectors_async(feature_vectors):
+    """Async counterpart of classifier.predict_feature_vectors (same PREDICTION_BACKEND_MODE rules, micro-batching)."""
+    backend = classifier.primary_backend()
+    if backend is not classifier.REMOTE_BACKEND:
+        return backend.predict(feature_vectors), backend.name
+
+    micro_batcher = get_async_micro_batcher() if len(feature_vectors) == 1 else None
+    try:
+        if micro_batcher:
+            predictions = [await micro_batcher.submit(feature_vectors[0])]
+        else:
+            predictions = await predict_remote_async(feature_vectors)
+    except classifier.PredictionBackendError as e:
+        return classifier.fallback_predictions(feature_vectors, e)
+
+    if config.PREDICTION_BACKEND_MODE == "shadow" and classifier.get_local_backend():
+        classifier.run_shadow_model(feature_vectors, predictions)
+    return predictions, backend.name
+
+
+async def predict_feature_vector_async(feature_vector, map_version):
+    """Async counterpart of classifier.predict_feature_vector (single flight per vector and map version)."""
+    if not config.MPCDC_SINGLE_FLIGHT:
+        return await predict_feature_vectors_async([feature_vector])
+    result, _ = await PREDICTION_FLIGHTS.do((map_version, tuple(feature_vector)),
+                                            lambda: predict_feature_vectors_async([feature_vector]))
+    return result
+
+
+def provisional_label(feature_vector):
+    """Local model's label for a change that is about to be sent to the endpoint, or None."""
+    local_backend = classifier.get_local_backend()
+    if not (RISK_ASSESSMENT_SPECULATIVE and local_backend and classifier.primary_backend() is classifier.REMOTE_BACKEND):
+        return None
+    try:
+        value = local_backend.predict([feature_vector])[0]
+    except classifier.PredictionBackendError:
+        return None
+    return classifier.prediction_fields(value)["predicted_label"]
+
+
+def start_assessment(change_data, predicted_label, map_version):
+    return asyncio.ensure_future(web.RISK_ASSESSOR.assess_async(
+        change_data, predicted_label, config.MODEL_INPUT_FEATURES, scope=map_version))
+
+
+@STAGE_SECONDS.timed("risk_assessment_wait")
+async def risk_assessment_fields_async(change_data, predicted_label, session_id, assessment_task):
+    """Async counterpart of web.risk_assessment_fields for an already started assessment."""
+    try:
+        assessment, cached = await assessment_task
+    except Exception as e:
+        return web.risk_assessment_error_fields(e)
+    # Chat sessions may be kept in sqlite, so record off the event loop
+    return await run_in_threadpool(web.record_risk_assessment, change_data, predicted_label, assessment, cached, session_id)
+
+
+def timed_route(endpoint):
+    """Observes the route's latency in web.HTTP_REQUEST_SECONDS, like the Flask request hooks do."""
+    async def timed(request):
+        started = time.perf_counter()
+        response = await endpoint(request)
+        web.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, request.url.path, str(response.status_code))
+        return response
+    return timed
+
+
+@timed_route
+async def classify_change_endpoint(request):
+    """Same contract as the Flask /mpcdc/classify_change route (see app.py)."""
+    logger.info("Received request for /mpcdc/classify_change (async)")
+
+    unavailable = classifier.classification_unavailable()
+    if unavailable:
+        return JSONResponse(unavailable[0], status_code=unavailable[1])
+
+    try:
+        change_data = await request.json()
+    except ValueError:
+        change_data = None
+    if not change_data or not isinstance(change_data, dict):
+        logger.warning("No change data provided in request.")
+        return JSONResponse({"status": "error", "message": "No change data provided"}, status_code=400)
+
+    # No Gemini key (demo mode): the client falls back to the chatbot's demo responses
+    assess = request.query_params.get('assess', '').lower() in ('1', 'true', 'yes') and not web.USE_MOCK_RESPONSES
+    session_id = request.headers.get('X-Session-ID')
+    idempotency_key = request.headers.get('Idempotency-Key') if web.IDEMPOTENCY else None
+    if idempotency_key is None:
+        response, status_code = await classify_change_response(change_data, assess, session_id)
+        return JSONResponse(response, status_code=status_code, headers=classifier.retry_after_headers(response))
+
+    # --- Repeats of a request with the same Idempotency-Key get its stored response ---
+    if not valid_idempotency_key(idempotency_key):
+        return JSONResponse({"status": "error", "message": "Invalid Idempotency-Key header (1 to 255 printable ASCII characters)."},
+                            status_code=400)
+    try:
+        response, status_code, replayed = await web.IDEMPOTENCY.run_async(
+            idempotency_key, request_fingerprint(change_data, assess, session_id),
+            lambda: classify_change_response(change_data, assess, session_id))
+    except IdempotencyConflict as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=422)
+    return JSONResponse(response, status_code=status_code, headers=web.idempotency_headers(response, replayed))
+
+
+async def classify_change_response(change_data, assess, session_id):
+    """Async counterpart of web.classify_change_response, assessing the provisional label while the endpoint is called."""
+    # One equivalence map version for the whole request, even if a reload swaps in a new one meanwhile
+    encoder = classifier.get_feature_encoder()
+
+    # --- Step 1: Create Feature Vector ---
+    label_matches = {}
+    try:
+        feature_vector = classifier.create_feature_vector(change_data, label_matches, encoder)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}, 400
+    if feature_vector is None:
+        return {
+            "status": "error",
+            "message": "Failed to create feature vector. Check logs for details (e.g., missing map)."
+        }, 500
+
+    # --- Step 1b: Serve repeated changes from the prediction cache (the assessment can start at once) ---
+    # The cache may have a shared sqlite tier, so its lookups and stores run off the event loop
+    response = await run_in_threadpool(classifier.cached_classification, feature_vector, encoder.version)
+    if response is not None:
+        if label_matches:
+            response["label_matches"] = label_matches
+        if assess:
+            response.update(await risk_assessment_fields_async(
+                change_data, response["predicted_label"], session_id,
+                start_assessment(change_data, response["predicted_label"], encoder.version)))
+        return response, 200
+
+    # --- Step 2: Score with the prediction backend, assessing the provisional label meanwhile ---
+    speculative_label = provisional_label(feature_vector) if assess else None
+    speculative_task = start_assessment(change_data, speculative_label, encoder.version) if speculative_label else None
+    try:
+        predictions, backend_name = await predict_feature_vector_async(feature_vector, encoder.version)
+    except classifier.PredictionBackendError as e:
+        if speculative_task:
+            speculative_task.cancel()
+        return classifier.prediction_error_response(e)
+
+    # --- Step 3: Return Prediction ---
+    response, status_code = await run_in_threadpool(
+        classifier.classification_result, feature_vector, predictions[0], backend_name, encoder.version)
+    if label_matches and status_code == 200:
+        response["label_matches"] = label_matches
+
+    # --- Step 4: Risk assessment of the predicted priority (optional) ---
+    if assess and status_code == 200:
+        predicted_label = response["predicted_label"]
+        if speculative_task and speculative_label != predicted_label:
+            logger.info(f"Discarding speculative risk assessment for {speculative_label}; endpoint predicted {predicted_label}.")
+            speculative_task.cancel()
+            speculative_task = None
+        assessment_task = speculative_task or start_assessment(change_data, predicted_label, encoder.version)
+        response.update(await risk_assessment_fields_async(change_data, predicted_label, session_id, assessment_task))
+    elif speculative_task:
+        speculative_task.cancel()
+    return response, status_code
+
+
+@contextlib.asynccontextmanager
+async def lifespan(application):
+    yield
+    if get_async_regression_client.is_built():
+        await get_async_regression_client().aclose()
+
+
+application = Starlette(
+    routes=[
+        Route('/mpcdc/classify_change', classify_change_endpoint, methods=['POST']),
+        # Everything else (pages, chat, batch, status) is served by the Flask app
+        Mount('/', app=WSGIMiddleware(web.app, workers=WSGI_THREADS)),
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,208 @@
+"""
+On-disk cache of web search results and scraped page snippets for the ASTRA assistant
+(astra_search.py).
+
+A repeated search (the same query seconds or hours later) is answered from the cache instead of
+calling Serper.dev and scraping every result page again. Two kinds of entries live in one sqlite
+file (WAL mode, one connection per thread, like mpcdc.prediction_cache.SqliteCache):
+
+- "search": the organic results of a query, keyed by the normalized query text
+- "page":   the text snippet of a page, keyed by its URL, with the page's ETag/Last-Modified
+
+An entry is fresh for the lifetime given by the response's Cache-Control (max-age, no-cache,
+no-store) or Expires header, or for a default lifetime when it has none. A stale page with a
+validator is revalidated with a conditional request (If-None-Match / If-Modified-Since) and a 304
+makes it fresh again without downloading the page. Entries are kept at most `ttl` seconds and the
+least recently used ones are evicted beyond `max_entries`. Errors are logged and treated as
+misses, so a broken cache file never fails a search.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query):
+    """Cache key of a search query: case and spacing do not change the results."""
+    return " ".join(query.lower().split())
+
+
+def _http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def freshness_lifetime(headers, default):
+    """
+    Seconds a response may be served without revalidation, from its Cache-Control or Expires
+    header (`default` when it has neither); None if it must not be stored (no-store).
+    """
+    directives = {}
+    for part in headers.get("Cache-Control", "").lower().split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    if "max-age" in directives:
+        try:
+            return max(0.0, float(directives["max-age"]))
+        except ValueError:
+            return 0.0
+    if "Expires" in headers:
+        expires = _http_date(headers["Expires"])
+        date = _http_date(headers.get("Date")) or time.time()
+        return max(0.0, expires - date) if expires is not None else 0.0
+    return default
+
+
+class CachedEntry:
+    __slots__ = ("value", "etag", "last_modified", "fresh")
+
+    def __init__(self, value, etag, last_modified, fresh):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fresh = fresh
+
+    def validators(self):
+        """Conditional request headers revalidating this entry (empty if it has no validator)."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class WebCache:
+    """sqlite-backed cache of search results and page snippets, shared by every thread of the assistant."""
+
+    def __init__(self, path, max_entries=5000, ttl=7 * 86400.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.stale = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.evictions = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS web_cache ("
+                " kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, etag TEXT, last_modified TEXT,"
+                " fresh_until REAL NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL,"
+                " PRIMARY KEY (kind, key))")
+            conn.execute("CREATE INDEX IF NOT EXISTS web_cache_accessed ON web_cache (accessed)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, kind, key):
+        """The CachedEntry for `key` (fresh, or stale and due for revalidation), or None on a miss."""
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, etag, last_modified, fresh_until, expires FROM web_cache WHERE kind = ? AND key = ?",
+                (kind, key)).fetchone()
+            now = time.time()
+            if row is None or row[4] < now:
+                if row is not None:
+                    conn.execute("DELETE FROM web_cache WHERE kind = ? AND key = ?", (kind, key))
+                self._count("misses")
+                return None
+            conn.execute("UPDATE web_cache SET accessed = ? WHERE kind = ? AND key = ?", (now, kind, key))
+            entry = CachedEntry(row[0], row[1], row[2], row[3] > now)
+            self._count("hits" if entry.fresh else "stale")
+            return entry
+        except sqlite3.Error as e:
+            logger.warning(f"Web cache read failed: {e}")
+            return None
+
+    def set(self, kind, key, value, fresh_for, etag=None, last_modified=None):
+        """Stores `value` (text), fresh for `fresh_for` seconds; a None lifetime (no-store) stores nothing."""
+        if fresh_for is None:
+            return
+        try:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO web_cache (kind, key, value, etag, last_modified, fresh_until, expires, accessed)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, key, value, etag, last_modified, now + min(fresh_for, self.ttl), now + self.ttl, now))
+            with self._stats_lock:
+                self._writes += 1
+                trim = self._writes % 64 == 0
+            # Trimming needs a COUNT(*), so only check the bound every few writes
+            if trim:
+                self._trim(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Web cache write failed: {e}")
+
+    def refresh(self, kind, key, fresh_for):
+        """Makes an entry fresh again for `fresh_for` seconds after a 304 Not Modified (and keeps it another `ttl`)."""
+        try:
+            now = time.time()
+            self._connection().execute(
+                "UPDATE web_cache SET fresh_until = ?, expires = ?, accessed = ? WHERE kind = ? AND key = ?",
+                (now + min(fresh_for or 0.0, self.ttl), now + self.ttl, now, kind, key))
+            self._count("revalidated")
+        except sqlite3.Error as e:
+            logger.warning(f"Web cache refresh failed: {e}")
+
+    def _trim(self, conn):
+        conn.execute("DELETE FROM web_cache WHERE expires < ?", (time.time(),))
+        (count,) = conn.execute("SELECT COUNT(*) FROM web_cache").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM web_cache WHERE rowid IN (SELECT rowid FROM web_cache ORDER BY accessed LIMIT ?)",
+                (excess,))
+            with self._stats_lock:
+                self.evictions += excess
+
+    def clear(self):
+        try:
+            self._connection().execute("DELETE FROM web_cache")
+        except sqlite3.Error as e:
+            logger.warning(f"Web cache clear failed: {e}")
+
+    def stats(self):
+        try:
+            (entries,) = self._connection().execute("SELECT COUNT(*) FROM web_cache").fetchone()
+        except sqlite3.Error:
+            entries = None
+        return {
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "stale": self.stale,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
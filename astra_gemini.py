@@ -8,57 +8,14 @@ from elevenlabs.client import ElevenLabs
 from elevenlabs import stream
 from groq import Groq # Add Groq import
 from colorama import init, Fore, Style # Add colorama imports
-import requests # Add requests import
-from bs4 import BeautifulSoup # Add BeautifulSoup import
-import time # Add time import
+from astra_search import web_search_with_scraping # Concurrent web search and scraping
 
 dotenv.load_dotenv()
 
 init() # Initialize colorama
 
-SEARCH_API_KEY = os.getenv("SEARCH_API_KEY") # Add Search API Key variable
-
 groq_client = Groq(api_key=os.getenv("GROQ_API_KEY")) # Initialize Groq client
 
-def web_search_with_scraping(query, num_results=5):
-    # Step 1: Search via Serper.dev
-    url = "https://google.serper.dev/search"
-    headers = {
-        "X-API-KEY": SEARCH_API_KEY,
-        "Content-Type": "application/json"
-    }
-    payload = {"q": query}
-    response = requests.post(url, headers=headers, json=payload)
-
-    if response.status_code != 200:
-        return [f"Search failed: {response.status_code}"]
-
-    search_results = response.json().get("organic", [])[:num_results]
-    contents = []
-
-    # Step 2: Scrape top N URLs
-    for result in search_results:
-        link = result.get("link")
-        try:
-            page = requests.get(link, timeout=4)
-            soup = BeautifulSoup(page.text, "html.parser")
-
-            # Remove scripts/styles
-            for tag in soup(["script", "style", "noscript"]):
-                tag.decompose()
-
-            # Extract visible text
-            text = soup.get_text(separator=' ', strip=True)
-            snippet = text[:700]  # Limit length for speed and token size
-            contents.append(f"{result.get('title')} ({link}):\n{snippet}")
-            time.sleep(0.15)  # Be polite
-
-        except Exception as e:
-            contents.append(f"Could not fetch {link}: {str(e)}")
-
-    return contents
-
-
 generation_config = {
   "temperature": 0.1,
   "top_p": 0.95,
@@ -0,0 +1,299 @@
+"""
+Web search and page scraping for the ASTRA assistant (astra_gemini.py).
+
+web_search_with_scraping() searches through Serper.dev and fetches the top result pages
+concurrently: a small thread pool shares one pooled requests.Session, requests to the same host
+are serialized and spaced by HOST_MIN_INTERVAL (instead of a global sleep after every page), and
+the whole scrape has an overall deadline after which the pages that finished are returned. Each
+page is streamed through an incremental HTML text extractor that stops reading once the snippet
+budget is filled, so no full document tree is built for a 700-character snippet.
+
+Search results and page snippets are kept in an on-disk cache (astra_cache.py), so a repeated
+search is answered without calling Serper.dev or fetching the pages again, and stale pages are
+revalidated with conditional requests. ASTRA_CACHE_PATH sets its sqlite file (default
+~/.cache/astra/web_cache.sqlite, empty to disable it); ASTRA_CACHE_MAX_ENTRIES and ASTRA_CACHE_TTL
+(seconds, default 7 days) bound it.
+
+Only requests and the standard library are needed, so this module can be used (and benchmarked)
+without the voice assistant's dependencies.
+"""
+import codecs
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from astra_cache import WebCache, freshness_lifetime, normalize_query
+
+logger = logging.getLogger(__name__)
+
+SEARCH_URL = "https://google.serper.dev/search"
+
+SNIPPET_CHARS = 700          # Characters of visible text kept per page (for speed and token size)
+SCRAPE_WORKERS = 5           # Pages fetched at once
+PAGE_TIMEOUT = (3.05, 4)     # Connect and read timeouts of one page request
+SCRAPE_DEADLINE = 6.0        # Seconds for the whole scrape; slower pages are left out
+HOST_MIN_INTERVAL = 0.15     # Seconds between two requests to the same host (politeness)
+MAX_PAGE_BYTES = 2 * 1024 * 1024  # Stop reading a page after this much, snippet or not
+CHUNK_BYTES = 16 * 1024
+
+# Search results and snippets are fresh this long when the response has no Cache-Control/Expires
+SEARCH_FRESHNESS = 3600.0
+PAGE_FRESHNESS = 3600.0
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "astra", "web_cache.sqlite")
+
+# Elements whose text is not visible
+SKIPPED_TAGS = {"script", "style", "noscript", "template"}
+
+
+class SnippetExtractor(HTMLParser):
+    """
+    Incremental visible-text extractor: feed() it chunks of HTML and read `text` once `done`
+    (the snippet budget is filled) or the page ends. Text is joined like BeautifulSoup's
+    get_text(separator=' ', strip=True).
+    """
+
+    def __init__(self, max_chars=SNIPPET_CHARS):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts = []
+        self.length = 0
+        self.done = False
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth or self.done:
+            return
+        data = data.strip()
+        if data:
+            self.parts.append(data)
+            self.length += len(data) + 1
+            self.done = self.length > self.max_chars
+
+    @property
+    def text(self):
+        return " ".join(self.parts)[:self.max_chars]
+
+
+class HostGate:
+    """
+    Serializes requests to each host and spaces them by `min_interval` seconds. A host is only
+    tracked while it is in use or spacing applies, so the gate does not grow with every host ever
+    scraped, and a request waiting for its host gives up at its deadline.
+    """
+
+    def __init__(self, min_interval=HOST_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._hosts = {}  # host -> [lock, monotonic time of the last request, requests using it]
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def run(self, url, function, deadline=None):
+        """function() once the host of `url` is free; TimeoutError if that is after `deadline` (monotonic)."""
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            now = time.monotonic()
+            idle = [name for name, (_, last, users) in self._hosts.items()
+                    if not users and last + self.min_interval <= now]
+            for name in idle:
+                del self._hosts[name]
+            entry = self._hosts.setdefault(host, [threading.Lock(), 0.0, 0])
+            entry[2] += 1
+        try:
+            if not entry[0].acquire(timeout=-1 if deadline is None else max(0.0, deadline - time.monotonic())):
+                raise TimeoutError(f"scrape deadline passed waiting for {host}")
+            try:
+                wait_time = entry[1] + self.min_interval - time.monotonic()
+                if wait_time > 0:
+                    if deadline is not None and time.monotonic() + wait_time > deadline:
+                        raise TimeoutError(f"scrape deadline passed waiting for {host}")
+                    time.sleep(wait_time)
+                return function()
+            finally:
+                entry[1] = time.monotonic()
+                entry[0].release()
+        finally:
+            with self._lock:
+                entry[2] -= 1
+
+
+def create_session(pool_size=SCRAPE_WORKERS):
+    """Keep-alive session with a connection pool large enough for every scrape worker."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size * 2, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = "Mozilla/5.0 (compatible; ASTRA assistant)"
+    return session
+
+
+SESSION = create_session()
+HOST_GATE = HostGate()
+_web_cache = []  # the opened cache (or None), once get_web_cache() ran
+_web_cache_lock = threading.Lock()
+
+
+def open_web_cache():
+    """The on-disk search/page cache at ASTRA_CACHE_PATH (None if it is set empty or cannot be opened)."""
+    path = os.getenv("ASTRA_CACHE_PATH", DEFAULT_CACHE_PATH)
+    if not path:
+        return None
+    try:
+        return WebCache(path, max_entries=int(os.getenv("ASTRA_CACHE_MAX_ENTRIES", "5000")),
+                        ttl=float(os.getenv("ASTRA_CACHE_TTL", str(7 * 86400))))
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Could not open the web cache at {path}: {e}. Searching without it.")
+        return None
+
+
+def get_web_cache():
+    """The shared web cache, opened on first use, after the script has loaded its .env file."""
+    if not _web_cache:
+        with _web_cache_lock:
+            if not _web_cache:
+                _web_cache.append(open_web_cache())
+    return _web_cache[0]
+
+
+def text_decoder(encoding):
+    """Incremental decoder for a response's declared encoding (UTF-8 if missing or unknown)."""
+    try:
+        return codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    except LookupError:
+        return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+
+def page_snippet(link, session=SESSION, deadline=None, max_chars=SNIPPET_CHARS, cache=None, cached=None):
+    """
+    The first `max_chars` characters of visible text of a page, reading only as much of it as
+    needed. With a `cache`, a stale `cached` entry is revalidated and complete snippets are stored.
+    """
+    timeout = PAGE_TIMEOUT
+    if deadline:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("scrape deadline passed")
+        # A hanging host is given up on at the deadline, not after the full read timeout
+        timeout = (PAGE_TIMEOUT[0], min(PAGE_TIMEOUT[1], remaining))
+    headers = cached.validators() if cached else {}
+    with session.get(link, timeout=timeout, stream=True, headers=headers) as page:
+        if cached and page.status_code == 304:
+            cache.refresh("page", link, freshness_lifetime(page.headers, PAGE_FRESHNESS))
+            return cached.value
+        content_type = page.headers.get("Content-Type", "text/html").lower()
+        if not (content_type.startswith("text/") or "html" in content_type or "xml" in content_type):
+            raise ValueError(f"unsupported content type {content_type.split(';')[0]}")
+        decoder = text_decoder(page.encoding)
+        extractor = SnippetExtractor(max_chars)
+        received = 0
+        for chunk in page.iter_content(CHUNK_BYTES):
+            extractor.feed(decoder.decode(chunk))
+            received += len(chunk)
+            if deadline and time.monotonic() > deadline:
+                return extractor.text  # cut short: not cached
+            if extractor.done or received >= MAX_PAGE_BYTES:
+                break
+        else:
+            extractor.feed(decoder.decode(b"", final=True))
+            extractor.close()  # text after the last tag
+        if cache and page.status_code == 200:
+            cache.set("page", link, extractor.text, freshness_lifetime(page.headers, PAGE_FRESHNESS),
+                      page.headers.get("ETag"), page.headers.get("Last-Modified"))
+        return extractor.text
+
+
+def scrape_result(result, deadline, session=SESSION, gate=HOST_GATE, cache=None, cached=None):
+    """Context entry for one search result: its title, link and snippet, or the fetch error."""
+    link = result.get("link")
+    try:
+        snippet = gate.run(link, lambda: page_snippet(link, session, deadline, cache=cache, cached=cached), deadline)
+        return f"{result.get('title')} ({link}):\n{snippet}"
+    except Exception as e:
+        return f"Could not fetch {link}: {str(e)}"
+
+
+def scrape_results(search_results, deadline_seconds=SCRAPE_DEADLINE, session=SESSION, gate=HOST_GATE, cache=None):
+    """
+    Scrapes the results concurrently; returns the entries finished within the deadline, in result
+    order. Pages fresh in the `cache` are served from it without a request.
+    """
+    if not search_results:
+        return []
+    deadline = time.monotonic() + deadline_seconds
+    entries = [None] * len(search_results)
+    pending = []
+    for position, result in enumerate(search_results):
+        cached = cache.get("page", result.get("link")) if cache and result.get("link") else None
+        if cached and cached.fresh:
+            entries[position] = f"{result.get('title')} ({result.get('link')}):\n{cached.value}"
+        else:
+            pending.append((position, result, cached))
+    if pending:
+        executor = ThreadPoolExecutor(min(SCRAPE_WORKERS, len(pending)), thread_name_prefix="astra-scrape")
+        futures = {position: executor.submit(scrape_result, result, deadline, session, gate, cache, cached)
+                   for position, result, cached in pending}
+        wait(futures.values(), timeout=deadline_seconds)
+        executor.shutdown(wait=False, cancel_futures=True)  # stragglers stop at the deadline on their own
+        for position, future in futures.items():
+            if future.done() and not future.cancelled():
+                entries[position] = future.result()
+    return [entry for entry in entries if entry is not None]
+
+
+class SearchError(Exception):
+    """A failed search request (the message is the error or HTTP status)."""
+
+
+def search(query, cache=None):
+    """Organic results of a Serper.dev search, served from the `cache` while fresh. Raises SearchError."""
+    key = normalize_query(query)
+    cached = cache.get("search", key) if cache else None
+    if cached and cached.fresh:
+        return json.loads(cached.value)
+
+    headers = {
+        "X-API-KEY": os.getenv("SEARCH_API_KEY"),  # read per call: the script loads .env after its imports
+        "Content-Type": "application/json"
+    }
+    payload = {"q": query}
+    try:
+        response = SESSION.post(SEARCH_URL, headers=headers, json=payload, timeout=PAGE_TIMEOUT)
+    except requests.RequestException as e:
+        raise SearchError(str(e))
+    if response.status_code != 200:
+        raise SearchError(str(response.status_code))
+
+    organic = response.json().get("organic", [])
+    if cache:
+        cache.set("search", key, json.dumps(organic), freshness_lifetime(response.headers, SEARCH_FRESHNESS))
+    return organic
+
+
+def web_search_with_scraping(query, num_results=5):
+    # Step 1: Search via Serper.dev (or the web cache)
+    cache = get_web_cache()
+    try:
+        search_results = search(query, cache)[:num_results]
+    except SearchError as e:
+        return [f"Search failed: {e}"]
+
+    # Step 2: Scrape the top N URLs concurrently (fresh pages come from the web cache)
+    return scrape_results(search_results, cache=cache)
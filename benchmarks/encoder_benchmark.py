@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+"""
+Offline check and benchmark for the feature encoder (mpcdc/equivalence.py).
+
+Generates synthetic change records from the labels of the equivalence CSV (with a share of
+missing and unmapped labels), checks that the batch encoder agrees with the per-record encoder
+for list and DataFrame input and for both table backends (parsed CSV and memory-mapped
+snapshot), and times:
+
+- record:    FeatureEncoder.encode once per record (the /mpcdc/classify_change path)
+- batch:     FeatureEncoder.encode_batch on a list of dicts (/mpcdc/classify_changes)
+- dataframe: FeatureEncoder.encode_batch on a DataFrame (pandas factorize codes per column)
+
+With --dates, the date fields are drawn from a pool of timestamps written in the forms clients
+send (browser datetime-local, dd/mm/YYYY) and normalized to MPCDC_DATE_FORMAT, or to Spark's
+timestamp form when it is not set (mpcdc/dates.py);
+the derived bucket features are timed per record and per batch.
+
+With --typos, labels of the matched columns are perturbed (case/accents/whitespace, or one
+character dropped) and looked up through the label matcher (mpcdc/label_index.py), reporting the
+share resolved correctly, wrongly or not at all, and the latency of cold lookups.
+
+Usage:
+    python benchmarks/encoder_benchmark.py --rows 100000 --unknown 0.05 --missing 0.05
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mpcdc import config  # noqa: E402
+from mpcdc.dates import DateNormalizer, add_date_buckets, date_buckets  # noqa: E402
+from mpcdc.equivalence import REJECT, FeatureEncoder, compile_snapshot  # noqa: E402
+from mpcdc.label_index import LabelIndex  # noqa: E402
+
+TARGET_ROWS_PER_SECOND = 100000
+DATE_FORMAT = config.MPCDC_DATE_FORMAT or "%Y-%m-%d %H:%M:%S"
+
+
+def synthetic_records(encoder, n_rows, unknown_rate, missing_rate, seed=7):
+    """Records drawing each field from the column's mapped labels, or missing/unmapped at the given rates."""
+    rng = random.Random(seed)
+    labels = {name: list(encoder.tables.get(name, {}).keys()) for name in encoder.features}
+    records = []
+    for _ in range(n_rows):
+        record = {}
+        for name in encoder.features:
+            draw = rng.random()
+            if draw < missing_rate:
+                record[name] = rng.choice([None, ""])
+            elif draw < missing_rate + unknown_rate or not labels[name]:
+                record[name] = f"UNMAPPED-{rng.randrange(1000)}"
+            else:
+                record[name] = rng.choice(labels[name])
+        # The form sends the status as a number
+        record["change_request_status"] = rng.randrange(1, 12)
+        records.append(record)
+    return records
+
+
+def with_dates(records, n_timestamps, seed=7):
+    """Copies of the records with dates drawn from `n_timestamps` timestamps in mixed client forms."""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    pool = [start + timedelta(minutes=15 * rng.randrange(35000)) for _ in range(n_timestamps)]
+    forms = ["%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%d/%m/%Y %H:%M:%S"]
+    dated = []
+    for record in records:
+        submit = rng.choice(pool)
+        scheduled = submit + timedelta(hours=rng.choice([2, 30, 100, 400]))
+        dates = (submit, scheduled, scheduled + timedelta(hours=rng.choice([1, 3, 6, 12])))
+        dated.append({**record, **{name: value.strftime(rng.choice(forms)) for name, value in zip(config.DATE_COLUMNS, dates)}})
+    return dated
+
+
+def date_tables(records):
+    """Equivalence tables for the date fields, with every canonical date of the records mapped."""
+    normalize = DateNormalizer(DATE_FORMAT)
+    tables = {name: {} for name in config.DATE_COLUMNS}
+    for record in records:
+        for name in config.DATE_COLUMNS:
+            table = tables[name]
+            table.setdefault(normalize(record[name]), float(len(table)))
+    return tables
+
+
+def perturbed(label, rng):
+    """(variant, tier expected to resolve it): a case/whitespace variant or a dropped character."""
+    if rng.random() < 0.5:
+        return f" {label.lower()}  ", "normalized"
+    position = rng.randrange(len(label))
+    return label[:position] + label[position + 1:], "approximate"
+
+
+def label_matching(encoder, n_labels, seed=7):
+    """Resolves perturbed labels through approximate LabelIndexes; prints outcomes and latency."""
+    rng = random.Random(seed)
+    indexes = {name: LabelIndex(encoder.tables.get(name, {}), approximate=True, min_confidence=config.MPCDC_MATCH_MIN_CONFIDENCE)
+               for name in config.MATCHED_COLUMNS}
+    for index in indexes.values():
+        len(index)  # built on first use: keep the build out of the lookup latencies
+    labels = [(name, label, index) for name in config.MATCHED_COLUMNS
+              for label, index in encoder.tables.get(name, {}).items() if len(label) >= 6]
+    outcomes = {}
+    latencies = []
+    for name, label, index in rng.sample(labels, min(n_labels, len(labels))):
+        variant, tier = perturbed(label, rng)
+        start = time.perf_counter()
+        match = indexes[name].match(variant)
+        latencies.append(time.perf_counter() - start)
+        outcome = "unresolved" if match is None else ("correct" if match[0] == index else "wrong")
+        outcomes[(tier, outcome)] = outcomes.get((tier, outcome), 0) + 1
+    latencies.sort()
+    for (tier, outcome), count in sorted(outcomes.items()):
+        print(f"labels: {tier:<12}{outcome:<12}{count:>8}")
+    print(f"labels: lookup latency p50 {latencies[len(latencies) // 2] * 1e6:.0f}us, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f}us, max {latencies[-1] * 1e6:.0f}us")
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def check(encoder, records, frame):
+    """Asserts that both batch inputs, both policies and the per-record path produce the same output."""
+    vectors = [encoder.encode(record) for record in records]
+    expected = np.array([vector for vector, _, _, _ in vectors])
+    missing_counts = {}
+    unknown_counts = {}
+    for _, missing, unknown, _ in vectors:
+        for name in missing:
+            missing_counts[name] = missing_counts.get(name, 0) + 1
+        for name in unknown:
+            unknown_counts[name] = unknown_counts.get(name, 0) + 1
+
+    for batch in (records, frame):
+        matrix, batch_missing, batch_unknown, rejected, _ = encoder.encode_batch(batch)
+        assert np.array_equal(matrix, expected), "batch encoding differs from per-record encoding"
+        assert (batch_missing, batch_unknown, rejected) == (missing_counts, unknown_counts, None)
+
+        matrix, _, _, rejected, _ = encoder.encode_batch(batch, missing_value=-1.0, unknown_value=REJECT, dtype=np.float32)
+        assert matrix.dtype == np.float32 and matrix.flags.c_contiguous
+        assert rejected is not None and int(rejected.sum()) == sum(unknown_counts.values())
+        assert np.isnan(matrix).sum() == rejected.sum()
+        assert (matrix == -1.0).sum() == sum(missing_counts.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=config.EQUIVALENCE_CSV_PATH, help="Equivalence CSV providing the labels.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--unknown", type=float, default=0.05, help="Share of fields with an unmapped label.")
+    parser.add_argument("--missing", type=float, default=0.05, help="Share of missing/empty fields.")
+    parser.add_argument("--single-rows", type=int, default=20000, help="Rows timed through the per-record path.")
+    parser.add_argument("--dates", type=int, default=0, metavar="N", help="Draw dates from N distinct timestamps (0: no dates).")
+    parser.add_argument("--typos", type=int, default=0, metavar="N", help="Resolve N perturbed labels through the label matcher.")
+    args = parser.parse_args()
+
+    csv_encoder = FeatureEncoder.from_csv(args.csv, config.MODEL_INPUT_FEATURES)
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_path = os.path.join(tmp, "map.eqsnap")
+        compile_snapshot(args.csv, snapshot_path)
+        snapshot_encoder = FeatureEncoder.from_snapshot(snapshot_path, config.MODEL_INPUT_FEATURES)
+
+        records = synthetic_records(csv_encoder, args.rows, args.unknown, args.missing)
+        frame = pd.DataFrame(records, columns=csv_encoder.features)
+        check_rows = min(args.rows, 5000)
+        for encoder in (csv_encoder, snapshot_encoder):
+            check(encoder, records[:check_rows], frame.iloc[:check_rows])
+        print(f"check: per-record, list and DataFrame encodings agree on {check_rows} rows (csv and snapshot tables)")
+
+        print(f"{'source':<10}{'path':<12}{'rows/s':>14}")
+        for source, encoder in (("csv", csv_encoder), ("snapshot", snapshot_encoder)):
+            single = records[:args.single_rows]
+            _, elapsed = timed(lambda: [encoder.encode(record) for record in single])
+            print(f"{source:<10}{'record':<12}{len(single) / elapsed:>14,.0f}")
+            for path, batch in (("batch", records), ("dataframe", frame)):
+                _, elapsed = timed(encoder.encode_batch, batch)
+                rate = len(batch) / elapsed
+                flag = "" if rate >= TARGET_ROWS_PER_SECOND else f"  (below {TARGET_ROWS_PER_SECOND:,} rows/s)"
+                print(f"{source:<10}{path:<12}{rate:>14,.0f}{flag}")
+
+    if args.dates:
+        dated = with_dates(records, args.dates)
+        tables = date_tables(dated)
+        normalize = DateNormalizer(DATE_FORMAT)  # cold cache
+        encoder = FeatureEncoder(csv_encoder.features, {**csv_encoder.tables, **tables})
+        verbatim, _, verbatim_unknown, _, _ = encoder.encode_batch(dated)
+        encoder.normalizers = dict.fromkeys(config.DATE_COLUMNS, normalize)
+        (matrix, _, unknown_counts, _, _), elapsed = timed(encoder.encode_batch, dated)
+        date_unknown = {name: unknown_counts.get(name, 0) for name in config.DATE_COLUMNS}
+        assert not any(date_unknown.values()), f"normalized dates not found: {date_unknown}"
+        info = normalize.cache_info()
+        print(f"dates: unmapped verbatim {[verbatim_unknown.get(name, 0) for name in config.DATE_COLUMNS]}, "
+              f"normalized {list(date_unknown.values())}; {info.hits / (info.hits + info.misses):.0%} normalization cache hits")
+        print(f"{'dates':<10}{'batch':<12}{len(dated) / elapsed:>14,.0f}")
+        single = dated[:args.single_rows]
+        expected = [date_buckets(record) for record in single]
+        assert [{name: record[name] for name in expected[0]} for record in add_date_buckets(single)] == expected
+        _, elapsed = timed(lambda: [date_buckets(record) for record in single])
+        print(f"{'buckets':<10}{'record':<12}{len(single) / elapsed:>14,.0f}")
+        _, elapsed = timed(add_date_buckets, dated)
+        print(f"{'buckets':<10}{'batch':<12}{len(dated) / elapsed:>14,.0f}")
+
+    if args.typos:
+        label_matching(csv_encoder, args.typos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+"""
+Offline check and benchmark for the typeahead label catalog (mpcdc/label_catalog.py).
+
+Builds the catalog from the equivalence CSV, optionally grown --scale times with synthetic
+variants of its labels (to see how the lookup holds up as the map grows), checks that paged
+prefix queries return the same labels as a full scan of the table, and times queries for the
+prefixes an operator types (the first 1 to 8 characters of a label, or of a later word of it),
+alone and including the JSON encoding and gzip compression of /mpcdc/labels.
+
+Usage:
+    python benchmarks/label_catalog_benchmark.py --queries 20000 --scale 10
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mpcdc import config  # noqa: E402
+from mpcdc.equivalence import read_csv_tables  # noqa: E402
+from mpcdc.label_catalog import DEFAULT_LIMIT, LabelCatalog  # noqa: E402
+from mpcdc.label_index import normalize_label  # noqa: E402
+
+TARGET_P99_US = 1000
+
+
+def scaled_tables(tables, scale):
+    """Each column's labels plus `scale - 1` numbered variants of each."""
+    return {name: {**table, **{f"{label} V{copy}": float(len(table) * copy + i)
+                               for copy in range(1, scale) for i, label in enumerate(table)}}
+            for name, table in tables.items()}
+
+
+def scan(table, prefix):
+    """Reference result: labels starting with the prefix, then labels with a later word starting with it."""
+    prefix = normalize_label(prefix)
+    keys = sorted((normalize_label(label), label) for label in table)
+    first = [label for key, label in keys if key.startswith(prefix)]
+    later = []
+    for key, label in keys:
+        suffixes = [key[match.start():] for match in re.finditer(r"(?<=\W)\w", key)]
+        suffixes = [suffix for suffix in suffixes if suffix.startswith(prefix)]
+        if suffixes and not key.startswith(prefix):
+            later.append((min(suffixes), label))
+    return first + [label for _, label in sorted(later)]
+
+
+def typed_prefixes(tables, n, seed=7):
+    rng = random.Random(seed)
+    columns = [name for name in tables if tables[name]]
+    labels = {name: list(tables[name]) for name in columns}
+    prefixes = []
+    for _ in range(n):
+        name = rng.choice(columns)
+        words = rng.choice(labels[name]).split()
+        text = " ".join(words[rng.randrange(len(words)):]) if rng.random() < 0.3 else " ".join(words)
+        prefixes.append((name, text[:rng.randint(1, 8)]))
+    return prefixes
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6, samples[-1] * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=config.EQUIVALENCE_CSV_PATH, help="Equivalence CSV providing the labels.")
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--scale", type=int, default=1, help="Grow every column to this many times its labels.")
+    parser.add_argument("--checks", type=int, default=300, help="Queries checked against a full scan.")
+    args = parser.parse_args()
+
+    csv_tables = read_csv_tables(args.csv)
+    tables = scaled_tables({name: csv_tables.get(name, {}) for name in config.MATCHED_COLUMNS}, max(1, args.scale))
+    start = time.perf_counter()
+    catalog = LabelCatalog(tables)
+    for name in tables:
+        catalog.search(name, "", 0, 1)  # columns are indexed on their first search
+    print(f"built catalog of {sum(map(len, tables.values()))} labels in {time.perf_counter() - start:.2f}s")
+
+    prefixes = typed_prefixes(tables, args.queries)
+    for name, prefix in prefixes[:args.checks]:
+        expected = scan(tables[name], prefix)
+        pages, offset, limit = [], 0, random.Random(prefix).randint(1, DEFAULT_LIMIT)
+        while True:
+            page, has_more = catalog.search(name, prefix, offset, limit)
+            pages += page
+            offset += len(page)
+            if not has_more:
+                break
+        assert pages == expected, f"{name} {prefix!r}: paged search differs from a full scan"
+    print(f"check: paged search agrees with a full scan on {min(args.checks, len(prefixes))} queries")
+
+    search, response = [], []
+    for name, prefix in prefixes:
+        started = time.perf_counter()
+        labels, has_more = catalog.search(name, prefix, 0, DEFAULT_LIMIT)
+        searched = time.perf_counter()
+        body = json.dumps({"column": name, "prefix": prefix, "labels": labels, "offset": 0,
+                           "next_offset": len(labels) if has_more else None}, ensure_ascii=False).encode("utf-8")
+        if len(body) >= 512:
+            gzip.compress(body, compresslevel=5)
+        finished = time.perf_counter()
+        search.append(searched - started)
+        response.append(finished - started)
+
+    for stage, samples in (("search", search), ("response", response)):
+        p50, p99, worst = percentiles(samples)
+        flag = "" if p99 < TARGET_P99_US else f"  (p99 above {TARGET_P99_US}us)"
+        print(f"{stage:<10}p50 {p50:>7.1f}us  p99 {p99:>7.1f}us  max {worst:>8.1f}us{flag}")
+
+
+if __name__ == "__main__":
+    main()
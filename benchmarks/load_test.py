@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+"""
+Load test for the serving modes of the app.
+
+Starts a stub regression endpoint (answers every dataframe_split request after a fixed latency,
+standing in for Databricks), then runs the app in each requested serving mode against it and
+drives POST /mpcdc/classify_change with a pool of concurrent clients for a fixed duration.
+The prediction cache is disabled so every request reaches the stub endpoint.
+
+Modes:
+- dev:   `python app.py` (Flask development server, the previous Docker CMD)
+- sync:  gunicorn -c gunicorn.conf.py with SERVER_MODE=sync (gthread workers)
+- async: gunicorn -c gunicorn.conf.py with SERVER_MODE=async (uvicorn workers, asgi.py)
+
+Usage:
+    python benchmarks/load_test.py --modes dev sync async --concurrency 64 --duration 20
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHANGE = {
+    "f01_chr_serviceid": "SERVEI-001", "serviceci": "CI-001", "ASORG": "ORG", "ASGRP": "GRP",
+    "categorization_tier_1": "INFRAESTRUCTURA", "change_request_status": 1,
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_stub_endpoint(port, latency):
+    """Threaded HTTP server answering every POST with one prediction per input row."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            time.sleep(latency)
+            rows = len(body["dataframe_split"]["data"])
+            payload = json.dumps({"predictions": [1.0] * rows}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 256 # Accept connection bursts like a real serving endpoint
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+def start_stub_endpoint(latency):
+    """Runs the stub endpoint in its own process (so it does not compete with the clients for the GIL)."""
+    port = free_port()
+    process = multiprocessing.Process(target=serve_stub_endpoint, args=(port, latency), daemon=True)
+    process.start()
+    return process, f"http://127.0.0.1:{port}/invocations"
+
+
+def start_app(mode, port, endpoint_url):
+    # Every request is the same change: without the prediction cache and single flight, each one is scored
+    env = dict(os.environ, MPCDC_REGRESSION_ENDPOINT=endpoint_url, PREDICTION_CACHE_SIZE="0", MPCDC_SINGLE_FLIGHT="false",
+               DATABRICKS_POOL_SIZE="64", PORT=str(port), PYTHONUNBUFFERED="1")
+    if mode == "dev":
+        # app.py always binds port 5000 (debug server with reloader), as the old Docker CMD did
+        command = [sys.executable, "app.py"]
+    else:
+        env["SERVER_MODE"] = mode
+        env["GUNICORN_BIND"] = f"127.0.0.1:{port}"
+        command = [sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py"]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+
+
+def wait_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    return False
+
+
+def run_load(url, concurrency, duration):
+    """Each client posts changes back to back until the deadline; returns (latencies, errors)."""
+    deadline = time.perf_counter() + duration
+    results = [None] * concurrency
+
+    def client(slot):
+        session = requests.Session()
+        latencies, errors = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = session.post(url, json=CHANGE, timeout=30)
+                if response.status_code != 200:
+                    errors += 1
+            except requests.exceptions.RequestException:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        results[slot] = (latencies, errors)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    latencies = sorted(latency for slot_latencies, _ in results for latency in slot_latencies)
+    return latencies, sum(errors for _, errors in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare classification throughput across serving modes.")
+    parser.add_argument("--modes", nargs="+", default=["dev", "sync", "async"], choices=["dev", "sync", "async"])
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent clients.")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of load per mode.")
+    parser.add_argument("--latency", type=float, default=0.1, help="Stub endpoint latency in seconds.")
+    args = parser.parse_args()
+
+    stub, endpoint_url = start_stub_endpoint(args.latency)
+    print(f"stub endpoint latency {args.latency * 1000:.0f} ms, {args.concurrency} clients, {args.duration:g} s per mode")
+
+    for mode in args.modes:
+        port = 5000 if mode == "dev" else free_port()
+        process = start_app(mode, port, endpoint_url)
+        try:
+            if not wait_ready(f"http://127.0.0.1:{port}/mpcdc/status"):
+                print(f"{mode:>5}: server did not start")
+                continue
+            latencies, errors = run_load(f"http://127.0.0.1:{port}/mpcdc/classify_change", args.concurrency, args.duration)
+        finally:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout=30)
+        if not latencies:
+            print(f"{mode:>5}: no requests completed")
+            continue
+        print(f"{mode:>5}: {len(latencies) / args.duration:8.1f} req/s   "
+              f"p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms   "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:7.1f} ms   errors {errors}")
+    stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
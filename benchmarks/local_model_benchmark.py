@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Benchmark of the in-process tree-ensemble scorer (mpcdc/local_model.py).
+
+Builds a synthetic random forest over the 15-element FEATURE_ORDER vector (tests/support.py),
+round-trips it through the .npz format and times single-vector and batch scoring. Needs no
+network or real model. The scorer's results are checked by tests/test_local_model.py.
+
+Usage:
+    python benchmarks/local_model_benchmark.py --trees 50 --depth 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mpcdc.local_model import TreeEnsembleModel  # noqa: E402
+from tests.support import synthetic_forest  # noqa: E402
+
+N_FEATURES = 15
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local tree-ensemble model.")
+    parser.add_argument("--trees", type=int, default=50)
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=100000, help="Batch size for the vectorized timing.")
+    args = parser.parse_args()
+
+    model = synthetic_forest(args.trees, args.depth, N_FEATURES)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "model.npz")
+        model.save(path)
+        loaded = TreeEnsembleModel.load(path)
+
+    rng = np.random.default_rng(11)
+    matrix = rng.integers(0, 60, size=(args.rows, N_FEATURES)).astype(np.float64)
+
+    print(f"{loaded.n_trees} trees, depth {args.depth}, version {loaded.version}")
+
+    vector = matrix[:1].tolist()
+    n = 2000
+    start = time.perf_counter()
+    for _ in range(n):
+        loaded.predict(vector)
+    single_us = (time.perf_counter() - start) / n * 1e6
+
+    start = time.perf_counter()
+    loaded.predict(matrix)
+    batch_s = time.perf_counter() - start
+
+    print(f"single vector: {single_us:.1f} us/prediction")
+    print(f"batch of {args.rows}: {batch_s:.3f} s ({args.rows / batch_s:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
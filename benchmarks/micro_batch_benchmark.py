@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Benchmark of the micro-batching of concurrent /mpcdc/classify_change requests (mpcdc/micro_batcher.py).
+
+Starts a stub regression endpoint (fixed latency per call, whatever its number of rows), then,
+for micro-batching off (MPCDC_MICRO_BATCH_SIZE=1) and on, drives POST /mpcdc/classify_change
+through the Flask app with each concurrency level and reports throughput, latency and the number
+of calls that reached the endpoint. The prediction cache and single flight are disabled so every
+request (the same change each time) is scored.
+
+Usage:
+    python benchmarks/micro_batch_benchmark.py --concurrency 1 8 32 64 --requests 400 --batch-size 16 --wait-ms 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from load_test import CHANGE, start_stub_endpoint  # noqa: E402
+
+
+def run_level(client, regression_client, concurrency, requests):
+    """Posts `requests` changes from `concurrency` threads; returns the level's figures."""
+    def post(i):
+        start = time.perf_counter()
+        response = client.post("/mpcdc/classify_change", json={**CHANGE, "infrastructure_change_id": f"C{i}"})
+        return response.status_code, time.perf_counter() - start
+
+    calls = regression_client.stats()["calls"]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(post, range(requests)))
+    elapsed = time.perf_counter() - started
+    latencies = sorted(latency for _, latency in results)
+    return {
+        "concurrency": concurrency,
+        "ok": sum(1 for status, _ in results if status == 200),
+        "throughput": requests / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "endpoint_calls": regression_client.stats()["calls"] - calls,
+    }
+
+
+def child(levels, requests):
+    """Runs every concurrency level in this process (configured through the environment)."""
+    import logging
+    logging.disable(logging.INFO)
+    import app as web
+    from mpcdc import classifier
+
+    client = web.app.test_client()
+    for concurrency in levels:
+        print(json.dumps(run_level(client, classifier.get_regression_client(), concurrency, requests)), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--requests", type=int, default=400, help="Requests per concurrency level.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub endpoint latency per call (s).")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--wait-ms", type=float, default=5)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.concurrency, args.requests)
+        return
+
+    stub, endpoint_url = start_stub_endpoint(args.latency)
+    time.sleep(0.5)
+    levels = [str(level) for level in args.concurrency]
+    try:
+        for label, batch_size in (("off", 1), ("on", args.batch_size)):
+            env = dict(os.environ, MPCDC_REGRESSION_ENDPOINT=endpoint_url, DATABRICKS_TOKEN="stub",
+                       PREDICTION_CACHE_SIZE="0", MPCDC_SINGLE_FLIGHT="false", PREDICTION_BACKEND_MODE="remote",
+                       MPCDC_MICRO_BATCH_SIZE=str(batch_size), MPCDC_MICRO_BATCH_WAIT_MS=str(args.wait_ms),
+                       DATABRICKS_POOL_SIZE=str(max(args.concurrency)), MPCDC_MAX_QUEUE=str(max(args.concurrency)))
+            output = subprocess.run([sys.executable, __file__, "--child", "--requests", str(args.requests),
+                                     "--concurrency", *levels], env=env, cwd=ROOT, capture_output=True, text=True)
+            if output.returncode:
+                sys.exit(output.stderr)
+            print(f"micro-batching {label}" + (f" (batch {args.batch_size}, wait {args.wait_ms:g}ms)" if batch_size > 1 else ""))
+            for line in output.stdout.splitlines():
+                level = json.loads(line)
+                print(f"  concurrency {level['concurrency']:>4}  {level['throughput']:8.1f} req/s  "
+                      f"p50 {level['p50_ms']:7.1f}ms  p99 {level['p99_ms']:7.1f}ms  "
+                      f"endpoint calls {level['endpoint_calls']:>5} for {level['ok']} ok")
+    finally:
+        stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
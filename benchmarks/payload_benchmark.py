@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+Microbenchmark of the regression endpoint request body (mpcdc/payload.py).
+
+Compares, per request, the previous path (a pandas DataFrame of the feature vectors, to_dict
+(orient='split'), deleting the index, json.dumps for a debug line even with debug logging off,
+then json.dumps with a NumPy default) with PayloadBuilder, using orjson when it is installed and
+the json module otherwise. Checks that all produce the same JSON document, then times them for
+single changes and for batch chunks.
+
+Usage:
+    python benchmarks/payload_benchmark.py --rows 1 16 100 --repeat 20000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mpcdc import config, payload  # noqa: E402
+from mpcdc.classifier import default_serializer_std  # noqa: E402
+from mpcdc.payload import PayloadBuilder  # noqa: E402
+
+
+def previous_body(feature_vectors):
+    """The request body as built before PayloadBuilder."""
+    regression_payload_df = pd.DataFrame({'features': list(feature_vectors)})
+    regression_payload = {'dataframe_split': regression_payload_df.to_dict(orient='split')}
+    if 'index' in regression_payload['dataframe_split']:
+        del regression_payload['dataframe_split']['index']
+    f"Prepared payload for regression endpoint: {json.dumps(regression_payload)}"  # the eager debug line
+    return json.dumps(regression_payload, default=default_serializer_std, allow_nan=False)
+
+
+def time_per_call(build, feature_vectors, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        build(feature_vectors)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 16, 100], help="Feature vectors per request.")
+    parser.add_argument("--repeat", type=int, default=20000, help="Bodies built per measurement (fewer for large rows).")
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    builder = PayloadBuilder()
+    orjson = payload.orjson
+    print(f"orjson: {'installed' if orjson else 'not installed'}; {len(config.FEATURE_ORDER)} features per vector")
+    for rows in args.rows:
+        feature_vectors = [[float(rng.randrange(500)) for _ in config.FEATURE_ORDER] for _ in range(rows)]
+        repeat = max(100, args.repeat // rows)
+
+        previous = json.loads(previous_body(feature_vectors))
+        timings = {"previous": time_per_call(previous_body, feature_vectors, repeat)}
+        for encoder, module in (("orjson", orjson), ("json", None)):
+            if encoder == "orjson" and orjson is None:
+                continue
+            payload.orjson = module
+            assert json.loads(builder.body(feature_vectors)) == previous, f"{encoder} body differs from the previous one"
+            timings[encoder] = time_per_call(builder.body, feature_vectors, repeat)
+        payload.orjson = orjson
+
+        line = "  ".join(f"{name} {us:8.1f}us" for name, us in timings.items())
+        best = min(us for name, us in timings.items() if name != "previous")
+        print(f"{rows:>4} rows  {line}  saved {timings['previous'] - best:8.1f}us/request "
+              f"({timings['previous'] / best:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Benchmark of the web search scraping of the ASTRA assistant (astra_search.py).
+
+Serves --results fake result pages from as many local hosts (one port each), each answering after
+--latency seconds, plus one host that hangs longer than the scrape deadline. Compares the previous
+scraper (pages fetched one after another with requests.get, each read whole and reduced to text,
+then a fixed 0.15s sleep) with astra_search.scrape_results (concurrent fetches, per-host spacing,
+overall deadline, streaming extraction that stops at the snippet budget). Checks that both give the
+same snippets for the pages that answer in time.
+
+Usage:
+    python benchmarks/scrape_benchmark.py --results 5 --latency 0.5 --page-kb 300
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from astra_search import SNIPPET_CHARS, HostGate, SnippetExtractor, scrape_results  # noqa: E402
+
+
+def make_page(kilobytes):
+    """An HTML page with a head script and style, then paragraphs of text until `kilobytes`."""
+    head = "<html><head><title>Result page</title><script>var x = '<p>not text</p>';</script>"
+    head += "<style>p { color: red }</style></head><body><noscript>Enable JS</noscript>"
+    paragraph = "<p>Change freeze &amp; rollback windows for the CAB review, see <a href='#'>details</a>.</p>\n"
+    return (head + paragraph * (kilobytes * 1024 // len(paragraph)) + "</body></html>").encode()
+
+
+def serve(page, delay):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(page)))
+                self.end_headers()
+                self.wfile.write(page)
+            except OSError:
+                pass  # the scraper stopped reading
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+def full_text(html):
+    """Visible text of a whole page (what get_text(separator=' ', strip=True) returned)."""
+    extractor = SnippetExtractor(max_chars=float("inf"))
+    extractor.feed(html)
+    extractor.close()
+    return " ".join(extractor.parts)
+
+
+def previous_scrape(search_results):
+    """The sequential scraper astra_gemini.py used before astra_search."""
+    contents = []
+    for result in search_results:
+        link = result.get("link")
+        try:
+            page = requests.get(link, timeout=4)
+            snippet = full_text(page.text)[:700]
+            contents.append(f"{result.get('title')} ({link}):\n{snippet}")
+            time.sleep(0.15)
+        except Exception as e:
+            contents.append(f"Could not fetch {link}: {str(e)}")
+    return contents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--results", type=int, default=5, help="Result pages that answer in time.")
+    parser.add_argument("--latency", type=float, default=0.5, help="Page latency (s).")
+    parser.add_argument("--page-kb", type=int, default=300, help="Page size (KiB).")
+    parser.add_argument("--deadline", type=float, default=2.0, help="Overall scrape deadline (s).")
+    args = parser.parse_args()
+
+    page = make_page(args.page_kb)
+    results = [{"title": f"Result {i}", "link": serve(page, args.latency)} for i in range(args.results)]
+    hanging = {"title": "Hanging", "link": serve(page, 3.5)}  # under the read timeout, over the deadline
+
+    # Warm up both paths (connection setup) on one page
+    previous_scrape(results[:1])
+    scrape_results(results[:1], args.deadline)
+
+    start = time.perf_counter()
+    previous = previous_scrape(results + [hanging])
+    previous_seconds = time.perf_counter() - start
+
+    # A new host gate: no spacing left over from the warm-up
+    start = time.perf_counter()
+    current = scrape_results(results + [hanging], args.deadline, gate=HostGate())
+    current_seconds = time.perf_counter() - start
+
+    assert current == previous[:len(results)], "the snippets of the pages that answered in time differ"
+    assert len(current[0].split("\n", 1)[1]) == SNIPPET_CHARS
+    print(f"{args.results} pages of {args.page_kb} KiB at {args.latency:g}s + 1 hanging page")
+    print(f"  previous (sequential, whole pages)  {previous_seconds:6.2f}s  {len(previous)} entries")
+    print(f"  concurrent, deadline {args.deadline:g}s        {current_seconds:6.2f}s  {len(current)} entries "
+          f"(hanging page left out)  {previous_seconds / current_seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Startup benchmark for the equivalence map loader.
+
+Generates a synthetic equivalence CSV with a configurable number of labels and measures, in a
+fresh interpreter per loader, the load time and the resident memory it leaves behind:
+
+- legacy:  pandas.read_csv + iterrows() into a (column, label) tuple-keyed dict
+- encoder: mpcdc.equivalence.FeatureEncoder.from_csv (csv reader, per-column tables)
+
+Usage:
+    python benchmarks/startup_benchmark.py --labels 300000
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COLUMNS = [
+    "f01_chr_serviceid", "serviceci", "ASORG", "ASGRP", "categorization_tier_1",
+    "categorization_tier_2", "categorization_tier_3", "product_cat_tier_1",
+    "product_cat_tier_2", "product_cat_tier_3",
+]
+
+# Runs inside the child interpreter; prints a JSON line with timing and memory
+CHILD_CODE = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+csv_path, loader = sys.argv[1], sys.argv[2]
+
+if loader == "legacy":
+    import pandas as pd
+else:
+    from mpcdc.equivalence import FeatureEncoder
+before_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+start = time.perf_counter()
+if loader == "legacy":
+    equiv_map = {{}}
+    for _, row in pd.read_csv(csv_path).iterrows():
+        equiv_map[(row['Column'], row['Label'])] = row['Index']
+    size = len(equiv_map)
+else:
+    encoder = FeatureEncoder.from_csv(csv_path, {columns!r})
+    size = len(encoder)
+elapsed = time.perf_counter() - start
+
+after_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"loader": loader, "mappings": size, "seconds": elapsed,
+                  "peak_rss_mb": after_kb / 1024, "load_rss_mb": (after_kb - before_kb) / 1024}}))
+"""
+
+
+def write_synthetic_csv(path, n_labels):
+    """Writes an equivalence CSV with n_labels rows spread across COLUMNS."""
+    per_column = max(1, n_labels // len(COLUMNS))
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Column", "Index", "Label"])
+        for column in COLUMNS:
+            for i in range(per_column):
+                writer.writerow([column, i, f"{column.upper()} LABEL {i:07d}"])
+
+
+def run_loader(csv_path, loader):
+    code = CHILD_CODE.format(root=ROOT, columns=COLUMNS)
+    out = subprocess.run([sys.executable, "-c", code, csv_path, loader],
+                         check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark equivalence map cold-start time and memory.")
+    parser.add_argument("--labels", type=int, default=300000, help="Number of synthetic labels to generate.")
+    parser.add_argument("--csv", help="Use an existing equivalence CSV instead of generating one.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = args.csv
+        if not csv_path:
+            csv_path = os.path.join(tmp, "equivalence.csv")
+            write_synthetic_csv(csv_path, args.labels)
+
+        results = [run_loader(csv_path, loader) for loader in ("legacy", "encoder")]
+
+    print(f"{'loader':<10}{'mappings':>10}{'seconds':>10}{'load RSS MB':>14}{'peak RSS MB':>14}")
+    for r in results:
+        print(f"{r['loader']:<10}{r['mappings']:>10}{r['seconds']:>10.3f}{r['load_rss_mb']:>14.1f}{r['peak_rss_mb']:>14.1f}")
+    legacy, encoder = results
+    print(f"\nSpeed-up: {legacy['seconds'] / encoder['seconds']:.1f}x, "
+          f"peak RSS saved: {legacy['peak_rss_mb'] - encoder['peak_rss_mb']:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,11 +9,16 @@ import os
 import json
 from datetime import datetime, timedelta
 
-# Add the current directory to the path so we can import from app.py
+from dotenv import load_dotenv
+
+# Add the current directory to the path so we can import the mpcdc package
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Import the classify_change function from app.py
-from app import classify_change
+# Read DATABRICKS_TOKEN etc. from .env (the package itself only reads the environment)
+load_dotenv()
+
+# Import the classify_change function from the mpcdc package (no data is loaded until the first call)
+from mpcdc import classify_change
 
 # Sample change data
 today = datetime.now()
@@ -22,9 +27,10 @@ end_date = today + timedelta(days=2)
 
 sample_change = {
     "infrastructure_change_id": "CHG123456",
-    "submit_date": today,  # We can pass datetime objects directly
-    "scheduled_start_date": start_date,
-    "scheduled_end_date": end_date,
+    # Labels are looked up as strings, so send dates the way the web form does
+    "submit_date": today.strftime("%Y-%m-%dT%H:%M:%S"),
+    "scheduled_start_date": start_date.strftime("%Y-%m-%dT%H:%M:%S"),
+    "scheduled_end_date": end_date.strftime("%Y-%m-%dT%H:%M:%S"),
     "f01_chr_serviceid": "SVC001",
     "serviceci": "CI001",
     "ASORG": "IT",
@@ -35,8 +41,7 @@ sample_change = {
     "product_cat_tier_1": "Hardware",
     "product_cat_tier_2": "Server",
     "product_cat_tier_3": "Configuration",
-    "change_request_status": 2,
-    "Num_Incidencies": "INC000009582237"
+    "change_request_status": 2
 }
 
 # Call the classify_change function
@@ -48,13 +53,11 @@ print(json.dumps(result, indent=2))
 
 # Example of how to use the result in your application
 if result.get("status") == "success":
-    prediction = result.get("prediction")
-    print(f"\nPrediction: {prediction}")
-    
+    predicted_label = result.get("predicted_label")
+    print(f"\nPredicted incident priority: {predicted_label}")
+
     # Example decision logic based on prediction
-    if isinstance(prediction, (int, float)) and prediction > 0.7:
-        print("High risk change detected! Additional approval required.")
-    elif isinstance(prediction, str) and "high" in prediction.lower():
+    if predicted_label == "P1":
         print("High risk change detected! Additional approval required.")
     else:
         print("Standard change. Proceed with normal approval process.")
@@ -0,0 +1,120 @@
+"""
+Gunicorn configuration for production serving (the Docker image runs `gunicorn -c gunicorn.conf.py`).
+
+SERVER_MODE selects the worker type:
+- sync  (default): threaded WSGI workers (gthread) running the Flask app (app:app).
+- async: uvicorn workers running the ASGI app (asgi:application), see asgi.py.
+
+The app is preloaded in the master and the classifier's lazily built state (equivalence map, local
+model, Databricks client, see mpcdc/lazy.py) is warmed up in `when_ready`, before the workers are
+forked, so that read-only state is built once and shared copy-on-write by the workers.
+Chat sessions and Idempotency-Key responses default to sqlite stores shared by the workers (see
+below), and every worker writes its metrics to MPCDC_METRICS_DIR so that a scrape answered by any
+of them reports the pod's totals (see mpcdc/metrics.py). Worker and thread counts default to values derived from the container's CPU limit (cgroup quota)
+and can be overridden with GUNICORN_WORKERS / GUNICORN_THREADS. Workers are recycled gracefully
+after GUNICORN_MAX_REQUESTS requests (with jitter, so they do not restart together).
+"""
+import logging
+import math
+import os
+import shutil
+import tempfile
+
+SERVER_MODE = os.getenv("SERVER_MODE", "sync")
+
+# Several workers serve the app, and a tab's requests land on any of them: chat sessions (and with
+# them the history the risk assessment reads) and Idempotency-Key responses are kept in sqlite
+# files that every worker of the pod shares, unless configured otherwise. This file is read before
+# the app is loaded, so these defaults are in place when app.py reads its settings.
+os.environ.setdefault("CHAT_SESSION_STORE", "sqlite")
+os.environ.setdefault("IDEMPOTENCY_STORE", "sqlite")
+
+# Directory of the workers' metrics files, emptied when gunicorn starts ("" keeps per-worker metrics)
+METRICS_DIR = os.getenv("MPCDC_METRICS_DIR", os.path.join(tempfile.gettempdir(), "mpcdc_metrics"))
+
+
+def cpu_limit():
+    """CPUs available to the container: the cgroup CPU quota if one is set, else the host CPU count."""
+    try:
+        # cgroup v2: "<quota> <period>" or "max <period>"
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        # cgroup v1
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return float(os.cpu_count() or 1)
+
+
+CPUS = cpu_limit()
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+# Requests mostly wait on Databricks and Gemini, so a worker per CPU (plus one) is enough and the
+# concurrency comes from threads (sync mode) or the event loop (async mode)
+workers = int(os.getenv("GUNICORN_WORKERS", str(max(2, math.ceil(CPUS) + 1))))
+
+if SERVER_MODE == "async":
+    wsgi_app = "asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "app:app"
+    worker_class = "gthread"
+    # Each thread holds one in-flight request for the whole remote round trip
+    threads = int(os.getenv("GUNICORN_THREADS", "32"))
+
+preload_app = True
+
+# Graceful recycling bounds slow memory growth (caches, fragmentation) in long-lived workers
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", str(max_requests // 10)))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+# Gemini replies (and streamed chat responses) can take a while
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Heartbeat files in memory rather than on the container's overlay filesystem
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("GUNICORN_LOG_LEVEL", "info")
+
+# Application loggers (app.logger and the module loggers) log at INFO, as under `python app.py`
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def when_ready(server):
+    from mpcdc import classifier
+    classifier.warm_up()
+    server.log.info(f"MPCDC serving in {SERVER_MODE} mode: {workers} workers"
+                    f"{f' x {threads} threads' if SERVER_MODE != 'async' else ''} (CPU limit {CPUS:g})")
+
+
+def on_starting(server):
+    # Figures of a previous run of the pod would be added to this one's
+    if METRICS_DIR:
+        shutil.rmtree(METRICS_DIR, ignore_errors=True)
+
+
+def post_fork(server, worker):
+    if METRICS_DIR:
+        from mpcdc.metrics import REGISTRY
+        REGISTRY.multiprocess(METRICS_DIR)
+
+
+def worker_exit(server, worker):
+    # Counts since the last periodic write are kept in the pod's totals
+    if METRICS_DIR:
+        from mpcdc.metrics import REGISTRY
+        REGISTRY.flush()
@@ -0,0 +1,24 @@
+"""
+MPCDC change classification as a Python library.
+
+    import mpcdc
+
+    result = mpcdc.classify_change({"f01_chr_serviceid": "...", "serviceci": "...", ...})
+    batch = mpcdc.classify_changes(records)
+
+Both functions return the same JSON-ready dicts as POST /mpcdc/classify_change and
+/mpcdc/classify_changes (see CHANGE_CLASSIFICATION.md). Importing the package is side-effect free:
+the classifier module, the equivalence map, the regression endpoint's connection pool, the
+prediction cache and the local model are only loaded on the first call. Settings are read from
+the environment (see mpcdc/config.py); call dotenv.load_dotenv() first to use a .env file.
+"""
+import importlib
+
+__all__ = ["classify_change", "classify_changes"]
+
+
+def __getattr__(name):
+    # Defer importing the classifier (NumPy, pandas, requests) until a function is first used
+    if name in __all__:
+        return getattr(importlib.import_module(".classifier", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,282 @@
+"""
+Offline bulk scoring of a change calendar export (CSV or Parquet).
+
+    python -m mpcdc.bulk_score changes.csv -o scored.csv --parallelism 8
+    python -m mpcdc.bulk_score changes.parquet -o scored.parquet --resume
+
+The input is streamed in chunks of --chunk-size rows, so memory stays bounded whatever the file
+size. Each chunk is classified like a /mpcdc/classify_changes batch (one vectorized encoder pass,
+duplicate rows and prediction cache hits scored once, requests of --batch-size rows to the
+backend selected by PREDICTION_BACKEND_MODE). Up to --parallelism chunks are scored concurrently
+and the results are written in input order as chunks complete.
+
+The output is a CSV file, or for Parquet a directory with one part file per chunk. Progress is
+checkpointed to <output>.checkpoint.json after every written chunk; --resume continues an
+interrupted run from the last checkpoint (the input file and chunk size must be unchanged).
+Parquet support needs pyarrow.
+"""
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from dotenv import load_dotenv
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet input/output is optional
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+ID_COLUMN = "infrastructure_change_id"
+OUTPUT_COLUMNS = ["row", ID_COLUMN, "status", "predicted_label", "raw_prediction", "backend", "cached", "message"]
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+
+
+def file_format(path, requested=None):
+    if requested:
+        return requested
+    return "parquet" if path.lower().rstrip("/").endswith(PARQUET_EXTENSIONS) else "csv"
+
+
+def read_chunks(path, input_format, chunk_size, columns):
+    """Yields the input as DataFrames of at most `chunk_size` rows, restricted to `columns`."""
+    if input_format == "parquet":
+        parquet_file = pq.ParquetFile(path)
+        present = [column for column in columns if column in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=present):
+            frame = batch.to_pandas().astype(object)
+            # Nulls become missing values rather than the label "nan"
+            yield frame.where(frame.notna(), None)
+    else:
+        # Every label is looked up as a string, and empty cells stay "" (missing)
+        yield from pd.read_csv(path, chunksize=chunk_size, dtype=str, keep_default_na=False,
+                               encoding="utf-8-sig", usecols=lambda column: column in columns)
+
+
+def result_row(row, result):
+    """Output record for one classification result (`row` is the 0-based input row number)."""
+    raw_prediction = result.get("raw_prediction")
+    backend = None
+    if result["status"] == "success" and not result.get("cached"):
+        # Batch results only name the backend when it is not the remote endpoint
+        backend = result.get("backend", "remote")
+    return {
+        "row": row,
+        ID_COLUMN: result.get(ID_COLUMN),
+        "status": result["status"],
+        "predicted_label": result.get("predicted_label"),
+        "raw_prediction": float(raw_prediction) if isinstance(raw_prediction, (int, float)) else None,
+        "backend": backend,
+        "cached": bool(result.get("cached")),
+        "message": result.get("message"),
+    }
+
+
+class CsvResultWriter:
+    """Appends result rows to one CSV file; on resume the file is cut back to the checkpointed size."""
+
+    def __init__(self, path, state):
+        self.path = path
+        if state.get("output_bytes") is not None:
+            self.file = open(path, "r+b")
+            self.file.truncate(state["output_bytes"])
+            self.file.seek(state["output_bytes"])
+        else:
+            self.file = open(path, "wb")
+            self._write_rows([], header=True)
+
+    def _write_rows(self, rows, header=False):
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=OUTPUT_COLUMNS, lineterminator="\n")
+        if header:
+            writer.writeheader()
+        writer.writerows(rows)
+        self.file.write(buffer.getvalue().encode("utf-8"))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def write(self, chunk_number, rows):
+        self._write_rows(rows)
+
+    def progress(self):
+        """Checkpoint fields describing what has been written so far."""
+        return {"output_bytes": self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetResultWriter:
+    """Writes one part file per chunk into the output directory; on resume later parts are removed."""
+
+    SCHEMA = pa.schema([
+        ("row", pa.int64()), (ID_COLUMN, pa.string()), ("status", pa.string()),
+        ("predicted_label", pa.string()), ("raw_prediction", pa.float64()), ("backend", pa.string()),
+        ("cached", pa.bool_()), ("message", pa.string()),
+    ]) if pa else None
+
+    def __init__(self, path, state):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        chunks_done = state.get("chunks_done", 0)
+        for name in os.listdir(path):
+            if name.startswith("part-") and (name.endswith(".tmp") or int(name[5:].split(".")[0]) >= chunks_done):
+                os.remove(os.path.join(path, name))
+
+    def write(self, chunk_number, rows):
+        table = pa.Table.from_pylist(rows, schema=self.SCHEMA)
+        part_path = os.path.join(self.path, f"part-{chunk_number:06d}.parquet")
+        pq.write_table(table, part_path + ".tmp")
+        os.replace(part_path + ".tmp", part_path)
+
+    def progress(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+def input_signature(path):
+    stat = os.stat(path)
+    return {"input": os.path.abspath(path), "input_size": stat.st_size, "input_mtime": stat.st_mtime}
+
+
+def checkpoint_path(output_path):
+    return output_path.rstrip("/") + ".checkpoint.json"
+
+
+def load_checkpoint(output_path, signature, chunk_size):
+    """Checkpoint state of an interrupted run of the same input. Raises ValueError if it does not match."""
+    path = checkpoint_path(output_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        state = json.load(f)
+    for key, value in {**signature, "chunk_size": chunk_size}.items():
+        if state.get(key) != value:
+            raise ValueError(f"Checkpoint {path} does not match this run ({key} changed); remove it or run without --resume.")
+    return state
+
+
+def save_checkpoint(output_path, state):
+    """Writes the checkpoint atomically (temp file + rename), so a crash never leaves it half written."""
+    path = checkpoint_path(output_path)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def score_file(input_path, output_path, input_format=None, output_format=None, chunk_size=5000,
+               batch_size=None, parallelism=4, resume=False):
+    """
+    Classifies every row of `input_path` and writes the results to `output_path` (see module
+    docstring). Returns the final checkpoint state, including the summary counts.
+    Raises RuntimeError if changes cannot be classified (e.g. the equivalence map did not load).
+    """
+    from . import classifier, config  # after load_dotenv() in main(): settings are read at import
+
+    input_format = file_format(input_path, input_format)
+    output_format = file_format(output_path, output_format)
+    if pq is None and "parquet" in (input_format, output_format):
+        raise RuntimeError("Parquet files need pyarrow (pip install pyarrow).")
+
+    unavailable = classifier.classification_unavailable()
+    if unavailable:
+        raise RuntimeError(unavailable[0]["message"])
+
+    signature = input_signature(input_path)
+    state = load_checkpoint(output_path, signature, chunk_size) if resume else {}
+    if state.get("complete"):
+        logger.info(f"{output_path} is already complete ({state['rows_done']} rows).")
+        return state
+    if state:
+        logger.info(f"Resuming after {state['rows_done']} rows ({state['chunks_done']} chunks).")
+    state = {**signature, "chunk_size": chunk_size, "chunks_done": 0, "rows_done": 0, "complete": False,
+             "succeeded": 0, "failed": 0, "endpoint_calls": 0, **state}
+
+    writer = (ParquetResultWriter if output_format == "parquet" else CsvResultWriter)(output_path, state)
+    state.update(writer.progress())
+    save_checkpoint(output_path, state)
+    columns = set(config.MODEL_INPUT_FEATURES) | {ID_COLUMN}
+    start = time.perf_counter()
+    rows_at_start = state["rows_done"]
+
+    def write_completed(chunk_number, offset, future):
+        batch = future.result()
+        rows = [result_row(offset + result["index"], result) for result in batch["results"]]
+        writer.write(chunk_number, rows)
+        summary = batch["summary"]
+        state.update(writer.progress(), chunks_done=chunk_number + 1, rows_done=offset + len(rows),
+                     succeeded=state["succeeded"] + summary["succeeded"], failed=state["failed"] + summary["failed"],
+                     endpoint_calls=state["endpoint_calls"] + summary["endpoint_calls"])
+        save_checkpoint(output_path, state)
+        elapsed = time.perf_counter() - start
+        logger.info(f"{state['rows_done']} rows scored ({(state['rows_done'] - rows_at_start) / elapsed:.0f} rows/s), "
+                    f"{state['failed']} failed, {state['endpoint_calls']} endpoint calls.")
+
+    try:
+        with ThreadPoolExecutor(max_workers=parallelism) as pool:
+            in_flight = deque()
+            offset = 0
+            for chunk_number, frame in enumerate(read_chunks(input_path, input_format, chunk_size, columns)):
+                if chunk_number < state["chunks_done"]:
+                    offset += len(frame)
+                    continue
+                if chunk_number == state["chunks_done"] and offset != state["rows_done"]:
+                    raise ValueError(f"Input rows do not line up with the checkpoint ({offset} != {state['rows_done']}).")
+                records = frame.to_dict("records")
+                in_flight.append((chunk_number, offset, pool.submit(
+                    classifier.classify_rows, classifier.batch_rows(records), batch_size)))
+                offset += len(records)
+                # Results are written in input order; at most `parallelism` chunks are held at once
+                if len(in_flight) >= parallelism:
+                    write_completed(*in_flight.popleft())
+            while in_flight:
+                write_completed(*in_flight.popleft())
+    finally:
+        writer.close()
+
+    state["complete"] = True
+    save_checkpoint(output_path, state)
+    return state
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Classify every change of a CSV/Parquet export.")
+    parser.add_argument("input", help="Input CSV or Parquet file (one change per row, MODEL_INPUT_FEATURES columns).")
+    parser.add_argument("-o", "--output", required=True, help="Output CSV file, or directory of Parquet parts.")
+    parser.add_argument("--input-format", choices=["csv", "parquet"], help="Default: from the input file extension.")
+    parser.add_argument("--output-format", choices=["csv", "parquet"], help="Default: from the output path extension.")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows read, encoded and checkpointed at a time.")
+    parser.add_argument("--batch-size", type=int, help="Rows per regression endpoint request (default MPCDC_BATCH_CHUNK_SIZE).")
+    parser.add_argument("--parallelism", type=int, default=4, help="Chunks scored concurrently.")
+    parser.add_argument("--resume", action="store_true", help="Continue from the output's checkpoint.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    try:
+        state = score_file(args.input, args.output, args.input_format, args.output_format, max(1, args.chunk_size),
+                           args.batch_size, max(1, args.parallelism), args.resume)
+    except (RuntimeError, ValueError, OSError) as e:
+        logger.error(str(e))
+        return 1
+    logger.info(f"Done: {state['rows_done']} rows, {state['succeeded']} succeeded, {state['failed']} failed, "
+                f"{state['endpoint_calls']} endpoint calls. Results in {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
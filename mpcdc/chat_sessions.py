@@ -0,0 +1,296 @@
+"""
+Per-conversation chat sessions for the Gemini chatbot.
+
+Each client conversation (keyed by a session ID) keeps its own history, so concurrent users no
+longer share one Gemini chat session. Histories are bounded: only the last `max_turns`
+user/model exchanges are re-sent to the model, and older exchanges are either dropped or folded
+into a running summary. Sessions live in a pluggable store:
+
+- MemorySessionStore: per-process LRU with idle eviction, a session count cap and a byte cap.
+- SqliteSessionStore: file-backed store shared by all workers on the same host/volume.
+
+A session is stored as {"summary": str or None, "turns": [{"role": "user"|"model", "text": str}],
+"unsummarized": [turns beyond the window not yet folded into the summary]}.
+
+No lock is held while Gemini answers: a request reads the history, streams the reply, then
+appends the exchange with the store's atomic update() (under the store lock, or in one sqlite
+write transaction shared by every worker), so concurrent requests of a conversation, even in
+different workers, never lose each other's turns. The summary is written the same way after the
+summarizer's call, and only if no other request folded those turns meanwhile.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Client-supplied session IDs must match this; anything else gets a fresh server-side ID
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{8,128}$")
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id):
+    return isinstance(session_id, str) and bool(SESSION_ID_PATTERN.match(session_id))
+
+
+def _session_size(session):
+    size = len(session.get("summary") or "")
+    return size + sum(len(turn["text"]) for turn in session["turns"] + session.get("unsummarized", []))
+
+
+class MemorySessionStore:
+    """In-process session store: LRU order, idle TTL, max session count and max total text size."""
+
+    name = "memory"
+
+    def __init__(self, max_sessions=1000, idle_ttl=1800.0, max_bytes=50 * 1024 * 1024):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()  # session_id -> (session, last access, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _evict(self, now):
+        # Oldest-accessed sessions are at the front: drop idle ones, then enforce the caps
+        while self._sessions:
+            session_id, (_, accessed, size) = next(iter(self._sessions.items()))
+            if (now - accessed > self.idle_ttl or len(self._sessions) > self.max_sessions
+                    or self._bytes > self.max_bytes):
+                del self._sessions[session_id]
+                self._bytes -= size
+                self.evictions += 1
+            else:
+                break
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (entry[0], now, entry[2])
+            self._sessions.move_to_end(session_id)
+            return entry[0]
+
+    def save(self, session_id, session):
+        with self._lock:
+            self._store(session_id, session, time.monotonic())
+
+    def _store(self, session_id, session, now):
+        size = _session_size(session)
+        previous = self._sessions.pop(session_id, None)
+        if previous is not None:
+            self._bytes -= previous[2]
+        self._sessions[session_id] = (session, now, size)
+        self._bytes += size
+        self._evict(now)
+
+    def update(self, session_id, change):
+        """
+        Atomically replaces the session with change(copy of the session, or None if there is
+        none) and returns the result; a None result leaves the store unchanged.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(session_id)
+            session = change(dict(entry[0]) if entry is not None else None)
+            if session is not None:
+                self._store(session_id, session, now)
+            return session
+
+    def delete(self, session_id):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                self._bytes -= entry[2]
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.name, "sessions": len(self._sessions), "bytes": self._bytes,
+                    "max_sessions": self.max_sessions, "max_bytes": self.max_bytes,
+                    "idle_ttl_s": self.idle_ttl, "evictions": self.evictions}
+
+
+class SqliteSessionStore:
+    """File-backed session store shared between worker processes (WAL mode, one connection per thread)."""
+
+    name = "sqlite"
+
+    def __init__(self, path, max_sessions=10000, idle_ttl=1800.0):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._writes = 0
+        self.evictions = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS chat_sessions ("
+                     " id TEXT PRIMARY KEY, data TEXT NOT NULL, accessed REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS chat_sessions_accessed ON chat_sessions (accessed)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection opened before a fork (e.g. gunicorn preload) must not be used by the child
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=2.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _read(self, conn, session_id, now):
+        row = conn.execute("SELECT data, accessed FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or now - row[1] > self.idle_ttl:
+            return None
+        return json.loads(row[0])
+
+    def get(self, session_id):
+        conn = self._connection()
+        now = time.time()
+        session = self._read(conn, session_id, now)
+        if session is None:
+            conn.execute("DELETE FROM chat_sessions WHERE id = ? AND accessed < ?", (session_id, now - self.idle_ttl))
+            return None
+        conn.execute("UPDATE chat_sessions SET accessed = ? WHERE id = ?", (now, session_id))
+        return session
+
+    def _write(self, conn, session_id, session, now):
+        conn.execute("INSERT OR REPLACE INTO chat_sessions (id, data, accessed) VALUES (?, ?, ?)",
+                     (session_id, json.dumps(session), now))
+
+    def _wrote(self, conn):
+        with self._stats_lock:
+            self._writes += 1
+            sweep = self._writes % 32 == 0
+        # Sweeping needs a COUNT(*), so only do it every few writes
+        if sweep:
+            self._evict(conn)
+
+    def save(self, session_id, session):
+        conn = self._connection()
+        self._write(conn, session_id, session, time.time())
+        self._wrote(conn)
+
+    def update(self, session_id, change):
+        """
+        Atomically replaces the session with change(session, or None if there is none) and returns
+        the result, in one write transaction (other workers' updates of the file wait for it); a None
+        result leaves the store unchanged.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            session = change(self._read(conn, session_id, now))
+            if session is not None:
+                self._write(conn, session_id, session, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if session is not None:
+            self._wrote(conn)
+        return session
+
+    def _evict(self, conn):
+        cursor = conn.execute("DELETE FROM chat_sessions WHERE accessed < ?", (time.time() - self.idle_ttl,))
+        self.evictions += cursor.rowcount
+        (count,) = conn.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()
+        excess = count - self.max_sessions
+        if excess > 0:
+            conn.execute("DELETE FROM chat_sessions WHERE id IN "
+                         "(SELECT id FROM chat_sessions ORDER BY accessed LIMIT ?)", (excess,))
+            self.evictions += excess
+
+    def delete(self, session_id):
+        self._connection().execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
+
+    def stats(self):
+        (count,) = self._connection().execute("SELECT COUNT(*) FROM chat_sessions").fetchone()
+        return {"backend": self.name, "sessions": count, "max_sessions": self.max_sessions,
+                "idle_ttl_s": self.idle_ttl, "evictions": self.evictions}
+
+
+class ChatSessionManager:
+    """
+    Builds bounded Gemini histories from a session store and records completed exchanges.
+    `summarizer(previous_summary, dropped_turns) -> str` is optional; without it, exchanges
+    beyond the window are simply dropped.
+    """
+
+    def __init__(self, store, max_turns=10, summarizer=None):
+        self.store = store
+        self.max_turns = max_turns
+        self.summarizer = summarizer
+
+    def history(self, session_id):
+        """Gemini `history` (list of content dicts) for the session; empty for a new session."""
+        session = self.store.get(session_id)
+        if not session:
+            return []
+        history = []
+        if session.get("summary"):
+            history.append({"role": "user", "parts": [f"Summary of our earlier conversation:\n{session['summary']}"]})
+            history.append({"role": "model", "parts": ["Understood."]})
+        history.extend({"role": turn["role"], "parts": [turn["text"]]} for turn in session["turns"])
+        return history
+
+    def record(self, session_id, user_text, model_text):
+        """
+        Appends one user/model exchange atomically and trims the session to the history window;
+        the exchanges beyond it are then folded into the summary (with a summarizer).
+        """
+        def append(session):
+            session = session or {"summary": None, "turns": []}
+            turns = session["turns"] + [{"role": "user", "text": user_text}, {"role": "model", "text": model_text}]
+            overflow = len(turns) - 2 * self.max_turns
+            if overflow > 0:
+                dropped, turns = turns[:overflow], turns[overflow:]
+                if self.summarizer is not None:
+                    session["unsummarized"] = session.get("unsummarized", []) + dropped
+            session["turns"] = turns
+            return session
+
+        session = self.store.update(session_id, append)
+        if self.summarizer is not None and session.get("unsummarized"):
+            self._summarize(session_id, session.get("summary"), session["unsummarized"])
+
+    def _summarize(self, session_id, summary, dropped):
+        # The summarizer calls Gemini, so it runs outside the store's update
+        try:
+            new_summary = self.summarizer(summary, dropped)
+        except Exception as e:
+            logger.warning(f"Could not summarize chat history for session {session_id}: {e}. Truncating instead.")
+            new_summary = summary
+
+        def fold(session):
+            # Another request of the conversation may have folded these turns meanwhile
+            if (session is None or session.get("summary") != summary
+                    or session.get("unsummarized", [])[:len(dropped)] != dropped):
+                return None
+            session["summary"] = new_summary
+            session["unsummarized"] = session["unsummarized"][len(dropped):]
+            return session
+
+        self.store.update(session_id, fold)
+
+    def reset(self, session_id):
+        self.store.delete(session_id)
+
+    def stats(self):
+        return {**self.store.stats(), "max_turns": self.max_turns, "summarize": self.summarizer is not None}
@@ -0,0 +1,209 @@
+"""
+Circuit breaker and concurrency limits for calls to a remote endpoint (the Databricks regression
+endpoint).
+
+CircuitBreaker watches the outcome and duration of the last `window` calls. Once at least
+`min_calls` have been seen, it opens when the share of failed calls reaches `failure_rate` or the
+share of calls slower than `slow_call_seconds` reaches `slow_call_rate`. While open, calls are
+rejected at once instead of waiting on a degraded upstream. After `open_seconds` it lets
+`half_open_probes` calls through: if they succeed (and are not slow) it closes again, otherwise it
+reopens for another `open_seconds`.
+
+ConcurrencyLimiter (threads) and AsyncConcurrencyLimiter (one event loop) bound the calls in
+flight. A call that finds every slot taken waits in a queue of at most `max_queue` callers for at
+most `queue_timeout` seconds; beyond that it is shed. Requests that are shed or hit an open
+breaker raise CallRejected, which the caller turns into a 503 with Retry-After, so waiting
+requests never pile up behind a slow upstream and tie up every worker thread (and with them the
+chat page).
+"""
+import asyncio
+import threading
+import time
+from collections import Counter, deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CallRejected(Exception):
+    """A call refused without reaching the upstream (open circuit or load shedding)."""
+
+    def __init__(self, message, reason, retry_after=1):
+        super().__init__(message)
+        self.message = message
+        self.reason = reason
+        self.retry_after = max(1, int(round(retry_after)))
+
+
+class CircuitBreaker:
+    """Failure-rate and slow-call-rate circuit breaker with half-open probing (thread-safe)."""
+
+    def __init__(self, failure_rate=0.5, slow_call_seconds=10.0, slow_call_rate=0.8, window=20, min_calls=10,
+                 open_seconds=30.0, half_open_probes=1):
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = max(1, min(min_calls, window))
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._lock = threading.Lock()
+        self._outcomes = deque(maxlen=window)  # (failed, slow) of the last calls while closed
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.transitions = Counter()
+        self.rejected = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+            self._probes = 0
+            self.transitions[HALF_OPEN] += 1
+        return self._state
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.transitions[OPEN] += 1
+
+    def before_call(self):
+        """Admits a call, or raises CallRejected while the circuit is open (or its probes are taken)."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return
+            self.rejected += 1
+            retry_after = self.open_seconds - (time.monotonic() - self._opened_at) if state == OPEN else 1
+        raise CallRejected("Regression endpoint is unavailable (circuit open). Please retry later.", "circuit_open", retry_after)
+
+    def record(self, ok, duration):
+        """Records the outcome of an admitted call."""
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if ok and not slow:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    self.transitions[CLOSED] += 1
+                else:
+                    self._open()
+                return
+            if self._state == OPEN:
+                return  # a call admitted before the circuit opened
+            self._outcomes.append((not ok, slow))
+            if len(self._outcomes) < self.min_calls:
+                return
+            failed = sum(1 for failure, _ in self._outcomes if failure)
+            slow_calls = sum(1 for _, is_slow in self._outcomes if is_slow)
+            if failed >= self.failure_rate * len(self._outcomes) or slow_calls >= self.slow_call_rate * len(self._outcomes):
+                self._open()
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state()
+            calls = len(self._outcomes)
+            return {
+                "state": state,
+                "window_calls": calls,
+                "window_failure_rate": round(sum(1 for failure, _ in self._outcomes if failure) / calls, 4) if calls else None,
+                "window_slow_rate": round(sum(1 for _, slow in self._outcomes if slow) / calls, 4) if calls else None,
+                "open_for_s": round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 1) if state == OPEN else None,
+                "transitions": dict(self.transitions),
+                "rejected": self.rejected,
+                "thresholds": {
+                    "failure_rate": self.failure_rate,
+                    "slow_call_seconds": self.slow_call_seconds,
+                    "slow_call_rate": self.slow_call_rate,
+                    "min_calls": self.min_calls,
+                    "open_seconds": self.open_seconds,
+                },
+            }
+
+
+class _LimiterStats:
+    def _init_stats(self, max_in_flight, max_queue, queue_timeout):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.shed = Counter()
+
+    def _reject(self, reason):
+        self.shed[reason] += 1
+        return CallRejected(f"Server is overloaded ({self.in_flight} regression calls in flight, {self.waiting} queued). "
+                            f"Please retry later.", reason, self.queue_timeout or 1)
+
+    def stats(self):
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "queue_timeout_s": self.queue_timeout,
+            "in_flight": self.in_flight,
+            "queued": self.waiting,
+            "shed": dict(self.shed),
+        }
+
+
+class ConcurrencyLimiter(_LimiterStats):
+    """At most `max_in_flight` concurrent calls across threads, with a bounded, timed queue."""
+
+    def __init__(self, max_in_flight, max_queue=0, queue_timeout=5.0):
+        self._init_stats(max_in_flight, max_queue, queue_timeout)
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Takes a slot, or raises CallRejected when the queue is full or the wait times out."""
+        with self._condition:
+            if self.in_flight >= self.max_in_flight:
+                if self.waiting >= self.max_queue:
+                    raise self._reject("queue_full")
+                self.waiting += 1
+                try:
+                    if not self._condition.wait_for(lambda: self.in_flight < self.max_in_flight, self.queue_timeout):
+                        raise self._reject("queue_timeout")
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+class AsyncConcurrencyLimiter(_LimiterStats):
+    """asyncio version of ConcurrencyLimiter; create and use it on one event loop."""
+
+    def __init__(self, max_in_flight, max_queue=0, queue_timeout=5.0):
+        self._init_stats(max_in_flight, max_queue, queue_timeout)
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def acquire(self):
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                raise self._reject("queue_full")
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject("queue_timeout")
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
@@ -0,0 +1,952 @@
+"""
+Change classification: raw change record -> feature vector -> incident priority.
+
+This is the logic behind /mpcdc/classify_change and /mpcdc/classify_changes, usable without the
+web app through `mpcdc.classify_change` and `mpcdc.classify_changes`. The equivalence map, the
+regression endpoint client, the prediction cache and the local model backend are built on first
+use (see mpcdc/lazy.py), so importing this module loads no data and opens no connections.
+"""
+import json
+import logging
+import time
+from collections import Counter
+
+import numpy as np
+import requests
+
+from . import config
+from .circuit_breaker import CallRejected, CircuitBreaker, ConcurrencyLimiter
+from .databricks_client import DatabricksClient
+from .dates import DateNormalizer, add_date_buckets, date_buckets
+from .equivalence import REJECT, load_encoder
+from .label_catalog import LabelCatalog
+from .label_index import LabelIndex
+from .lazy import lazy
+from .local_model import TreeEnsembleModel
+from .metrics import REGISTRY, STAGE_SECONDS
+from .micro_batcher import MicroBatcher
+from .payload import PayloadBuilder
+from .prediction_cache import MemoryCache, PredictionCache, SqliteCache, cache_namespace
+from .reloader import FileReloader
+from .single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+# --- Shared clients and data (built on first use) ---
+
+def load_equivalence_map(csv_path, snapshot_path=None):
+    """Loads the equivalence map (snapshot if fresh, else CSV) into a per-column FeatureEncoder."""
+    logger.info(f"Loading equivalence map from: {csv_path}")
+    try:
+        encoder = load_encoder(csv_path, config.MODEL_INPUT_FEATURES + config.DERIVED_FEATURES, snapshot_path)
+        logger.info(f"Successfully loaded {len(encoder)} mappings.")
+        return encoder
+    except FileNotFoundError:
+        logger.error(f"Equivalence CSV not found at: {csv_path}")
+        return None
+    except Exception as e:
+        logger.error(f"Error loading or processing equivalence CSV: {e}")
+        return None
+
+
+def build_feature_encoder():
+    """
+    Loads the configured equivalence map with its date normalizers, label matchers and label
+    catalog (None if it failed).
+    """
+    encoder = load_equivalence_map(config.EQUIVALENCE_CSV_PATH, config.EQUIVALENCE_SNAPSHOT_PATH)
+    if not encoder:
+        logger.warning("Equivalence map failed to load. Change classification will not work.")
+    else:
+        if config.MPCDC_DATE_FORMAT:
+            encoder.normalizers = dict.fromkeys(config.DATE_COLUMNS, DateNormalizer(config.MPCDC_DATE_FORMAT))
+        if config.MPCDC_LABEL_MATCHING != "exact":
+            approximate = config.MPCDC_LABEL_MATCHING == "approximate"
+            encoder.matchers = {
+                name: LabelIndex(encoder.tables.get(name, {}), approximate, config.MPCDC_MATCH_MIN_CONFIDENCE)
+                for name in config.MATCHED_COLUMNS
+            }
+        encoder.catalog = LabelCatalog({name: encoder.tables.get(name, {}) for name in config.MATCHED_COLUMNS})
+    return encoder
+
+
+def equivalence_map_swapped(old, new):
+    """Drops the predictions made with the replaced equivalence map as soon as the new one is in."""
+    prediction_cache = get_prediction_cache()
+    if prediction_cache:
+        prediction_cache.set_namespace(prediction_cache_namespace(new.version))
+
+
+@lazy
+def get_equivalence_reloader():
+    """Holds the current equivalence map and reloads it when the CSV changes (EQUIVALENCE_RELOAD_INTERVAL)."""
+    return FileReloader(build_feature_encoder, config.EQUIVALENCE_CSV_PATH, config.EQUIVALENCE_RELOAD_INTERVAL,
+                        version=lambda encoder: encoder.version, on_swap=equivalence_map_swapped)
+
+
+def get_feature_encoder():
+    """
+    The FeatureEncoder of the current equivalence map version, or None if it failed to load.
+    A request takes it once and uses that version throughout, even if a reload swaps in a new one meanwhile.
+    """
+    return get_equivalence_reloader().current()
+
+
+@lazy
+def get_regression_client():
+    """Shared keep-alive client for the regression endpoint (one connection pool per process)."""
+    return DatabricksClient(
+        config.DATABRICKS_TOKEN,
+        pool_size=config.DATABRICKS_POOL_SIZE,
+        connect_timeout=config.DATABRICKS_CONNECT_TIMEOUT,
+        read_timeout=config.DATABRICKS_READ_TIMEOUT,
+        max_retries=config.DATABRICKS_MAX_RETRIES,
+        backoff_base=config.DATABRICKS_BACKOFF_BASE,
+        backoff_max=config.DATABRICKS_BACKOFF_MAX
+    )
+
+
+@lazy
+def get_regression_breaker():
+    """Circuit breaker for the regression endpoint, shared by the sync and async calls (None if disabled)."""
+    if not config.MPCDC_BREAKER_ENABLED:
+        return None
+    return CircuitBreaker(
+        failure_rate=config.MPCDC_BREAKER_FAILURE_RATE,
+        slow_call_seconds=config.MPCDC_BREAKER_SLOW_CALL_SECONDS,
+        slow_call_rate=config.MPCDC_BREAKER_SLOW_CALL_RATE,
+        window=config.MPCDC_BREAKER_WINDOW,
+        min_calls=config.MPCDC_BREAKER_MIN_CALLS,
+        open_seconds=config.MPCDC_BREAKER_OPEN_SECONDS,
+        half_open_probes=config.MPCDC_BREAKER_HALF_OPEN_PROBES
+    )
+
+
+@lazy
+def get_regression_limiter():
+    """Bound on the regression endpoint calls in flight from this process's threads (None if unlimited)."""
+    if config.MPCDC_MAX_IN_FLIGHT <= 0:
+        return None
+    return ConcurrencyLimiter(config.MPCDC_MAX_IN_FLIGHT, config.MPCDC_MAX_QUEUE, config.MPCDC_QUEUE_TIMEOUT)
+
+
+@lazy
+def get_prediction_cache():
+    """The prediction cache built from the PREDICTION_CACHE_* settings (None if disabled)."""
+    if config.PREDICTION_CACHE_SIZE <= 0:
+        return None
+    shared = None
+    if config.PREDICTION_CACHE_BACKEND == "sqlite":
+        try:
+            shared = SqliteCache(config.PREDICTION_CACHE_PATH, ttl=config.PREDICTION_CACHE_TTL)
+        except Exception as e:
+            logger.error(f"Could not open shared prediction cache at {config.PREDICTION_CACHE_PATH}: {e}. Using in-memory cache only.")
+    return PredictionCache(MemoryCache(config.PREDICTION_CACHE_SIZE, config.PREDICTION_CACHE_TTL), shared)
+
+
+def warm_up():
+    """Builds the shared clients and data now instead of on the first request (e.g. before forking workers)."""
+    get_equivalence_reloader()
+    get_regression_client()
+    get_prediction_cache()
+    get_local_backend()
+    get_regression_breaker()
+    get_regression_limiter()
+    get_micro_batcher()
+
+
+# --- Feature vectors and regression payloads ---
+
+# Rows with a missing/empty field, an unmapped label or a label resolved by the label matcher
+# (per feature and match tier), reported in /mpcdc/status
+MISSING_LABEL_COUNTS = Counter()
+UNKNOWN_LABEL_COUNTS = Counter()
+MATCHED_LABEL_COUNTS = Counter()
+
+
+def encoding_status():
+    """Missing/unknown label policies and counters for /mpcdc/status."""
+    return {
+        "missing_index": config.MPCDC_MISSING_INDEX,
+        "unknown_index": config.MPCDC_UNKNOWN_INDEX,
+        "missing_values": dict(MISSING_LABEL_COUNTS),
+        "unknown_labels": dict(UNKNOWN_LABEL_COUNTS),
+        "label_matching": config.MPCDC_LABEL_MATCHING,
+        "matched_labels": dict(MATCHED_LABEL_COUNTS)
+    }
+
+
+def label_match_fields(label, match):
+    """Response entry for a label resolved by the label matcher: match is (matched label, confidence, tier)."""
+    matched, confidence, tier = match
+    return {"label": label, "matched": matched, "confidence": confidence, "match": tier}
+
+
+def rejection_message(features):
+    """Error message for a change refused because of missing/unknown labels in `features`."""
+    return f"Missing or unknown labels for {', '.join(features)} (not accepted by the server configuration)."
+
+
+@STAGE_SECONDS.timed("encode")
+def create_feature_vector(raw_data, label_matches=None, encoder=None):
+    """
+    Converts raw data labels (for all MODEL_INPUT_FEATURES) to their corresponding indices
+    using the feature encoder (default: the current equivalence map version) and assembles the
+    feature vector in the order defined by FEATURE_ORDER. Labels resolved by the label matcher
+    instead of an exact lookup are added to `label_matches` (feature name -> label_match_fields)
+    when a dict is given.
+    Raises ValueError if a missing or unknown label is rejected (see MPCDC_MISSING_INDEX).
+    """
+    encoder = encoder or get_feature_encoder()
+    if not encoder:
+        logger.error("Equivalence map is not loaded. Cannot create feature vector.")
+        return None
+
+    # All MODEL_INPUT_FEATURES are StringIndexed by the model, so every label is looked up as a
+    # string (e.g. change_request_status 11 -> "11"). Date fields are first rewritten in
+    # MPCDC_DATE_FORMAT, whatever form the client sent them in. Missing/empty values and
+    # labels that are not in the map get MPCDC_MISSING_INDEX / MPCDC_UNKNOWN_INDEX (default 0.0);
+    # how the model treats that index depends on the StringIndexer's handleInvalid setting used in training.
+    if config.DERIVED_FEATURES:
+        raw_data = {**raw_data, **date_buckets(raw_data)}
+    final_feature_vector, missing, unknown, matches = encoder.encode(raw_data, config.MPCDC_MISSING_INDEX, config.MPCDC_UNKNOWN_INDEX)
+
+    if matches:
+        MATCHED_LABEL_COUNTS.update(f"{name}:{match[2]}" for name, match in matches.items())
+        logger.info(f"Labels resolved by the label matcher (label, confidence, tier): {matches}")
+        if label_matches is not None:
+            label_matches.update({name: label_match_fields(raw_data.get(name), match) for name, match in matches.items()})
+
+    if missing or unknown:
+        MISSING_LABEL_COUNTS.update(missing)
+        UNKNOWN_LABEL_COUNTS.update(unknown)
+        # One line per change; the unmapped labels are crucial for debugging missing entries in the equivalence CSV.
+        logger.warning(f"Missing or empty values: {missing}. Labels not found in equivalence map: {({name: raw_data.get(name) for name in unknown})}.")
+    rejected = ([name for name in missing if config.MPCDC_MISSING_INDEX == REJECT] +
+                [name for name in unknown if config.MPCDC_UNKNOWN_INDEX == REJECT])
+    if rejected:
+        raise ValueError(rejection_message(rejected))
+
+    logger.info(f"Assembled feature vector for new model: {final_feature_vector}")
+    return final_feature_vector
+
+
+def prediction_cache_namespace(map_version):
+    """Cached predictions are only valid for one equivalence map version and the primary backend's model."""
+    return cache_namespace(map_version, primary_backend().cache_scope())
+
+
+def prediction_fields(final_prediction_value):
+    """Success fields of a classification result for a raw prediction value."""
+    return {
+        "status": "success",
+        "predicted_label": config.PREDICTION_TYPE_MAPPING.get(final_prediction_value, f"UNKNOWN_CODE_{final_prediction_value}"),
+        "raw_prediction": final_prediction_value
+    }
+
+
+def parse_prediction(pred_output):
+    """Extracts the raw prediction value from one entry of the endpoint's 'predictions' list."""
+    if isinstance(pred_output, (int, float)):
+        return float(pred_output)
+    elif isinstance(pred_output, dict) and 'prediction' in pred_output: # Handle nested prediction if needed
+        return pred_output['prediction']
+    logger.warning(f"Unexpected prediction format in regression response: {pred_output}")
+    return None
+
+
+def batch_rows(records):
+    """(record, error) tuples for a list of change records; rows that are not objects become errors."""
+    return [(row, None) if isinstance(row, dict) else (None, "Row is not a JSON object") for row in records]
+
+
+def parse_change_batch(body, mimetype):
+    """
+    Parses a batch request body into a list of (record, error) tuples, one per input row.
+    Accepts a JSON array of change objects or NDJSON (one change object per line); with NDJSON a
+    malformed line becomes a per-row error instead of failing the whole batch.
+    Raises ValueError if the body is neither.
+    """
+    if mimetype not in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if isinstance(data, list):
+            return batch_rows(data)
+        if data is not None or '\n' not in body.strip():
+            raise ValueError("Expected a JSON array of change objects or an NDJSON body.")
+
+    rows = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            rows.append((None, f"Invalid JSON: {e}"))
+            continue
+        rows.append((row, None) if isinstance(row, dict) else (None, "Row is not a JSON object"))
+    return rows
+
+
+def default_serializer_std(obj):
+    """json.dumps default for the NumPy values found in regression payloads."""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        # Convert NaN to None for standard JSON
+        return float(obj) if not np.isnan(obj) else None
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, np.bool_):
+        return bool(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+@STAGE_SECONDS.timed("serialize")
+def serialize_regression_payload(payload):
+    """Serializes a regression payload given as a dict, strict with NaN/Inf. Raises TypeError/ValueError."""
+    return json.dumps(payload, default=default_serializer_std, allow_nan=False)
+
+
+def upstream_failure(status_code):
+    """
+    Whether a failed call says the endpoint is unhealthy (what the circuit breaker counts): no
+    response (connection error, timeout; `status_code` None), a 5xx or a 429. Other 4xx answers
+    reject this request, not the endpoint.
+    """
+    return status_code is None or status_code >= 500 or status_code == 429
+
+
+def call_databricks_endpoint(endpoint_url, payload):
+    """
+    Helper function to call a Databricks endpoint through the pooled regression client.
+    Returns (parsed JSON response or None, upstream_failed): `upstream_failed` is True when the
+    call failed because of the endpoint (see upstream_failure), False on success and on errors of
+    the request itself (payload encoding, 4xx).
+    """
+    try:
+        # Bodies built by RemoteBackend are already serialized (see mpcdc/payload.py); a dict
+        # payload is serialized here, strict with NaN/Inf
+        payload_json = payload if isinstance(payload, bytes) else serialize_regression_payload(payload)
+    except (TypeError, ValueError) as e: # Catch JSON encoding errors
+        logger.error(f"Error encoding payload to JSON: {e}")
+        logger.error(f"Payload causing error (sample): {str(payload)[:500]}...") # Log sample of payload
+        return None, False
+    try:
+        # Timeouts and retries (connection errors, 429, 503) are applied by the client;
+        # raises for bad status codes (4xx or 5xx) once retries are exhausted
+        with STAGE_SECONDS.time("upstream"):
+            response = get_regression_client().post(endpoint_url, payload_json)
+        with STAGE_SECONDS.time("decode_response"):
+            return response.json(), False
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error calling endpoint {endpoint_url}: {e}")
+        if e.response is None:
+            return None, True
+        logger.error(f"Response status code: {e.response.status_code}")
+        logger.error(f"Response text: {e.response.text}")
+        return None, upstream_failure(e.response.status_code)
+    except ValueError as e: # A response body that is not JSON
+        logger.error(f"Error decoding response of endpoint {endpoint_url}: {e}")
+        return None, True
+
+
+# --- Prediction Backends ---
+
+class PredictionBackendError(Exception):
+    """
+    Raised by a prediction backend when it cannot score the feature vectors. `retry_after`
+    (seconds) is set when the endpoint was not called because it is unavailable or overloaded.
+    """
+
+    def __init__(self, message, status_code=502, raw_response=None, retry_after=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.raw_response = raw_response
+        self.retry_after = retry_after
+
+
+def rejected_call_error(rejection):
+    """PredictionBackendError (503) for a regression endpoint call refused by the breaker or the concurrency limit."""
+    logger.warning(f"Regression endpoint call rejected ({rejection.reason}): {rejection.message}")
+    return PredictionBackendError(rejection.message, 503, retry_after=rejection.retry_after)
+
+
+def call_regression_endpoint(endpoint_url, payload):
+    """
+    call_databricks_endpoint within the concurrency limit and through the circuit breaker.
+    Raises PredictionBackendError (503) when the call is shed or the circuit is open.
+    """
+    limiter = get_regression_limiter()
+    breaker = get_regression_breaker()
+    try:
+        if limiter:
+            with STAGE_SECONDS.time("queue_wait"):
+                limiter.acquire()
+    except CallRejected as e:
+        raise rejected_call_error(e)
+    try:
+        if breaker:
+            breaker.before_call()
+        start = time.perf_counter()
+        upstream_failed = True
+        try:
+            regression_result, upstream_failed = call_databricks_endpoint(endpoint_url, payload)
+        finally:
+            if breaker:
+                # Only failures of the endpoint count; a 4xx or an unencodable payload is this request's fault
+                breaker.record(not upstream_failed, time.perf_counter() - start)
+        return regression_result
+    except CallRejected as e:
+        raise rejected_call_error(e)
+    finally:
+        if limiter:
+            limiter.release()
+
+
+def endpoint_protection_status():
+    """Circuit breaker and concurrency limit figures for /mpcdc/status."""
+    breaker = get_regression_breaker()
+    limiter = get_regression_limiter()
+    return {
+        "circuit_breaker": breaker.stats() if breaker else None,
+        "concurrency": limiter.stats() if limiter else None
+    }
+
+
+class PredictionBackend:
+    """
+    Interface for prediction backends. predict() scores a list of feature vectors (in FEATURE_ORDER)
+    and returns one raw prediction value per vector (None where a value could not be parsed).
+    """
+    name = None
+
+    def cache_scope(self):
+        """Identifies the model behind this backend; part of the prediction cache namespace."""
+        raise NotImplementedError
+
+    def predict(self, feature_vectors):
+        raise NotImplementedError
+
+
+class RemoteBackend(PredictionBackend):
+    """Scores through the Databricks regression serving endpoint, one dataframe_split request per call."""
+    name = "remote"
+
+    def __init__(self, endpoint_url, payload_builder=None):
+        self.endpoint_url = endpoint_url
+        self.payload_builder = payload_builder or PayloadBuilder()
+
+    def cache_scope(self):
+        return self.endpoint_url
+
+    @STAGE_SECONDS.timed("build_payload")
+    def build_payload(self, feature_vectors):
+        """Serialized request body (bytes) for the feature vectors, in MPCDC_PAYLOAD_FORMAT."""
+        try:
+            body = self.payload_builder.body(feature_vectors)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Error preparing payload for regression model: {e}")
+            raise PredictionBackendError("Error preparing data for the model.", 500)
+        if logger.isEnabledFor(logging.DEBUG):  # decoding the body is only worth it when the line is kept
+            logger.debug(f"Prepared payload for regression endpoint: {body.decode('utf-8')}")
+        return body
+
+    def predict(self, feature_vectors):
+        regression_result = call_regression_endpoint(self.endpoint_url, self.build_payload(feature_vectors))
+        return self.parse_result(regression_result, feature_vectors)
+
+    @STAGE_SECONDS.timed("parse")
+    def parse_result(self, regression_result, feature_vectors):
+        """Raw predictions, one per feature vector, from the endpoint's JSON response (None if the call failed)."""
+        if not regression_result:
+            # Error already logged in call_databricks_endpoint
+            raise PredictionBackendError("Failed to get response from the regression model endpoint.", 502)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Received regression result: {json.dumps(regression_result)}")
+
+        predictions = regression_result.get('predictions') if isinstance(regression_result, dict) else None
+        if not isinstance(predictions, list) or len(predictions) != len(feature_vectors):
+            logger.warning(f"Regression response does not contain one prediction per row: {str(regression_result)[:500]}")
+            raise PredictionBackendError("Could not parse prediction from model response.", 500, raw_response=regression_result)
+        return [parse_prediction(pred_output) for pred_output in predictions]
+
+
+class LocalModelBackend(PredictionBackend):
+    """Scores in-process with an exported tree ensemble (see mpcdc/local_model.py)."""
+    name = "local"
+
+    def __init__(self, model):
+        self.model = model
+
+    def cache_scope(self):
+        return f"local:{self.model.version}"
+
+    @STAGE_SECONDS.timed("local_model")
+    def predict(self, feature_vectors):
+        try:
+            return self.model.predict(feature_vectors).tolist()
+        except ValueError as e:
+            logger.error(f"Local model could not score feature vectors: {e}")
+            raise PredictionBackendError("Local model could not score the change.", 500)
+
+
+def load_local_backend(model_path):
+    """Loads the local model backend, or returns None if no model is configured or it fails to load."""
+    if not model_path:
+        return None
+    try:
+        model = TreeEnsembleModel.load(model_path)
+    except Exception as e:
+        logger.error(f"Error loading local model from {model_path}: {e}")
+        return None
+    if model.n_features != len(config.FEATURE_ORDER):
+        logger.error(f"Local model expects {model.n_features} features but FEATURE_ORDER has {len(config.FEATURE_ORDER)}. Ignoring it.")
+        return None
+    logger.info(f"Loaded local model {model_path} ({model.n_trees} trees, version {model.version}).")
+    return LocalModelBackend(model)
+
+
+REMOTE_BACKEND = RemoteBackend(config.MPCDC_REGRESSION_ENDPOINT, PayloadBuilder(config.MPCDC_PAYLOAD_FORMAT))
+
+
+@lazy
+def get_local_backend():
+    """The local model backend (LOCAL_MODEL_PATH), or None if no model is configured or loaded."""
+    backend = load_local_backend(config.LOCAL_MODEL_PATH)
+    if config.PREDICTION_BACKEND_MODE != "remote" and not backend:
+        logger.warning(f"PREDICTION_BACKEND_MODE={config.PREDICTION_BACKEND_MODE} needs a local model, but none is loaded. Using the remote endpoint only.")
+    return backend
+
+
+# Counters for the fallback/shadow modes, reported in /mpcdc/status
+BACKEND_STATS = Counter()
+
+
+def primary_backend():
+    """The backend whose predictions are returned (and cached) in the current mode."""
+    if config.PREDICTION_BACKEND_MODE == "primary" and get_local_backend():
+        return get_local_backend()
+    return REMOTE_BACKEND
+
+
+def regression_batch_workers():
+    """Batches sent at once by the micro-batcher: enough to reach the concurrency limit's queue, so shedding still applies."""
+    if config.MPCDC_MAX_IN_FLIGHT > 0:
+        return config.MPCDC_MAX_IN_FLIGHT + config.MPCDC_MAX_QUEUE
+    return config.DATABRICKS_POOL_SIZE
+
+
+@lazy
+def get_micro_batcher():
+    """Coalesces concurrent single-change endpoint calls of this process's threads (None if disabled)."""
+    if config.MPCDC_MICRO_BATCH_SIZE <= 1:
+        return None
+    return MicroBatcher(REMOTE_BACKEND.predict, config.MPCDC_MICRO_BATCH_SIZE,
+                        config.MPCDC_MICRO_BATCH_WAIT_MS / 1000, regression_batch_workers())
+
+
+def predict_feature_vectors(feature_vectors):
+    """
+    Scores feature vectors according to PREDICTION_BACKEND_MODE; a single vector for the
+    endpoint goes through the micro-batcher. Returns (predictions, backend name).
+    Raises PredictionBackendError if no backend could score.
+    """
+    backend = primary_backend()
+    if backend is not REMOTE_BACKEND:
+        return backend.predict(feature_vectors), backend.name
+
+    micro_batcher = get_micro_batcher() if len(feature_vectors) == 1 else None
+    try:
+        if micro_batcher:
+            predictions = [micro_batcher.submit(feature_vectors[0])]
+        else:
+            predictions = backend.predict(feature_vectors)
+    except PredictionBackendError as e:
+        return fallback_predictions(feature_vectors, e)
+
+    if config.PREDICTION_BACKEND_MODE == "shadow" and get_local_backend():
+        run_shadow_model(feature_vectors, predictions)
+    return predictions, backend.name
+
+
+# Concurrent classifications of the same feature vector share one prediction (MPCDC_SINGLE_FLIGHT)
+PREDICTION_FLIGHTS = SingleFlight()
+
+
+def predict_feature_vector(feature_vector, map_version):
+    """
+    predict_feature_vectors for one change; with MPCDC_SINGLE_FLIGHT, concurrent calls for the
+    same vector and equivalence map version share one call of it.
+    """
+    if not config.MPCDC_SINGLE_FLIGHT:
+        return predict_feature_vectors([feature_vector])
+    result, _ = PREDICTION_FLIGHTS.do((map_version, tuple(feature_vector)), lambda: predict_feature_vectors([feature_vector]))
+    return result
+
+
+def fallback_predictions(feature_vectors, error):
+    """Local model predictions after a failed remote call in fallback mode; re-raises the error otherwise."""
+    local_backend = get_local_backend()
+    if config.PREDICTION_BACKEND_MODE == "fallback" and local_backend:
+        logger.warning(f"Remote prediction failed ({error.message}). Falling back to the local model for {len(feature_vectors)} rows.")
+        BACKEND_STATS["fallbacks"] += 1
+        BACKEND_STATS["fallback_rows"] += len(feature_vectors)
+        return local_backend.predict(feature_vectors), local_backend.name
+    raise error
+
+
+def run_shadow_model(feature_vectors, predictions):
+    """Scores the vectors with the local model and counts/logs disagreements with the remote predictions."""
+    try:
+        shadow_predictions = get_local_backend().predict(feature_vectors)
+    except PredictionBackendError:
+        BACKEND_STATS["shadow_errors"] += 1
+        return
+    BACKEND_STATS["shadow_rows"] += len(feature_vectors)
+    for feature_vector, remote_value, local_value in zip(feature_vectors, predictions, shadow_predictions):
+        if remote_value is not None and remote_value != local_value:
+            BACKEND_STATS["shadow_disagreements"] += 1
+            logger.info(f"Shadow model disagreement: remote={remote_value}, local={local_value}, features={list(feature_vector)}")
+
+
+def backend_status():
+    """Prediction backend mode and counters for /mpcdc/status."""
+    local_backend = get_local_backend()
+    return {
+        "mode": config.PREDICTION_BACKEND_MODE,
+        "primary": primary_backend().name,
+        "local_model": {"path": config.LOCAL_MODEL_PATH, "version": local_backend.model.version} if local_backend else None,
+        "micro_batching": get_micro_batcher().stats() if get_micro_batcher() else None,
+        "single_flight": PREDICTION_FLIGHTS.stats() if config.MPCDC_SINGLE_FLIGHT else None,
+        **BACKEND_STATS
+    }
+
+
+def client_metrics(client_name, client_stats):
+    """Prometheus samples (see metrics.Registry.collector) for a DatabricksClient's stats()."""
+    client = {"client": client_name}
+    return [
+        ("mpcdc_upstream_calls_total", "counter", "Calls to a Databricks serving endpoint.",
+         [(client, client_stats["calls"])]),
+        ("mpcdc_upstream_attempts_total", "counter", "HTTP attempts to a Databricks serving endpoint, retries included.",
+         [(client, client_stats["attempts"])]),
+        ("mpcdc_upstream_responses_total", "counter", "Responses of a Databricks serving endpoint by HTTP status code.",
+         [({**client, "code": code}, count) for code, count in client_stats["status_codes"].items()]),
+        ("mpcdc_upstream_retries_total", "counter", "Retried attempts by reason.",
+         [({**client, "reason": reason}, count) for reason, count in client_stats["retries"].items()]),
+        ("mpcdc_upstream_failures_total", "counter", "Failed calls by reason.",
+         [({**client, "reason": reason}, count) for reason, count in client_stats["failures"].items()]),
+    ]
+
+
+def flight_metrics(route, flights):
+    """Prometheus sample of the predictions run (leader) and shared by a SingleFlight or AsyncSingleFlight."""
+    return ("mpcdc_prediction_single_flight_total", "counter",
+            "Single-change predictions run (leader) or shared with an identical one in flight (shared).",
+            [({"route": route, "role": "leader"}, flights.leaders), ({"route": route, "role": "shared"}, flights.shared)])
+
+
+@REGISTRY.collector
+def classifier_metrics():
+    """Figures kept by the classifier, read at every /mpcdc/metrics scrape."""
+    collected = []
+    if get_regression_client.is_built():
+        collected += client_metrics("regression", get_regression_client().stats())
+    prediction_cache = get_prediction_cache() if get_prediction_cache.is_built() else None
+    if prediction_cache:
+        cache_stats = prediction_cache.stats()
+        collected += [
+            ("mpcdc_prediction_cache_lookups_total", "counter", "Prediction cache lookups by result.",
+             [({"result": "hit"}, cache_stats["hits"]), ({"result": "shared_hit"}, cache_stats["shared_hits"]),
+              ({"result": "miss"}, cache_stats["misses"])]),
+            ("mpcdc_prediction_cache_entries", "gauge", "Entries in the per-process prediction cache.",
+             [({}, cache_stats["entries"])]),
+        ]
+    collected += [
+        ("mpcdc_missing_values_total", "counter", "Changes with a missing or empty value, per column.",
+         [({"column": name}, count) for name, count in MISSING_LABEL_COUNTS.items()]),
+        ("mpcdc_unknown_labels_total", "counter", "Changes with a label not in the equivalence map, per column.",
+         [({"column": name}, count) for name, count in UNKNOWN_LABEL_COUNTS.items()]),
+        ("mpcdc_matched_labels_total", "counter", "Labels resolved by the label matcher, per column and match tier.",
+         [(dict(zip(("column", "match"), key.split(":", 1))), count) for key, count in MATCHED_LABEL_COUNTS.items()]),
+        ("mpcdc_backend_events_total", "counter", "Fallback and shadow prediction backend events.",
+         [({"event": event}, count) for event, count in BACKEND_STATS.items()]),
+    ]
+    breaker = get_regression_breaker() if get_regression_breaker.is_built() else None
+    if breaker:
+        breaker_stats = breaker.stats()
+        collected += [
+            ("mpcdc_circuit_breaker_state", "gauge", "Regression endpoint circuit breaker state (1 for the current one).",
+             [({"state": state}, int(breaker_stats["state"] == state)) for state in ("closed", "open", "half_open")]),
+            ("mpcdc_circuit_breaker_rejected_total", "counter", "Calls refused while the circuit was open.",
+             [({}, breaker_stats["rejected"])]),
+        ]
+    limiter = get_regression_limiter() if get_regression_limiter.is_built() else None
+    if limiter:
+        limiter_stats = limiter.stats()
+        collected += [
+            ("mpcdc_regression_in_flight", "gauge", "Regression endpoint calls in flight.", [({}, limiter_stats["in_flight"])]),
+            ("mpcdc_regression_shed_total", "counter", "Regression endpoint calls shed by reason.",
+             [({"reason": reason}, count) for reason, count in limiter_stats["shed"].items()]),
+        ]
+    micro_batcher = get_micro_batcher() if get_micro_batcher.is_built() else None
+    if micro_batcher:
+        collected += [
+            ("mpcdc_micro_batches_total", "counter", "Micro-batched regression endpoint calls.", [({}, micro_batcher.batches)]),
+            ("mpcdc_micro_batch_rows_total", "counter", "Single-change predictions sent in micro-batches.", [({}, micro_batcher.rows)]),
+        ]
+    collected.append(flight_metrics("sync", PREDICTION_FLIGHTS))
+    return collected
+
+
+# --- Classification ---
+
+def classification_unavailable():
+    """(error response, status code) when changes cannot be classified, else None."""
+    # Check if equivalence map is loaded
+    if not get_feature_encoder():
+        logger.error("Equivalence map not loaded, cannot classify change.")
+        return {
+            "status": "error",
+            "message": "Equivalence map is not loaded. Please check server logs."
+        }, 500
+
+    # Check if regression endpoint URL is configured
+    if not config.MPCDC_REGRESSION_ENDPOINT:
+        logger.error("MPCDC_REGRESSION_ENDPOINT is not configured.")
+        return {
+            "status": "error",
+            "message": "Regression endpoint URL is not configured on the server."
+        }, 500
+    return None
+
+
+def prediction_error_response(error):
+    """(error response, status code) for a PredictionBackendError."""
+    error_response = {"status": "error", "message": error.message}
+    if error.raw_response is not None:
+        error_response["raw_response"] = error.raw_response # Include raw response for debugging
+    if error.retry_after is not None:
+        error_response["retry_after"] = error.retry_after # Also sent as the Retry-After header
+    return error_response, error.status_code
+
+
+def retry_after_headers(response):
+    """Retry-After header for an error response refused because the regression endpoint is unavailable or overloaded."""
+    return {"Retry-After": str(response["retry_after"])} if "retry_after" in response else {}
+
+
+def classification_result(feature_vector, final_prediction_value, backend_name, map_version):
+    """
+    (response, status code) for a change scored with equivalence map `map_version`; predictions
+    of the primary backend are cached.
+    """
+    if final_prediction_value is None:
+        logger.warning("Could not extract final prediction from regression model response.")
+        return {
+            "status": "error",
+            "message": "Could not parse prediction from model response."
+        }, 500
+
+    response = prediction_fields(final_prediction_value)
+    logger.info(f"Prediction successful: Label={response['predicted_label']}, Raw={final_prediction_value}, Backend={backend_name}")
+    prediction_cache = get_prediction_cache()
+    if prediction_cache and backend_name == primary_backend().name and isinstance(final_prediction_value, (int, float)):
+        prediction_cache.set(feature_vector, prediction_cache_namespace(map_version), final_prediction_value)
+    if backend_name != REMOTE_BACKEND.name:
+        response["backend"] = backend_name
+    response["equivalence_version"] = map_version
+    return response, 200
+
+
+@STAGE_SECONDS.timed("cache_lookup")
+def cached_classification(feature_vector, map_version):
+    """Classification result served from the prediction cache, or None on a miss."""
+    prediction_cache = get_prediction_cache()
+    if not prediction_cache:
+        return None
+    cached_prediction = prediction_cache.get(feature_vector, prediction_cache_namespace(map_version))
+    if cached_prediction is None:
+        return None
+    logger.info(f"Prediction served from cache: Raw={cached_prediction}")
+    return {**prediction_fields(cached_prediction), "cached": True, "equivalence_version": map_version}
+
+
+def score_change(change_data):
+    """
+    Classifies one change record that passed the request checks.
+    Returns (response, status code, feature vector); the feature vector is None if it could not be built.
+    """
+    # One equivalence map version for the whole request, even if a reload swaps in a new one meanwhile
+    encoder = get_feature_encoder()
+
+    # --- Step 1: Create Feature Vector ---
+    label_matches = {}
+    try:
+        feature_vector = create_feature_vector(change_data, label_matches, encoder)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}, 400, None
+    if feature_vector is None:
+        # Error already logged in create_feature_vector
+        return {
+            "status": "error",
+            "message": "Failed to create feature vector. Check logs for details (e.g., missing map)."
+        }, 500, None
+
+    # --- Step 1b: Serve repeated changes from the prediction cache ---
+    response = cached_classification(feature_vector, encoder.version)
+    if response is not None:
+        if label_matches:
+            response["label_matches"] = label_matches
+        return response, 200, feature_vector
+
+    # --- Step 2: Score with the prediction backend (Databricks endpoint and/or local model) ---
+    try:
+        predictions, backend_name = predict_feature_vector(feature_vector, encoder.version)
+    except PredictionBackendError as e:
+        error_response, status_code = prediction_error_response(e)
+        return error_response, status_code, feature_vector
+
+    # --- Step 3: Return Prediction ---
+    response, status_code = classification_result(feature_vector, predictions[0], backend_name, encoder.version)
+    if label_matches and status_code == 200:
+        response["label_matches"] = label_matches
+    return response, status_code, feature_vector
+
+
+def classify_rows(rows, chunk_size=None):
+    """
+    Classifies a batch of (record, error) tuples (see parse_change_batch):
+    1. Converts all valid rows to feature vectors in one pass of the feature encoder.
+    2. Serves rows whose feature vector is in the prediction cache, then scores the remaining
+       rows in chunks of `chunk_size` rows (default MPCDC_BATCH_CHUNK_SIZE; one multi-row
+       dataframe_split request per chunk for the Databricks endpoint).
+    3. Returns the batch response: one result per input row, in input order, including per-row errors.
+    """
+    results = []
+    for position, (record, error) in enumerate(rows):
+        result = {"index": position}
+        if record is not None and record.get("infrastructure_change_id"):
+            result["infrastructure_change_id"] = record["infrastructure_change_id"]
+        if error:
+            result.update({"status": "error", "message": error})
+        results.append(result)
+
+    # --- Step 1: Encode all valid rows in one pass ---
+    valid_positions = [position for position, (record, error) in enumerate(rows) if not error]
+    encoder = get_feature_encoder()  # one equivalence map version for the whole batch
+    if valid_positions:
+        records = [rows[position][0] for position in valid_positions]
+        if config.DERIVED_FEATURES:
+            records = add_date_buckets(records)
+        with STAGE_SECONDS.time("encode_batch"):
+            feature_matrix, missing_counts, unknown_counts, rejected, matches = encoder.encode_batch(
+                records, config.MPCDC_MISSING_INDEX, config.MPCDC_UNKNOWN_INDEX)
+        MISSING_LABEL_COUNTS.update(missing_counts)
+        UNKNOWN_LABEL_COUNTS.update(unknown_counts)
+        if unknown_counts:
+            logger.warning(f"Labels not found in equivalence map (rows per column): {unknown_counts}")
+        if missing_counts:
+            logger.info(f"Missing or empty values (rows per column): {missing_counts}")
+        # Rows whose labels were resolved by the label matcher report it, with the confidence
+        for name, column_matches in matches.items():
+            for row, record in enumerate(records):
+                label = record.get(name)
+                match = column_matches.get(label) if isinstance(label, (str, int, float)) else None
+                if match is not None:
+                    results[valid_positions[row]].setdefault("label_matches", {})[name] = label_match_fields(label, match)
+                    MATCHED_LABEL_COUNTS[f"{name}:{match[2]}"] += 1
+
+    # --- Step 2: Serve repeated changes from the prediction cache ---
+    # Rows with identical feature vectors are sent once and share the prediction
+    prediction_cache = get_prediction_cache()
+    pending = {} # feature vector (tuple) -> result positions of rows that still need the endpoint
+    namespace = prediction_cache_namespace(encoder.version)
+    for row, position in enumerate(valid_positions):
+        if rejected is not None and rejected[row].any():
+            rejected_features = [encoder.features[column] for column in rejected[row].nonzero()[0]]
+            results[position].update({"status": "error", "message": rejection_message(rejected_features)})
+            continue
+        feature_vector = tuple(feature_matrix[row].tolist())
+        if feature_vector in pending:
+            pending[feature_vector].append(position)
+            continue
+        cached_prediction = prediction_cache.get(feature_vector, namespace) if prediction_cache else None
+        if cached_prediction is not None:
+            results[position].update({**prediction_fields(cached_prediction), "cached": True})
+        else:
+            pending[feature_vector] = [position]
+    pending = list(pending.items())
+
+    # --- Step 3: Score the remaining rows chunk by chunk ---
+    chunk_size = max(1, chunk_size or config.MPCDC_BATCH_CHUNK_SIZE)
+    n_chunks = 0
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        n_chunks += 1
+        try:
+            predictions, backend_name = predict_feature_vectors([list(feature_vector) for feature_vector, _ in chunk])
+        except PredictionBackendError as e:
+            for _, positions in chunk:
+                for position in positions:
+                    results[position].update({"status": "error", "message": e.message})
+            continue
+
+        # --- Step 4: Fan per-row predictions back to the input rows ---
+        cacheable = prediction_cache and backend_name == primary_backend().name
+        for (feature_vector, positions), final_prediction_value in zip(chunk, predictions):
+            for position in positions:
+                if final_prediction_value is None:
+                    results[position].update({"status": "error", "message": "Could not parse prediction from model response."})
+                else:
+                    results[position].update(prediction_fields(final_prediction_value))
+                    if backend_name != REMOTE_BACKEND.name:
+                        results[position]["backend"] = backend_name
+            if cacheable and isinstance(final_prediction_value, (int, float)):
+                prediction_cache.set(feature_vector, namespace, final_prediction_value)
+
+    succeeded = sum(1 for result in results if result["status"] == "success")
+    logger.info(f"Batch classification finished: {succeeded}/{len(results)} rows succeeded in {n_chunks} endpoint calls.")
+    return {
+        "status": "success" if succeeded == len(results) else ("partial" if succeeded else "error"),
+        "summary": {
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "endpoint_calls": n_chunks
+        },
+        "equivalence_version": encoder.version,
+        "results": results
+    }
+
+
+# --- Library API (see mpcdc/__init__.py) ---
+
+def classify_change(record):
+    """
+    Classifies one change record (dict of MODEL_INPUT_FEATURES -> label). Returns the
+    /mpcdc/classify_change response: {"status": "success", "predicted_label", "raw_prediction"}
+    (plus "cached" or "backend" when applicable), or {"status": "error", "message", ...}.
+    """
+    unavailable = classification_unavailable()
+    if unavailable:
+        return unavailable[0]
+    if not record or not isinstance(record, dict):
+        return {"status": "error", "message": "No change data provided"}
+    return score_change(record)[0]
+
+
+def classify_changes(records):
+    """
+    Classifies a list of change records in batches. Returns the /mpcdc/classify_changes response:
+    {"status": "success"|"partial"|"error", "summary", "results"} with one result per record, in order.
+    """
+    unavailable = classification_unavailable()
+    if unavailable:
+        return unavailable[0]
+    return classify_rows(batch_rows(list(records)))
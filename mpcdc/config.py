@@ -0,0 +1,147 @@
+"""
+Change classification settings, read from the environment when the module is first imported.
+
+The web app (app.py) loads .env before importing the package; library users that rely on a
+.env file call dotenv.load_dotenv() themselves.
+"""
+import os
+
+from .dates import DURATION_FEATURE, LEAD_TIME_FEATURE
+from .equivalence import default_snapshot_path, index_policy
+
+# Repository root: default location of the equivalence CSV, whatever the working directory
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Get Databricks token from environment variable (still needed for regression endpoint)
+DATABRICKS_TOKEN = os.getenv("DATABRICKS_TOKEN")
+# Databricks regression endpoint URL for change classification
+MPCDC_REGRESSION_ENDPOINT = os.getenv("MPCDC_REGRESSION_ENDPOINT", "https://adb-2869758279805397.17.azuredatabricks.net/serving-endpoints/New_MPCDC_Regression_Endpoint/invocations")
+
+# Request body format of the regression endpoint (see mpcdc/payload.py): "dataframe_split" (default)
+# or "inputs" (tensor input)
+MPCDC_PAYLOAD_FORMAT = os.getenv("MPCDC_PAYLOAD_FORMAT", "dataframe_split")
+
+# Pooled HTTP client settings for Databricks serving endpoint calls
+DATABRICKS_POOL_SIZE = int(os.getenv("DATABRICKS_POOL_SIZE", "10"))
+DATABRICKS_CONNECT_TIMEOUT = float(os.getenv("DATABRICKS_CONNECT_TIMEOUT", "3.05"))
+DATABRICKS_READ_TIMEOUT = float(os.getenv("DATABRICKS_READ_TIMEOUT", "30"))
+# Retries apply only to connection errors and HTTP 429/503, with jittered exponential backoff
+DATABRICKS_MAX_RETRIES = int(os.getenv("DATABRICKS_MAX_RETRIES", "2"))
+DATABRICKS_BACKOFF_BASE = float(os.getenv("DATABRICKS_BACKOFF_BASE", "0.2"))
+DATABRICKS_BACKOFF_MAX = float(os.getenv("DATABRICKS_BACKOFF_MAX", "2.0"))
+
+# Circuit breaker around the regression endpoint (see mpcdc/circuit_breaker.py): opens when, of the
+# last MPCDC_BREAKER_WINDOW calls (at least MPCDC_BREAKER_MIN_CALLS), MPCDC_BREAKER_FAILURE_RATE
+# failed or MPCDC_BREAKER_SLOW_CALL_RATE took MPCDC_BREAKER_SLOW_CALL_SECONDS or longer. While open,
+# classifications get a 503 (or the local model in fallback mode); after MPCDC_BREAKER_OPEN_SECONDS
+# MPCDC_BREAKER_HALF_OPEN_PROBES calls probe the endpoint again.
+MPCDC_BREAKER_ENABLED = os.getenv("MPCDC_BREAKER_ENABLED", "true").lower() in ("1", "true", "yes")
+MPCDC_BREAKER_FAILURE_RATE = float(os.getenv("MPCDC_BREAKER_FAILURE_RATE", "0.5"))
+MPCDC_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("MPCDC_BREAKER_SLOW_CALL_SECONDS", "10"))
+MPCDC_BREAKER_SLOW_CALL_RATE = float(os.getenv("MPCDC_BREAKER_SLOW_CALL_RATE", "0.8"))
+MPCDC_BREAKER_WINDOW = int(os.getenv("MPCDC_BREAKER_WINDOW", "20"))
+MPCDC_BREAKER_MIN_CALLS = int(os.getenv("MPCDC_BREAKER_MIN_CALLS", "10"))
+MPCDC_BREAKER_OPEN_SECONDS = float(os.getenv("MPCDC_BREAKER_OPEN_SECONDS", "30"))
+MPCDC_BREAKER_HALF_OPEN_PROBES = int(os.getenv("MPCDC_BREAKER_HALF_OPEN_PROBES", "1"))
+# Regression endpoint calls in flight per process (0: unlimited). Callers beyond the limit wait in a
+# queue of at most MPCDC_MAX_QUEUE for up to MPCDC_QUEUE_TIMEOUT seconds, and are shed with a 503 beyond that.
+MPCDC_MAX_IN_FLIGHT = int(os.getenv("MPCDC_MAX_IN_FLIGHT", str(DATABRICKS_POOL_SIZE)))
+MPCDC_MAX_QUEUE = int(os.getenv("MPCDC_MAX_QUEUE", str(DATABRICKS_POOL_SIZE)))
+MPCDC_QUEUE_TIMEOUT = float(os.getenv("MPCDC_QUEUE_TIMEOUT", "5"))
+# Concurrent single-change classifications are sent to the regression endpoint together, as one
+# multi-row request of at most MPCDC_MICRO_BATCH_SIZE rows collected for at most
+# MPCDC_MICRO_BATCH_WAIT_MS milliseconds while other requests are in flight (see
+# mpcdc/micro_batcher.py). A size of 1 (the default) disables it.
+MPCDC_MICRO_BATCH_SIZE = int(os.getenv("MPCDC_MICRO_BATCH_SIZE", "1"))
+MPCDC_MICRO_BATCH_WAIT_MS = float(os.getenv("MPCDC_MICRO_BATCH_WAIT_MS", "5"))
+# Concurrent classifications of the same feature vector (double submits, client retries) share one
+# prediction instead of each calling the backend (see mpcdc/single_flight.py)
+MPCDC_SINGLE_FLIGHT = os.getenv("MPCDC_SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+# Prediction backend mode:
+#   remote   - Databricks regression endpoint only (default)
+#   primary  - in-process local model only (LOCAL_MODEL_PATH)
+#   fallback - Databricks endpoint, local model when the endpoint call fails
+#   shadow   - Databricks endpoint; the local model also scores and disagreements are logged
+PREDICTION_BACKEND_MODE = os.getenv("PREDICTION_BACKEND_MODE", "remote")
+# Exported tree-ensemble model (.npz, see mpcdc/local_model.py) used by the primary/fallback/shadow modes
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", "")
+
+# Prediction cache in front of the regression endpoint (PREDICTION_CACHE_SIZE=0 disables it).
+# PREDICTION_CACHE_BACKEND=sqlite adds a file-backed tier at PREDICTION_CACHE_PATH shared by all workers.
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "4096"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "3600"))
+PREDICTION_CACHE_BACKEND = os.getenv("PREDICTION_CACHE_BACKEND", "memory")
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH", "/tmp/mpcdc_prediction_cache.sqlite")
+
+# Maximum number of rows sent to the regression endpoint in one dataframe_split request
+# by the batch endpoint (/mpcdc/classify_changes)
+MPCDC_BATCH_CHUNK_SIZE = int(os.getenv("MPCDC_BATCH_CHUNK_SIZE", "100"))
+# Maximum number of change records accepted by one /mpcdc/classify_changes call
+MPCDC_BATCH_MAX_ROWS = int(os.getenv("MPCDC_BATCH_MAX_ROWS", "5000"))
+
+# Path to the equivalence CSV
+EQUIVALENCE_CSV_PATH = os.getenv("EQUIVALENCE_CSV_PATH", os.path.join(PROJECT_ROOT, "AI_Failure_Prediction_and_Prevention_for_CTTI.csv"))
+# Path to the precompiled equivalence snapshot (built with `python -m mpcdc.equivalence`).
+# Used instead of the CSV when present and compiled from the current CSV.
+EQUIVALENCE_SNAPSHOT_PATH = os.getenv("EQUIVALENCE_SNAPSHOT_PATH", default_snapshot_path(EQUIVALENCE_CSV_PATH))
+# Seconds between checks of the equivalence CSV for a new version, loaded without a restart
+# (see mpcdc/reloader.py). 0 disables hot reload.
+EQUIVALENCE_RELOAD_INTERVAL = float(os.getenv("EQUIVALENCE_RELOAD_INTERVAL", "30"))
+# Index given to a missing/empty field and to a label that is not in the equivalence map.
+# "reject" refuses such changes instead (HTTP 400, or a per-row error in batches).
+MPCDC_MISSING_INDEX = index_policy(os.getenv("MPCDC_MISSING_INDEX", "0.0"))
+MPCDC_UNKNOWN_INDEX = index_policy(os.getenv("MPCDC_UNKNOWN_INDEX", "0.0"))
+
+# Label matching behind the exact equivalence lookup, for the MATCHED_COLUMNS (see mpcdc/label_index.py):
+#   exact       - exact labels only
+#   normalized  - also labels differing only in case, accents or whitespace (default)
+#   approximate - also near misses with a trigram similarity of at least MPCDC_MATCH_MIN_CONFIDENCE
+MPCDC_LABEL_MATCHING = os.getenv("MPCDC_LABEL_MATCHING", "normalized")
+MPCDC_MATCH_MIN_CONFIDENCE = float(os.getenv("MPCDC_MATCH_MIN_CONFIDENCE", "0.8"))
+MATCHED_COLUMNS = [
+    "f01_chr_serviceid", "serviceci", "ASORG", "ASGRP", "categorization_tier_1", "categorization_tier_2",
+    "categorization_tier_3", "product_cat_tier_1", "product_cat_tier_2", "product_cat_tier_3", "f01_chr_tipoafectacion"
+]
+
+# Date fields are parsed and rewritten in MPCDC_DATE_FORMAT (strftime) before the lookup, so the
+# browser's, scripts' and exports' date forms all match the training representation. Off (dates
+# looked up verbatim) by default: the current equivalence CSV has no date labels, so there is no
+# training format to match yet. Set it to the form the CSV writes dates in once it has them
+# (Spark's timestamp string form is "%Y-%m-%d %H:%M:%S").
+MPCDC_DATE_FORMAT = os.getenv("MPCDC_DATE_FORMAT", "")
+DATE_COLUMNS = ["submit_date", "scheduled_start_date", "scheduled_end_date"]
+# Appends the change_duration_bucket and lead_time_bucket features (see mpcdc/dates.py) to the
+# feature vector, for models trained with them
+MPCDC_DATE_BUCKETS = os.getenv("MPCDC_DATE_BUCKETS", "false").lower() in ("1", "true", "yes")
+
+# Define the feature columns that the new model expects as input (before indexing)
+# These are the raw names from your form/data.
+MODEL_INPUT_FEATURES = [
+    "submit_date", "scheduled_start_date", "scheduled_end_date", "f01_chr_serviceid",
+    "serviceci", "ASORG", "ASGRP", "categorization_tier_1", "categorization_tier_2",
+    "categorization_tier_3", "product_cat_tier_1", "product_cat_tier_2", "product_cat_tier_3",
+    "change_request_status", "f01_chr_tipoafectacion"
+]
+
+# Features derived from the inputs, indexed through the equivalence CSV like them
+DERIVED_FEATURES = [DURATION_FEATURE, LEAD_TIME_FEATURE] if MPCDC_DATE_BUCKETS else []
+
+# Define the order of features expected by the Databricks model endpoint.
+# These are the *indexed* versions of the MODEL_INPUT_FEATURES (then the DERIVED_FEATURES).
+FEATURE_ORDER = [col + "_index" for col in MODEL_INPUT_FEATURES + DERIVED_FEATURES]
+
+# CATEGORICAL_COLUMNS are the raw feature names used to look up values in `raw_data`
+# and then in the feature encoder. For the new model, all input features are treated as categorical first.
+CATEGORICAL_COLUMNS = MODEL_INPUT_FEATURES
+
+# NUMERICAL_COLUMNS is now empty as the new model string-indexes all its input features.
+NUMERICAL_COLUMNS = []
+
+# Mapping for the final prediction output (Priority)
+# Model predicts P1 (High Priority) and P3 (Medium Priority).
+# P3 maps to 0.0, P1 maps to 1.0.
+PREDICTION_TYPE_MAPPING = {
+    0.0: "P3",  # Medium Priority
+    1.0: "P1"   # High Priority
+}
@@ -0,0 +1,260 @@
+"""
+Pooled HTTP client for Databricks model serving endpoints.
+
+One keep-alive requests.Session per process, so classifications reuse TCP+TLS connections to the
+Databricks host instead of paying a handshake per call. Every request has connect and read
+timeouts, and only failures that are safe to repeat are retried (connection errors, HTTP 429 and
+503) with jittered exponential backoff. Request, retry and latency statistics are kept in memory
+and exposed through `stats()`.
+
+AsyncDatabricksClient is the asyncio counterpart used by the ASGI app (asgi.py): one httpx
+AsyncClient pool per process, multiplexing many in-flight calls on the event loop, with the same
+timeout, retry and statistics rules.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import Counter, deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError: # Only needed by AsyncDatabricksClient (ASGI app)
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes that mean "try again later" and are retried
+RETRY_STATUS_CODES = frozenset({429, 503})
+
+# Number of recent call latencies kept for the percentile figures in stats()
+LATENCY_WINDOW = 2048
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    position = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[position]
+
+
+class _BaseClient:
+    """Settings, backoff and statistics shared by the sync and async clients."""
+
+    def __init__(self, token, pool_size=10, connect_timeout=3.05, read_timeout=30.0,
+                 max_retries=2, backoff_base=0.2, backoff_max=2.0):
+        self.token = token
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._attempts = 0
+        self._retries = Counter()
+        self._failures = Counter()
+        self._status_codes = Counter()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def headers(self):
+        return {'Authorization': f'Bearer {self.token}', 'Content-Type': 'application/json'}
+
+    def _backoff(self, attempt, retry_after=None):
+        """Full-jitter exponential backoff, honouring a numeric Retry-After within backoff_max."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if retry_after:
+            try:
+                delay = max(delay, min(self.backoff_max, float(retry_after)))
+            except ValueError:
+                pass
+        return delay
+
+    def _record_attempt(self):
+        with self._lock:
+            self._attempts += 1
+
+    def _record_status(self, status_code):
+        with self._lock:
+            self._status_codes[status_code] += 1
+
+    def _record_call(self, start):
+        with self._lock:
+            self._calls += 1
+            self._latencies.append(time.perf_counter() - start)
+
+    def _record_retry(self, reason):
+        with self._lock:
+            self._retries[reason] += 1
+
+    def _record_failure(self, reason):
+        with self._lock:
+            self._failures[reason] += 1
+
+    def pool_stats(self):
+        raise NotImplementedError
+
+    def stats(self):
+        """Snapshot of call, retry, failure and latency statistics (latencies in milliseconds)."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                "calls": self._calls,
+                "attempts": self._attempts,
+                "retries": dict(self._retries),
+                "failures": dict(self._failures),
+                "status_codes": {str(code): count for code, count in self._status_codes.items()},
+            }
+        stats["latency_ms"] = {
+            "samples": len(latencies),
+            "p50": None if not latencies else round(_percentile(latencies, 0.50) * 1000, 2),
+            "p99": None if not latencies else round(_percentile(latencies, 0.99) * 1000, 2),
+            "max": None if not latencies else round(latencies[-1] * 1000, 2),
+        }
+        stats["pool"] = {
+            "pool_size": self.pool_size,
+            "connect_timeout_s": self.timeout[0],
+            "read_timeout_s": self.timeout[1],
+            "max_retries": self.max_retries,
+            "hosts": self.pool_stats(),
+        }
+        return stats
+
+
+class DatabricksClient(_BaseClient):
+    """Keep-alive, bounded-retry HTTP client for Databricks serving endpoints."""
+
+    def __init__(self, token, **settings):
+        super().__init__(token, **settings)
+        self.session = requests.Session()
+        # Retries are handled here (not by urllib3) so only the idempotent classes are repeated
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._adapter = adapter
+
+    def post(self, url, data):
+        """
+        POSTs an already serialized JSON body and returns the response.
+        Raises requests.exceptions.RequestException (HTTPError for non-2xx responses) once the
+        retries are exhausted or on a non-retryable failure.
+        """
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                self._record_attempt()
+                try:
+                    response = self.session.post(url, headers=self.headers(), data=data, timeout=self.timeout)
+                except requests.exceptions.ConnectionError as e:
+                    # Connection refused/reset and connect timeouts: the request did not complete
+                    if attempt >= self.max_retries:
+                        self._record_failure("connection_error")
+                        raise
+                    self._record_retry("connection_error")
+                    logger.warning(f"Connection error calling {url} (attempt {attempt + 1}): {e}. Retrying.")
+                    time.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                except requests.exceptions.Timeout:
+                    self._record_failure("read_timeout")
+                    raise
+
+                self._record_status(response.status_code)
+                if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                    self._record_retry(f"http_{response.status_code}")
+                    delay = self._backoff(attempt, response.headers.get("Retry-After"))
+                    logger.warning(f"{url} returned {response.status_code} (attempt {attempt + 1}). Retrying in {delay:.2f}s.")
+                    response.close()
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                if response.status_code >= 400:
+                    self._record_failure(f"http_{response.status_code}")
+                response.raise_for_status()
+                return response
+        finally:
+            self._record_call(start)
+
+    def pool_stats(self):
+        """Per-host connection pool figures from urllib3."""
+        pools = {}
+        manager = self._adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                # The urllib3 queue is pre-filled with None placeholders for unopened slots
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+            }
+        return pools
+
+
+class AsyncDatabricksClient(_BaseClient):
+    """
+    asyncio version of DatabricksClient on an httpx.AsyncClient connection pool. Must be used from
+    one event loop; call `aclose()` on shutdown. Raises httpx.HTTPError subclasses
+    (HTTPStatusError for non-2xx responses) once the retries are exhausted.
+    """
+
+    def __init__(self, token, **settings):
+        if httpx is None:
+            raise RuntimeError("AsyncDatabricksClient needs the 'httpx' package")
+        super().__init__(token, **settings)
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+            timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]))
+
+    async def post(self, url, data):
+        """POSTs an already serialized JSON body and returns the httpx response."""
+        start = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                self._record_attempt()
+                try:
+                    response = await self.client.post(url, headers=self.headers(), content=data)
+                except (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError, httpx.WriteError,
+                        httpx.RemoteProtocolError) as e:
+                    # Refused/reset connections and connect timeouts (requests' ConnectionError in the sync client)
+                    if attempt >= self.max_retries:
+                        self._record_failure("connection_error")
+                        raise
+                    self._record_retry("connection_error")
+                    logger.warning(f"Connection error calling {url} (attempt {attempt + 1}): {type(e).__name__} {e}. Retrying.")
+                    await asyncio.sleep(self._backoff(attempt))
+                    attempt += 1
+                    continue
+                except httpx.TimeoutException:
+                    self._record_failure("read_timeout")
+                    raise
+
+                self._record_status(response.status_code)
+                if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                    self._record_retry(f"http_{response.status_code}")
+                    delay = self._backoff(attempt, response.headers.get("Retry-After"))
+                    logger.warning(f"{url} returned {response.status_code} (attempt {attempt + 1}). Retrying in {delay:.2f}s.")
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                if response.status_code >= 400:
+                    self._record_failure(f"http_{response.status_code}")
+                response.raise_for_status()
+                return response
+        finally:
+            self._record_call(start)
+
+    def pool_stats(self):
+        # httpx does not expose per-host pool counters
+        return {}
+
+    async def aclose(self):
+        await self.client.aclose()
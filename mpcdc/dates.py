@@ -0,0 +1,185 @@
+"""
+Date normalization and date-derived bucket features for the change classification model.
+
+The model StringIndexes submit_date, scheduled_start_date and scheduled_end_date, so a date only
+encodes to its training index when it is written exactly as in the training data. Clients send
+different forms (the web form's datetime-local `YYYY-MM-DDThh:mm[:ss]`, `dd/mm/YYYY HH:MM:SS`
+from scripts and Spanish-locale exports, ...), so dates are parsed and rewritten to one canonical
+format before the lookup. Parsing sniffs the layout from the separator positions instead of trying
+formats in turn, and is memoized: change exports repeat the same timestamps many times.
+
+Optionally two bucket features are derived from the dates (change window duration and lead time
+between submission and scheduled start, as `calculate_change_duration` in
+test_databricks_endpoints.py did), for models trained with them.
+"""
+import bisect
+import functools
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+# Derived bucket features: upper bucket edges in hours and the label of each bucket
+DURATION_FEATURE = "change_duration_bucket"
+DURATION_BUCKET_EDGES = [1, 4, 8, 24, 72]
+DURATION_BUCKET_LABELS = ["<1h", "1-4h", "4-8h", "8-24h", "1-3d", ">3d"]
+LEAD_TIME_FEATURE = "lead_time_bucket"
+LEAD_TIME_BUCKET_EDGES = [0, 24, 72, 168, 720]
+LEAD_TIME_BUCKET_LABELS = ["past", "<1d", "1-3d", "3-7d", "7-30d", ">30d"]
+
+PARSE_CACHE_SIZE = 65536
+# Format the sniffing fast path writes without building datetime objects (Spark's timestamp string form)
+CANONICAL_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def canonical_text(text):
+    """
+    A date string in CANONICAL_FORMAT, or None if its layout is not recognized. The layout is
+    sniffed from the separator positions and the fields are moved by slicing:
+        YYYY-MM-DD[Thh:mm[:ss[.ffffff]][Z|+hh:mm]]   (ISO 8601, the browser's datetime-local)
+        dd/mm/YYYY[ hh:mm[:ss]]
+    The wall-clock time is kept; fractions of a second and UTC offsets are dropped. Field values
+    are not range-checked here: an impossible date simply has no index in the equivalence map
+    (and parse_date returns None for it).
+    """
+    if text[4:5] == "-" and text[7:8] == "-":
+        day = text[:10]
+    elif text[2:3] == "/" and text[5:6] == "/":
+        day = text[6:10] + "-" + text[3:5] + "-" + text[0:2]
+    else:
+        return None
+    time = text[11:19]
+    if len(time) == 5:
+        time += ":00"
+    elif not time:
+        time = "00:00:00"
+    if len(day) != 10 or len(time) != 8 or time[2::3] != "::" or (len(text) > 10 and text[10] not in "T "):
+        return None
+    return day + " " + time
+
+
+def canonical_date(value):
+    """A date label (str, date or datetime) in CANONICAL_FORMAT, or None if it is not a recognized date."""
+    if isinstance(value, str):
+        return canonical_text(value.strip())
+    if isinstance(value, date) and not pd.isna(value):
+        return value.strftime(CANONICAL_FORMAT)
+    return None
+
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_text(text):
+    canonical = canonical_text(text.strip())
+    if canonical is None:
+        return None
+    try:
+        return datetime(int(canonical[0:4]), int(canonical[5:7]), int(canonical[8:10]),
+                        int(canonical[11:13]), int(canonical[14:16]), int(canonical[17:19]))
+    except ValueError:  # not digits, or out of range (e.g. 31 of a 30-day month)
+        return None
+
+
+def parse_date(value):
+    """datetime of a date label (str, date or datetime), or None if it is not a recognized date."""
+    if isinstance(value, str):
+        return _parse_text(value)
+    if isinstance(value, datetime):
+        return None if pd.isna(value) else value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return None
+
+
+class DateNormalizer:
+    """Rewrites date labels in `output_format` (strftime); labels that are not dates are returned unchanged."""
+
+    def __init__(self, output_format, cache_size=PARSE_CACHE_SIZE):
+        self.output_format = output_format
+        self._normalize_text = functools.lru_cache(maxsize=cache_size)(self._format)
+
+    def _format(self, text):
+        if self.output_format == CANONICAL_FORMAT:
+            canonical = canonical_date(text)
+            return text if canonical is None else canonical
+        parsed = _parse_text(text)
+        return text if parsed is None else parsed.strftime(self.output_format)
+
+    def __call__(self, label):
+        if isinstance(label, str):
+            return self._normalize_text(label)
+        parsed = parse_date(label)
+        return label if parsed is None else parsed.strftime(self.output_format)
+
+    def cache_info(self):
+        return self._normalize_text.cache_info()
+
+
+def bucket_label(hours, edges, labels):
+    """Label of the bucket `hours` falls in (None for None)."""
+    if hours is None:
+        return None
+    return labels[bisect.bisect_right(edges, hours)]
+
+
+def _hours_between(start, end):
+    start = parse_date(start)
+    end = parse_date(end)
+    if start is None or end is None:
+        return None
+    return (end - start).total_seconds() / 3600
+
+
+def date_buckets(record):
+    """The derived bucket features of one record; None where a date is missing or unparseable."""
+    duration = _hours_between(record.get("scheduled_start_date"), record.get("scheduled_end_date"))
+    if duration is not None and duration < 0:
+        duration = 0.0  # as calculate_change_duration: an inverted window counts as zero length
+    return {
+        DURATION_FEATURE: bucket_label(duration, DURATION_BUCKET_EDGES, DURATION_BUCKET_LABELS),
+        LEAD_TIME_FEATURE: bucket_label(
+            _hours_between(record.get("submit_date"), record.get("scheduled_start_date")),
+            LEAD_TIME_BUCKET_EDGES, LEAD_TIME_BUCKET_LABELS),
+    }
+
+
+def _datetime_column(values):
+    """datetime64 array of a column of date labels: each distinct label is canonicalized once, then parsed by pandas."""
+    try:
+        codes, distinct = pd.factorize(values if isinstance(values, pd.Series) else np.asarray(values, dtype=object))
+    except TypeError:  # unhashable JSON values are not dates
+        values = [value if isinstance(value, (str, date)) else None for value in values]
+        codes, distinct = pd.factorize(np.asarray(values, dtype=object))
+    canonical = pd.Series([canonical_date(value) for value in distinct] + [None], dtype=object)  # code -1 (null) picks the last entry
+    lookup = pd.to_datetime(canonical, format=CANONICAL_FORMAT, errors="coerce").to_numpy(dtype="datetime64[s]")
+    return lookup[codes]
+
+
+def _bucket_column(hours, edges, labels):
+    buckets = np.array(labels, dtype=object)[np.digitize(np.nan_to_num(hours), edges, right=False)]
+    buckets[np.isnan(hours)] = None
+    return buckets
+
+
+def add_date_buckets(records):
+    """
+    Adds the derived bucket features to a batch: a new DataFrame for a DataFrame, new dicts for a
+    list of records. Dates are parsed once per distinct label and the buckets computed with numpy.
+    """
+    is_frame = isinstance(records, pd.DataFrame)
+
+    def column(name):
+        if is_frame:
+            return records[name] if name in records.columns else pd.Series([None] * len(records), dtype=object)
+        return [record.get(name) for record in records]
+
+    submit, start, end = (_datetime_column(column(name)) for name in ("submit_date", "scheduled_start_date", "scheduled_end_date"))
+    one_hour = np.timedelta64(1, "h")
+    duration = np.maximum((end - start) / one_hour, 0.0)  # NaN (missing date) propagates
+    buckets = {
+        DURATION_FEATURE: _bucket_column(duration, DURATION_BUCKET_EDGES, DURATION_BUCKET_LABELS),
+        LEAD_TIME_FEATURE: _bucket_column((start - submit) / one_hour, LEAD_TIME_BUCKET_EDGES, LEAD_TIME_BUCKET_LABELS),
+    }
+    if is_frame:
+        return records.assign(**buckets)
+    names = list(buckets)
+    return [{**record, **dict(zip(names, values))} for record, values in zip(records, zip(*buckets.values()))]
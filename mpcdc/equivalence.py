@@ -0,0 +1,478 @@
+"""
+Equivalence map loading and label -> index encoding for the change classification model.
+
+The equivalence CSV (Column,Index,Label) lists, for every model input feature, the index the
+training StringIndexer assigned to each raw label. Instead of one tuple-keyed dict for the whole
+file, the loader builds one small label -> index table per column and exposes them through a
+FeatureEncoder, which is what the classifier (mpcdc.classifier) uses to assemble feature vectors.
+
+The CSV can also be compiled ahead of time into a binary snapshot (see `compile_snapshot` and
+`python -m mpcdc.equivalence`). The snapshot is memory-mapped read-only, so loading it takes
+milliseconds and forked workers share its pages instead of each holding a parsed copy.
+
+Snapshot layout (native byte order, recorded in the header):
+    magic (8 bytes) | byteorder (1) | pad (7) | sha256 of source CSV (32) | column count (u32)
+    per column: name length (u32) | name (utf-8) | label count (u32) | pad to 8 |
+                offsets pos (u64) | indices pos (u64) | blob pos (u64) | slots pos (u64)
+    per column data: label offsets into blob (u32 * (n + 1)) | indices (f64 * n) | blob |
+                     hash slots (u32 * capacity)
+Labels are stored sorted by their utf-8 bytes. The hash slots are an open-addressing table
+(crc32 of the label, linear probing, capacity a power of two at least 2n) holding label
+position + 1 (0 = empty), so a lookup is one or two probes of the mmap done by C code.
+
+Batches are encoded column by column: each distinct label of a column is looked up once and the
+indices are gathered with numpy, so repeated labels (the common case in change exports) cost a
+hash probe instead of a table lookup.
+"""
+import argparse
+import csv
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Header names of the equivalence CSV
+COLUMN_FIELD = "Column"
+INDEX_FIELD = "Index"
+LABEL_FIELD = "Label"
+
+SNAPSHOT_MAGIC = b"MPCDCEQ2"
+SNAPSHOT_EXTENSION = ".eqsnap"
+_BYTEORDER = b"L" if sys.byteorder == "little" else b"B"
+
+# Missing/unknown label policy that flags the field (and so the record) instead of substituting an index
+REJECT = "reject"
+# Marks absent/empty fields while a batch column is gathered (real indices are never negative)
+_MISSING_INDEX = -1.0
+# Unmapped labels remembered per snapshot table, beyond its own labels
+SNAPSHOT_MEMO_MISSES = 4096
+
+
+def index_policy(value):
+    """Parses a missing/unknown label setting: REJECT, or the index to substitute (e.g. "0.0")."""
+    value = str(value).strip()
+    return REJECT if value.lower() == REJECT else float(value)
+
+
+def is_missing(label):
+    """True for an absent field: None, an empty string or NaN."""
+    return label is None or (isinstance(label, str) and label == "") or (isinstance(label, float) and label != label)
+
+
+def _gather_records(labels, resolve):
+    """Indices of a list of labels: each distinct label is looked up once, NaN where unmapped."""
+    try:
+        distinct = set(labels)
+    except TypeError:  # unhashable JSON values (lists, objects) are looked up by their str()
+        labels = [label if label is None or isinstance(label, (str, int, float)) else str(label) for label in labels]
+        distinct = set(labels)
+    lookup = {label: _MISSING_INDEX if is_missing(label) else resolve(label) for label in distinct}
+    return np.fromiter(map(lookup.__getitem__, labels), dtype=np.float64, count=len(labels))
+
+
+def _gather_column(column, resolve):
+    """Indices of a DataFrame column from its pandas factorize codes (nulls are missing), NaN where unmapped."""
+    try:
+        codes, distinct = pd.factorize(column)
+    except TypeError:  # unhashable values (lists, dicts) in an object column
+        return _gather_records(column.tolist(), resolve)
+    lookup = np.array(
+        [_MISSING_INDEX if is_missing(label) else resolve(label) for label in distinct]
+        + [_MISSING_INDEX],  # code -1 (null) picks the last entry
+        dtype=np.float64)
+    return lookup[codes]
+
+
+class FeatureEncoder:
+    """Per-column label -> index tables, aligned with the model's feature order."""
+
+    def __init__(self, features, tables, version=None):
+        self.features = list(features)
+        self.tables = tables
+        # Optional feature name -> callable rewriting a present label before the lookup (e.g. dates)
+        self.normalizers = {}
+        # Optional feature name -> LabelIndex consulted when the exact lookup misses (see mpcdc/label_index.py)
+        self.matchers = {}
+        # Optional LabelCatalog of the map's labels for the change form's typeahead (see mpcdc/label_catalog.py)
+        self.catalog = None
+        # Short hash of the source CSV; identifies this map for caches built on top of it
+        self.version = version
+        # One table per feature, in feature order, so encoding a record is a positional walk
+        # instead of a (column, label) tuple allocation and hash per field.
+        self._ordered_tables = [tables.get(name, {}) for name in self.features]
+        self._size = sum(len(table) for table in tables.values())
+
+    def __len__(self):
+        return self._size
+
+    @classmethod
+    def from_csv(cls, csv_path, features):
+        """Builds an encoder by streaming the equivalence CSV with the csv module."""
+        return cls(features, read_csv_tables(csv_path), version=source_version(file_sha256(csv_path)))
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path, features):
+        """Builds an encoder backed by a memory-mapped snapshot."""
+        source_hash, tables = open_snapshot(snapshot_path)
+        return cls(features, tables, version=source_version(source_hash))
+
+    def lookup(self, column, label):
+        """Returns the index of `label` in `column`, or None if the label is not mapped."""
+        table = self.tables.get(column)
+        if table is None:
+            return None
+        return table.get(str(label))
+
+    def _resolver(self, name, table, matches):
+        """
+        Label -> index function for one column (NaN if unmapped): the column's normalizer, the exact
+        lookup, then the column's matcher. Matcher hits are recorded in `matches` as
+        label -> (matched label, confidence, tier).
+        """
+        normalize = self.normalizers.get(name)
+        matcher = self.matchers.get(name)
+
+        def resolve(label):
+            key = label if normalize is None else normalize(label)
+            key = key if isinstance(key, str) else str(key)
+            index = table.get(key)
+            if index is not None:
+                return index
+            match = matcher.match(key) if matcher is not None else None
+            if match is None:
+                return np.nan
+            matches[label] = match[1:]
+            return match[0]
+
+        return resolve
+
+    def encode(self, record, missing_value=0.0, unknown_value=0.0):
+        """
+        Encodes one raw record (dict of feature -> label) into a list of floats in feature order.
+        Returns (vector, missing, unknown, matches): the names of features that were absent/empty
+        and of those whose label is not in the map, which get `missing_value` / `unknown_value` in
+        the vector (NaN when that policy is REJECT), and feature name -> (matched label, confidence,
+        tier) for labels resolved by a matcher instead of an exact lookup.
+        """
+        vector = []
+        missing = []
+        unknown = []
+        matches = {}
+        for name, table in zip(self.features, self._ordered_tables):
+            label = record.get(name)
+            if is_missing(label):
+                missing.append(name)
+                vector.append(np.nan if missing_value == REJECT else missing_value)
+                continue
+            normalize = self.normalizers.get(name)
+            key = label if normalize is None else normalize(label)
+            key = key if isinstance(key, str) else str(key)
+            index = table.get(key)
+            if index is None and name in self.matchers:
+                match = self.matchers[name].match(key)
+                if match is not None:
+                    index = match[0]
+                    matches[name] = match[1:]
+            if index is None:
+                unknown.append(name)
+                vector.append(np.nan if unknown_value == REJECT else unknown_value)
+            else:
+                vector.append(index)
+        return vector, missing, unknown, matches
+
+    def encode_batch(self, records, missing_value=0.0, unknown_value=0.0, dtype=np.float64):
+        """
+        Encodes a batch of raw records, either a list of dicts or a DataFrame with one column per
+        feature, into a C-contiguous (n_records, n_features) `dtype` matrix in feature order.
+        Absent/empty fields get `missing_value` and unmapped labels `unknown_value`; with REJECT
+        they are left NaN and flagged instead.
+        Returns (matrix, missing_counts, unknown_counts, rejected, matches): the counts map feature
+        name -> number of rows that were absent/empty or had an unmapped label, `rejected` is a
+        boolean (n_records, n_features) mask of the flagged fields (None when nothing was flagged)
+        and `matches` maps feature name -> {label: (matched label, confidence, tier)} for the
+        labels resolved by a matcher.
+        """
+        is_frame = isinstance(records, pd.DataFrame)
+        n_rows = len(records)
+        matrix = np.empty((n_rows, len(self.features)), dtype=dtype)
+        missing_counts = {}
+        unknown_counts = {}
+        rejected = None
+        matches = {}
+        for position, (name, table) in enumerate(zip(self.features, self._ordered_tables)):
+            column_matches = {}
+            resolve = self._resolver(name, table, column_matches)
+            if not is_frame:
+                values = _gather_records([record.get(name) for record in records], resolve)
+            elif name in records.columns:
+                values = _gather_column(records[name], resolve)
+            else:
+                values = np.full(n_rows, _MISSING_INDEX)
+            missing = values == _MISSING_INDEX
+            unknown = np.isnan(values)
+            for mask, value, counts in ((missing, missing_value, missing_counts), (unknown, unknown_value, unknown_counts)):
+                count = int(np.count_nonzero(mask))
+                if not count:
+                    continue
+                counts[name] = count
+                if value == REJECT:
+                    if rejected is None:
+                        rejected = np.zeros(matrix.shape, dtype=bool)
+                    rejected[mask, position] = True
+                    value = np.nan
+                values[mask] = value
+            matrix[:, position] = values
+            if column_matches:
+                matches[name] = column_matches
+        return matrix, missing_counts, unknown_counts, rejected, matches
+
+
+def read_csv_tables(csv_path):
+    """Reads the equivalence CSV into {column: {label: index}}."""
+    tables = {}
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        column_pos = header.index(COLUMN_FIELD)
+        index_pos = header.index(INDEX_FIELD)
+        label_pos = header.index(LABEL_FIELD)
+        for row in reader:
+            if not row:
+                continue
+            table = tables.get(row[column_pos])
+            if table is None:
+                table = tables[row[column_pos]] = {}
+            table[row[label_pos]] = float(row[index_pos])
+    return tables
+
+
+def file_sha256(path):
+    """Returns the sha256 digest (bytes) of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.digest()
+
+
+def source_version(source_hash):
+    """Short printable version of an equivalence CSV digest."""
+    return source_hash.hex()[:16]
+
+
+def default_snapshot_path(csv_path):
+    """Snapshot path used when none is configured: the CSV path with SNAPSHOT_EXTENSION."""
+    return os.path.splitext(csv_path)[0] + SNAPSHOT_EXTENSION
+
+
+def _slot_count(count):
+    """Hash slots of a table of `count` labels: a power of two, at least twice the count."""
+    slots = 2
+    while slots < 2 * count:
+        slots *= 2
+    return slots
+
+
+def _hash_slots(keys):
+    """Hash slots (position + 1, 0 = empty) of a list of utf-8 keys, see the snapshot layout."""
+    slots = array("I", bytes(4 * _slot_count(len(keys))))
+    mask = len(slots) - 1
+    for position, key in enumerate(keys):
+        slot = zlib.crc32(key) & mask
+        while slots[slot]:
+            slot = (slot + 1) & mask
+        slots[slot] = position + 1
+    return slots
+
+
+class SnapshotTable:
+    """
+    Read-only label -> index table for one column, backed by a memory-mapped snapshot.
+    Labels looked up are memoized in a per-process dict (bounded by the table size plus
+    SNAPSHOT_MEMO_MISSES), so the hot labels of the classification path cost a dict probe while
+    the rest of the table stays in the shared mapping.
+    """
+
+    def __init__(self, buf, count, offsets_pos, indices_pos, blob_pos, slots_pos):
+        self._count = count
+        self._offsets = buf[offsets_pos:offsets_pos + 4 * (count + 1)].cast("I")
+        self._indices = buf[indices_pos:indices_pos + 8 * count].cast("d")
+        self._blob = buf[blob_pos:blob_pos + self._offsets[count]] if count else buf[0:0]
+        self._slots = buf[slots_pos:slots_pos + 4 * _slot_count(count)].cast("I")
+        self._mask = len(self._slots) - 1
+        self._memo = {}
+        self._memo_limit = count + SNAPSHOT_MEMO_MISSES
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, label):
+        return self.get(label) is not None
+
+    def __iter__(self):
+        return self.keys()
+
+    def _label_bytes(self, position):
+        return self._blob[self._offsets[position]:self._offsets[position + 1]].tobytes()
+
+    def _position(self, label):
+        key = label.encode("utf-8")
+        offsets, blob, slots, mask = self._offsets, self._blob, self._slots, self._mask
+        slot = zlib.crc32(key) & mask
+        while True:
+            entry = slots[slot]
+            if not entry:
+                return None
+            # Compares the mmap slice in place, without copying it to bytes
+            if blob[offsets[entry - 1]:offsets[entry]] == key:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    def get(self, label, default=None):
+        try:
+            index = self._memo[label]
+        except KeyError:
+            if not isinstance(label, str):
+                return default
+            position = self._position(label)
+            index = None if position is None else self._indices[position]
+            if len(self._memo) < self._memo_limit:
+                self._memo[label] = index
+        except TypeError:  # unhashable
+            return default
+        return default if index is None else index
+
+    def keys(self):
+        """Yields the labels in sorted (utf-8 byte) order."""
+        for position in range(self._count):
+            yield self._label_bytes(position).decode("utf-8")
+
+    def items(self):
+        for position, label in enumerate(self.keys()):
+            yield label, self._indices[position]
+
+
+def _align(f, boundary=8):
+    pad = -f.tell() % boundary
+    if pad:
+        f.write(b"\0" * pad)
+
+
+def compile_snapshot(csv_path, snapshot_path):
+    """Compiles the equivalence CSV into a snapshot file. Returns the number of mappings written."""
+    tables = read_csv_tables(csv_path)
+    source_hash = file_sha256(csv_path)
+
+    columns = []
+    for name, table in tables.items():
+        encoded = sorted((label.encode("utf-8"), index) for label, index in table.items())
+        offsets = array("I", [0])
+        for label, _ in encoded:
+            offsets.append(offsets[-1] + len(label))
+        indices = array("d", (index for _, index in encoded))
+        blob = b"".join(label for label, _ in encoded)
+        slots = _hash_slots([label for label, _ in encoded])
+        columns.append((name.encode("utf-8"), len(encoded), offsets, indices, blob, slots))
+
+    tmp_path = snapshot_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC + _BYTEORDER + b"\0" * 7 + source_hash)
+        f.write(struct.pack("=I", len(columns)))
+        # Directory entries are written with placeholder positions and patched once known
+        directory_slots = []
+        for name, count, _, _, _, _ in columns:
+            f.write(struct.pack("=I", len(name)) + name + struct.pack("=I", count))
+            _align(f)
+            directory_slots.append(f.tell())
+            f.write(struct.pack("=QQQQ", 0, 0, 0, 0))
+        positions = []
+        for _, _, offsets, indices, blob, slots in columns:
+            _align(f)
+            offsets_pos = f.tell()
+            f.write(offsets.tobytes())
+            _align(f)
+            indices_pos = f.tell()
+            f.write(indices.tobytes())
+            blob_pos = f.tell()
+            f.write(blob)
+            _align(f)
+            slots_pos = f.tell()
+            f.write(slots.tobytes())
+            positions.append((offsets_pos, indices_pos, blob_pos, slots_pos))
+        for slot, position in zip(directory_slots, positions):
+            f.seek(slot)
+            f.write(struct.pack("=QQQQ", *position))
+    # Atomic replace so running workers never map a half-written file
+    os.replace(tmp_path, snapshot_path)
+    return sum(len(table) for table in tables.values())
+
+
+def open_snapshot(snapshot_path):
+    """
+    Memory-maps a snapshot read-only. Returns (source_sha256, {column: SnapshotTable}).
+    Raises ValueError if the file is not a snapshot written on this platform.
+    """
+    with open(snapshot_path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    buf = memoryview(mm)
+    if bytes(buf[:8]) != SNAPSHOT_MAGIC or bytes(buf[8:9]) != _BYTEORDER:
+        raise ValueError(f"{snapshot_path} is not an equivalence snapshot for this platform")
+    source_hash = bytes(buf[16:48])
+    (column_count,) = struct.unpack_from("=I", buf, 48)
+    pos = 52
+    tables = {}
+    for _ in range(column_count):
+        (name_len,) = struct.unpack_from("=I", buf, pos)
+        pos += 4
+        name = bytes(buf[pos:pos + name_len]).decode("utf-8")
+        pos += name_len
+        (count,) = struct.unpack_from("=I", buf, pos)
+        pos += 4
+        pos += -pos % 8
+        offsets_pos, indices_pos, blob_pos, slots_pos = struct.unpack_from("=QQQQ", buf, pos)
+        pos += 32
+        tables[name] = SnapshotTable(buf, count, offsets_pos, indices_pos, blob_pos, slots_pos)
+    return source_hash, tables
+
+
+def load_encoder(csv_path, features, snapshot_path=None):
+    """
+    Loads the FeatureEncoder from the snapshot when it exists and matches the CSV's hash,
+    falling back to parsing the CSV when the snapshot is missing, unreadable or stale.
+    Raises FileNotFoundError if neither source is available.
+    """
+    if snapshot_path and os.path.exists(snapshot_path):
+        try:
+            source_hash, tables = open_snapshot(snapshot_path)
+            if not os.path.exists(csv_path):
+                logger.warning(f"Equivalence CSV {csv_path} not found; using snapshot {snapshot_path} unverified.")
+                return FeatureEncoder(features, tables, version=source_version(source_hash))
+            if source_hash == file_sha256(csv_path):
+                logger.info(f"Loaded equivalence snapshot {snapshot_path}.")
+                return FeatureEncoder(features, tables, version=source_version(source_hash))
+            logger.warning(f"Equivalence snapshot {snapshot_path} is stale (CSV hash changed). Falling back to CSV.")
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Could not load equivalence snapshot {snapshot_path}: {e}. Falling back to CSV.")
+    return FeatureEncoder.from_csv(csv_path, features)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Compile the equivalence CSV into a memory-mappable snapshot.")
+    parser.add_argument("csv_path", nargs="?", default="AI_Failure_Prediction_and_Prevention_for_CTTI.csv",
+                        help="Equivalence CSV to compile.")
+    parser.add_argument("-o", "--output", help="Snapshot path (default: CSV path with .eqsnap extension).")
+    args = parser.parse_args()
+
+    output = args.output or default_snapshot_path(args.csv_path)
+    written = compile_snapshot(args.csv_path, output)
+    logger.info(f"Wrote {written} mappings to {output}")
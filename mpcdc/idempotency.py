@@ -0,0 +1,192 @@
+"""
+Idempotency-Key replay for POST /mpcdc/classify_change.
+
+A client that may send a request twice (a retrying integration, a form submitted again) names it
+with an `Idempotency-Key` header. The first request with a key is served normally and its
+response is kept for `ttl` seconds; a repeat with the same key gets the stored response (and no
+new endpoint call or risk assessment) instead. A repeat arriving while the first one is still
+being served waits for it. Error responses of status 500 and above are not kept, so a retry after
+a failure is served again.
+
+A key is bound to the request it was first used with, through a fingerprint of its body and
+options: reusing it for a different request raises IdempotencyConflict (HTTP 422) rather than
+replaying an unrelated response. Keys and responses live in a per-process LRU (MemoryCache) by
+default, so a repeat that reaches another worker is served again (the prediction cache keeps that
+cheap). With a SqliteResponseStore they are shared by every worker using the same file, so a
+repeat is replayed whichever worker gets it; only the wait for a first request still running is
+per worker (a repeat on another worker at that moment is served again).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from .prediction_cache import MemoryCache
+from .single_flight import AsyncSingleFlight, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Idempotency keys are opaque client strings (typically a UUID) of printable ASCII characters
+IDEMPOTENCY_KEY_PATTERN = re.compile(r"^[\x20-\x7e]{1,255}$")
+
+
+def valid_idempotency_key(key):
+    return isinstance(key, str) and bool(IDEMPOTENCY_KEY_PATTERN.match(key))
+
+
+def request_fingerprint(body, *options):
+    """Hex sha256 of a JSON request body (key order ignored) and the request options that change its response."""
+    canonical = json.dumps([body, options], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class IdempotencyConflict(Exception):
+    """An idempotency key reused for a request with a different fingerprint."""
+
+
+class SqliteResponseStore:
+    """
+    File-backed key -> (fingerprint, response, status code) store shared between worker processes
+    (WAL mode, one connection per thread, like prediction_cache.SqliteCache). Errors are logged
+    and treated as misses, so a broken file only turns replays into normal requests.
+    """
+
+    def __init__(self, path, max_entries=10000, ttl=600.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS idempotent_responses ("
+            " key TEXT PRIMARY KEY, entry TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection opened before a fork (e.g. gunicorn preload) must not be used by the child
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def __len__(self):
+        try:
+            (count,) = self._connection().execute("SELECT COUNT(*) FROM idempotent_responses").fetchone()
+            return count
+        except sqlite3.Error:
+            return 0
+
+    def get(self, key):
+        try:
+            row = self._connection().execute(
+                "SELECT entry FROM idempotent_responses WHERE key = ? AND expires >= ?", (key, time.time())).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Idempotency store read failed: {e}")
+            return None
+        return tuple(json.loads(row[0])) if row else None
+
+    def set(self, key, entry):
+        try:
+            conn = self._connection()
+            now = time.time()
+            # Another worker may have stored a response for the key meanwhile: the first one stays
+            # (an expired one is replaced)
+            conn.execute(
+                "INSERT INTO idempotent_responses (key, entry, expires) VALUES (?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET entry = excluded.entry, expires = excluded.expires"
+                " WHERE idempotent_responses.expires < ?",
+                (key, json.dumps(entry), now + self.ttl, now))
+            with self._lock:
+                self._writes += 1
+                trim = self._writes % 64 == 0
+            if trim:
+                self._trim(conn)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"Idempotency store write failed: {e}")
+
+    def _trim(self, conn):
+        now = time.time()
+        conn.execute("DELETE FROM idempotent_responses WHERE expires < ?", (now,))
+        # Keys expire in the order they were stored, so the oldest go first beyond the bound
+        conn.execute("DELETE FROM idempotent_responses WHERE rowid IN (SELECT rowid FROM idempotent_responses"
+                     " ORDER BY expires DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+
+class IdempotencyStore:
+    """
+    Responses of requests made with an idempotency key, replayed to their repeats. `responses`
+    keeps them (default: a per-process MemoryCache of `max_entries` for `ttl` seconds).
+    """
+
+    def __init__(self, max_entries=10000, ttl=600.0, responses=None):
+        self.ttl = ttl
+        self._responses = responses if responses is not None else MemoryCache(max_entries, ttl)
+        self._flights = SingleFlight()
+        self._async_flights = AsyncSingleFlight()
+        self.stored = 0
+        self.replays = 0
+        self.conflicts = 0
+
+    def run(self, key, fingerprint, compute):
+        """
+        (response, status code, replayed): the stored response for `key`, or that of
+        `compute() -> (response, status code)`. Raises IdempotencyConflict if the key was used
+        with another fingerprint.
+        """
+        entry = self._responses.get(key)
+        replayed = entry is not None
+        if not replayed:
+            entry, replayed = self._flights.do(key, lambda: self._store(key, fingerprint, compute()))
+        return self._answer(entry, fingerprint, replayed)
+
+    async def run_async(self, key, fingerprint, compute):
+        """
+        run() for a coroutine function `compute`, on the event loop. The response store is read
+        and written in a worker thread, as a SqliteResponseStore may wait on another process.
+        """
+        entry = await asyncio.to_thread(self._responses.get, key)
+        replayed = entry is not None
+        if not replayed:
+            async def compute_and_store():
+                result = await compute()
+                return await asyncio.to_thread(self._store, key, fingerprint, result)
+            entry, replayed = await self._async_flights.do(key, compute_and_store)
+        return self._answer(entry, fingerprint, replayed)
+
+    def _store(self, key, fingerprint, result):
+        response, status_code = result
+        entry = (fingerprint, response, status_code)
+        if status_code < 500:
+            self._responses.set(key, entry)
+            self.stored += 1
+        return entry
+
+    def _answer(self, entry, fingerprint, replayed):
+        stored_fingerprint, response, status_code = entry
+        if stored_fingerprint != fingerprint:
+            self.conflicts += 1
+            raise IdempotencyConflict("This Idempotency-Key was already used for a different request.")
+        if replayed:
+            self.replays += 1
+        return response, status_code, replayed
+
+    def stats(self):
+        return {
+            "backend": "sqlite" if isinstance(self._responses, SqliteResponseStore) else "memory",
+            "entries": len(self._responses),
+            "ttl": self.ttl,
+            "stored": self.stored,
+            "replays": self.replays,
+            "conflicts": self.conflicts,
+            "in_flight": self._flights.stats()["in_flight"] + self._async_flights.stats()["in_flight"],
+        }
@@ -0,0 +1,116 @@
+"""
+Label catalog behind the change form's typeahead (/mpcdc/labels/<column>?prefix=...).
+
+For each column the labels of the equivalence map are kept in two sorted arrays of normalized
+keys (casefolded, accent-stripped, see label_index.normalize_label): one of the whole labels, and
+one of the label suffixes that start at each later word (so "tramit" finds
+"MTES - MODUL DE TRAMITACIO ..."). A prefix query is a pair of binary searches per array and a
+slice, so its cost depends on the page size and not on the size of the table or on the offset.
+Labels starting with the prefix come first, in alphabetical order, then labels with a later word
+starting with it.
+"""
+import bisect
+import re
+import threading
+
+from .label_index import normalize_label
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_PREFIX_LENGTH = 64
+
+# Start of every alphanumeric run after the first one ("st.app.00206" -> "app.00206", "00206")
+_LATER_WORD = re.compile(r"(?<=[^\w])\w")
+# Sorts after every key that starts with a given prefix
+_PREFIX_END = chr(0x10FFFF)
+
+
+def _common_prefix(a, b):
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+def _build_column(table):
+    """
+    Sorted keys and labels, sorted later-word suffixes and their labels, and the suffixes that some
+    prefixes hide. A suffix is not listed for a prefix of up to `shadow` characters: the label's
+    whole key, or an earlier suffix of the same label, starts with that prefix too.
+    """
+    entries = sorted((normalize_label(label), label) for label in table if isinstance(label, str))
+    words = []
+    for key, label in entries:
+        suffixes = sorted(key[match.start():] for match in _LATER_WORD.finditer(key))
+        for position, suffix in enumerate(suffixes):
+            shadow = max([_common_prefix(key, suffix)] + [_common_prefix(earlier, suffix) for earlier in suffixes[:position]])
+            words.append((suffix, label, shadow))
+    words.sort()
+    hidden = [position for position, (_, _, shadow) in enumerate(words) if shadow]
+    return (
+        [key for key, _ in entries], [label for _, label in entries],
+        [suffix for suffix, _, _ in words], [label for _, label, _ in words],
+        [shadow for _, _, shadow in words], hidden,
+    )
+
+
+class LabelCatalog:
+    """
+    Sorted prefix index over the labels of each column (`tables`: column -> {label: index}). A
+    column is indexed on its first search, so a map that is never typed into costs nothing.
+    """
+
+    def __init__(self, tables):
+        self._tables = tables
+        self._columns = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, column):
+        return column in self._tables
+
+    def columns(self):
+        return list(self._tables)
+
+    def _column(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            with self._lock:
+                column = self._columns.get(name)
+                if column is None:
+                    column = self._columns[name] = _build_column(self._tables[name])
+        return column
+
+    def search(self, column, prefix, offset=0, limit=DEFAULT_LIMIT):
+        """
+        (labels, has_more): up to `limit` labels of `column` from position `offset` of the matches
+        for `prefix` (labels starting with it, then labels with a later word starting with it).
+        """
+        keys, labels, word_keys, word_labels, shadows, hidden = self._column(column)
+        prefix = normalize_label(prefix[:MAX_PREFIX_LENGTH])
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + _PREFIX_END, start)
+        page = labels[start + offset:min(end, start + offset + limit)]
+        if not prefix or start + offset + limit < end:
+            # An empty prefix lists every label in the first range; otherwise this page is full
+            return page, start + offset + limit < end
+
+        # The first range is exhausted: continue with later-word matches of labels not listed
+        # there. The page starts `skip` listed suffixes into the range, moved past the suffixes the
+        # prefix hides before it; one more label than needed tells whether another page follows.
+        word_start = bisect.bisect_left(word_keys, prefix)
+        word_end = bisect.bisect_left(word_keys, prefix + _PREFIX_END, word_start)
+        position = word_start + max(0, offset - (end - start))
+        for shadowed in hidden[bisect.bisect_left(hidden, word_start):bisect.bisect_left(hidden, word_end)]:
+            if shadowed > position:
+                break
+            if shadows[shadowed] >= len(prefix):
+                position += 1
+        while position < word_end:
+            if shadows[position] < len(prefix):
+                page.append(word_labels[position])
+                if len(page) > limit:
+                    return page[:limit], True
+            position += 1
+        return page, False
@@ -0,0 +1,202 @@
+"""
+Normalized and approximate label lookups for one column of the equivalence map.
+
+The equivalence map only matches a label written exactly as in training, so a casing, spacing or
+accent difference (" st.app.00206", "Gestión" vs "Gestion") used to encode as 0.0. A LabelIndex
+adds two tiers behind the exact lookup:
+
+1. normalized: casefold, accents stripped, surrounding whitespace trimmed and inner runs collapsed.
+   Normalized keys shared by labels with different indices are ambiguous and never match.
+2. approximate (optional): the labels sharing the most rare trigrams with the query are ranked
+   by edit distance. The work per lookup is bounded: only the MAX_PROBE_GRAMS rarest trigrams of
+   the query are probed, trigrams shared by more than MAX_POSTING labels are skipped, at most
+   MAX_CANDIDATES labels are compared and queries longer than MAX_QUERY_LENGTH are not matched.
+   Results are memoized, so a repeated near miss costs a dict lookup.
+
+Every tier-2 hit carries a confidence, 1 - edits / label length. Codes such as ST.APP.00794 are
+dense: with a dropped digit the query is often one edit away from several of them. A best match
+with a label of a different index at the same distance is ambiguous and is not returned, and one
+with such a label one or two edits further loses 1 or 1/2 edit of confidence.
+"""
+import functools
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+NORMALIZED = "normalized"
+APPROXIMATE = "approximate"
+
+MIN_QUERY_LENGTH = 4
+MAX_QUERY_LENGTH = 64
+MAX_PROBE_GRAMS = 8
+MAX_POSTING = 64
+MAX_CANDIDATES = 64
+MATCH_CACHE_SIZE = 4096
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=65536)
+def normalize_label(label):
+    """Casefolded, accent-stripped label with trimmed and collapsed whitespace."""
+    decomposed = unicodedata.normalize("NFKD", label.casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _WHITESPACE.sub(" ", stripped).strip()
+
+
+def trigrams(key):
+    """Set of character trigrams of a normalized label, padded so that short labels have some."""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """
+    Levenshtein distance between `a` and `b`, or `limit` + 1 if it is larger than `limit`.
+    Bit-parallel (Myers/Hyyro): one pass over `b` with the columns of `a` packed in an int.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if not a:
+        return len(b)
+    match = {}
+    for i, char in enumerate(a):
+        match[char] = match.get(char, 0) | 1 << i
+    mask = (1 << len(a)) - 1
+    last = 1 << (len(a) - 1)
+    positive, negative, distance = mask, 0, len(a)
+    for char in b:
+        equal = match.get(char, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        up = negative | ~(horizontal | positive)
+        down = positive & horizontal
+        if up & last:
+            distance += 1
+        elif down & last:
+            distance -= 1
+        up = (up << 1 | 1) & mask
+        down = (down << 1) & mask
+        positive = (down | ~(vertical | up)) & mask
+        negative = up & vertical
+    return min(distance, limit + 1)
+
+
+class LabelIndex:
+    """
+    Normalized (and optionally approximate) label -> index lookups over one column's table.
+    The index is built on the first lookup, so a column whose labels always match exactly never
+    reads its whole table (a snapshot-backed one stays unread in the memory map).
+    """
+
+    def __init__(self, table, approximate=False, min_confidence=0.8):
+        self.table = table
+        self.approximate = approximate
+        self.min_confidence = min_confidence
+        self._lock = threading.Lock()
+        self._normalized = None
+        self._approximate_match = functools.lru_cache(maxsize=MATCH_CACHE_SIZE)(self._best_match)
+
+    def _build(self):
+        with self._lock:
+            if self._normalized is not None:
+                return
+            normalized = {}
+            ambiguous = set()
+            for label, index in self.table.items():
+                key = normalize_label(label)
+                if key in normalized and normalized[key][1] != index:
+                    ambiguous.add(key)
+                normalized.setdefault(key, (label, index))
+            for key in ambiguous:
+                del normalized[key]
+
+            self._keys = []
+            self._normalized_keys = []
+            self._grams = []
+            self._postings = {}
+            if self.approximate:
+                for key, (label, index) in normalized.items():
+                    if len(key) < MIN_QUERY_LENGTH:
+                        continue
+                    grams = trigrams(key)
+                    position = len(self._keys)
+                    self._keys.append((label, index))
+                    self._normalized_keys.append(key)
+                    self._grams.append(grams)
+                    for gram in grams:
+                        self._postings.setdefault(gram, []).append(position)
+            self._normalized = normalized
+
+    @property
+    def is_built(self):
+        return self._normalized is not None
+
+    def __len__(self):
+        if self._normalized is None:
+            self._build()
+        return len(self._normalized)
+
+    def match(self, label):
+        """
+        (index, matched label, confidence, tier) for a label that missed the exact lookup, or None.
+        `tier` is NORMALIZED (confidence 1.0) or APPROXIMATE (edit similarity).
+        """
+        if self._normalized is None:
+            self._build()
+        key = normalize_label(label)
+        hit = self._normalized.get(key)
+        if hit is not None:
+            return hit[1], hit[0], 1.0, NORMALIZED
+        if not self.approximate or not MIN_QUERY_LENGTH <= len(key) <= MAX_QUERY_LENGTH:
+            return None
+        return self._approximate_match(key)
+
+    def _best_match(self, key):
+        grams = trigrams(key)
+        probes = sorted((posting for posting in map(self._postings.get, grams) if posting and len(posting) <= MAX_POSTING),
+                        key=len)[:MAX_PROBE_GRAMS]
+        if not probes:
+            return None
+        shared = Counter()
+        for posting in probes:
+            shared.update(posting)
+
+        # Ranked by edit distance rather than trigram similarity: a dropped character costs a code
+        # several trigrams, so the best Dice score is often another code. Candidates are measured
+        # in trigram order and, as an edit changes at most 3 trigrams, the ones too different to
+        # beat the runner-up are skipped.
+        candidates = []
+        for position, _ in shared.most_common(MAX_CANDIDATES):
+            candidate_grams = self._grams[position]
+            common = len(grams & candidate_grams)
+            candidates.append((common / (len(grams) + len(candidate_grams)),
+                               max(len(grams), len(candidate_grams)) - common, position))
+        candidates.sort(reverse=True)
+        limit = int((1 - self.min_confidence) * (len(key) + 1))
+        best = None
+        runner_up = limit + 2
+        for _, differing, position in candidates:
+            bound = min(runner_up - 1, limit + 1 if best is None else best[0] + 2)
+            if differing > 3 * bound:
+                continue
+            distance = edit_distance(key, self._normalized_keys[position], bound)
+            if best is None or distance < best[0]:
+                if best is not None and self._keys[position][1] != self._keys[best[1]][1]:
+                    runner_up = best[0]
+                best = (distance, position)
+            elif self._keys[position][1] != self._keys[best[1]][1]:
+                runner_up = min(runner_up, distance)
+        if best is None:
+            return None
+        distance, position = best
+        # ST.APP.0074 is as near ST.APP.00074 as ST.APP.00794: a tie of two indices is a guess
+        if runner_up <= distance:
+            return None
+        penalty = 1 / (runner_up - distance) if runner_up <= distance + 2 else 0.0
+        confidence = 1 - (distance + penalty) / max(len(key), len(self._normalized_keys[position]))
+        if confidence < self.min_confidence:
+            return None
+        label, index = self._keys[position]
+        return index, label, round(confidence, 3), APPROXIMATE
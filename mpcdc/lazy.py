@@ -0,0 +1,29 @@
+"""
+Lazily built shared objects.
+
+Clients and data that are expensive to build (equivalence map, HTTP pools, Gemini model) are
+wrapped with `lazy`, so importing a module never builds them; the first caller does. Under
+gunicorn they are built in the master before forking (see `when_ready` in gunicorn.conf.py).
+"""
+import functools
+import threading
+
+
+def lazy(build):
+    """
+    Decorator for a zero-argument builder: the object is built on the first call (once, even
+    with concurrent callers) and every later call returns the same object, including None.
+    """
+    lock = threading.Lock()
+    built = []
+
+    @functools.wraps(build)
+    def get():
+        if not built:
+            with lock:
+                if not built:
+                    built.append(build())
+        return built[0]
+
+    get.is_built = lambda: bool(built)
+    return get
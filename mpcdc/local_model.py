@@ -0,0 +1,127 @@
+"""
+In-process scorer for an exported tree-ensemble version of the change priority model.
+
+The ensemble is stored as a NumPy .npz archive of flat node arrays, so it loads without pickle
+and scores the FEATURE_ORDER vector without a network hop:
+
+    feature    int32   [n_nodes]  feature position tested at the node (-1 for leaves)
+    threshold  float64 [n_nodes]  split threshold; rows with x[feature] <= threshold go left
+    left       int32   [n_nodes]  index of the left child (-1 for leaves)
+    right      int32   [n_nodes]  index of the right child (-1 for leaves)
+    value      float64 [n_nodes]  leaf output: probability of the positive class (P1)
+    roots      int32   [n_trees]  index of each tree's root node
+    n_features          scalar    length of the input vector
+    decision_threshold  scalar    mean leaf probability at or above which the prediction is 1.0
+
+Node indices are global across trees, and a node's children come after it (as in the depth-first
+and breadth-first layouts tree libraries export), so every walk ends at a leaf. The predicted value matches the regression endpoint's
+encoding (1.0 = P1, 0.0 = P3).
+"""
+import hashlib
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Up to this many rows are scored with a plain Python tree walk, which beats NumPy's per-call
+# overhead for the single-change case; larger batches use the vectorized walk.
+SCALAR_PATH_MAX_ROWS = 4
+
+
+class TreeEnsembleModel:
+    """Averaging tree ensemble scored from flat node arrays."""
+
+    def __init__(self, feature, threshold, left, right, value, roots, n_features,
+                 decision_threshold=0.5, version=None):
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.n_features = int(n_features)
+        self.decision_threshold = float(decision_threshold)
+        self.version = version
+        self._validate()
+        # Python lists for the scalar walk (list indexing is much cheaper than ndarray indexing)
+        self._nodes = list(zip(self.feature.tolist(), self.threshold.tolist(),
+                               self.left.tolist(), self.right.tolist(), self.value.tolist()))
+        self._roots = self.roots.tolist()
+
+    def _validate(self):
+        n_nodes = len(self.feature)
+        for name in ("threshold", "left", "right", "value"):
+            if len(getattr(self, name)) != n_nodes:
+                raise ValueError(f"Model array '{name}' has {len(getattr(self, name))} entries, expected {n_nodes}")
+        if not len(self.roots):
+            raise ValueError("Model has no trees")
+        internal = self.left >= 0
+        if np.any(self.feature[internal] >= self.n_features) or np.any(self.feature[internal] < 0):
+            raise ValueError("Model references a feature outside the input vector")
+        if np.any(self.left >= n_nodes) or np.any(self.right >= n_nodes) or np.any(self.roots >= n_nodes) or np.any(self.roots < 0):
+            raise ValueError("Model references a node outside the node arrays")
+        # The walks stop at a leaf (left < 0): an internal node needs a right child, and children
+        # after their parent rule out cycles, which would never end
+        nodes = np.flatnonzero(internal)
+        if np.any(self.right[internal] < 0):
+            raise ValueError("Model has an internal node without a right child")
+        if np.any(self.left[internal] <= nodes) or np.any(self.right[internal] <= nodes):
+            raise ValueError("Model has a child node placed before its parent")
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a model from an .npz archive (no pickle)."""
+        with open(path, "rb") as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:16]
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["feature"], data["threshold"], data["left"], data["right"], data["value"],
+                       data["roots"], data["n_features"], data["decision_threshold"], version=version)
+
+    def save(self, path):
+        """Writes the model as an .npz archive."""
+        np.savez(path, feature=self.feature, threshold=self.threshold, left=self.left, right=self.right,
+                 value=self.value, roots=self.roots, n_features=self.n_features,
+                 decision_threshold=self.decision_threshold)
+
+    def _predict_proba_scalar(self, vector):
+        nodes = self._nodes
+        total = 0.0
+        for node in self._roots:
+            feature, threshold, left, right, value = nodes[node]
+            while left >= 0:
+                node = left if vector[feature] <= threshold else right
+                feature, threshold, left, right, value = nodes[node]
+            total += value
+        return total / len(self._roots)
+
+    def predict_proba(self, feature_matrix):
+        """Mean positive-class probability for each row of an (n_rows, n_features) matrix."""
+        matrix = np.asarray(feature_matrix, dtype=np.float64)
+        if matrix.ndim == 1:
+            matrix = matrix.reshape(1, -1)
+        if matrix.shape[1] != self.n_features:
+            raise ValueError(f"Expected {self.n_features} features, got {matrix.shape[1]}")
+        if matrix.shape[0] <= SCALAR_PATH_MAX_ROWS:
+            return np.array([self._predict_proba_scalar(row) for row in matrix.tolist()])
+
+        rows = np.arange(matrix.shape[0])
+        total = np.zeros(matrix.shape[0])
+        for root in self._roots:
+            node = np.full(matrix.shape[0], root, dtype=np.int32)
+            active = self.left[node] >= 0
+            while active.any():
+                current = node[active]
+                goes_left = matrix[rows[active], self.feature[current]] <= self.threshold[current]
+                node[active] = np.where(goes_left, self.left[current], self.right[current])
+                active = self.left[node] >= 0
+            total += self.value[node]
+        return total / len(self._roots)
+
+    def predict(self, feature_matrix):
+        """Predicted class value (1.0 = P1, 0.0 = P3) for each row."""
+        return (self.predict_proba(feature_matrix) >= self.decision_threshold).astype(np.float64)
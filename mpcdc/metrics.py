@@ -0,0 +1,331 @@
+"""
+Lightweight in-process metrics, exported in the Prometheus text format by /mpcdc/metrics.
+
+Histograms and counters are updated on the request path, so they are kept cheap: an observation
+is a bisect over the bucket bounds and a few additions under a lock (about a microsecond), with
+no dependency on a client library. Figures that the app already keeps (cache hits, unknown label
+counts, upstream status codes...) are not counted twice: collectors registered with
+`Registry.collector` read them when the metrics are scraped.
+
+Each process keeps its own metrics. Under gunicorn, every worker also writes them to a file of its
+own in a directory shared by the pod's workers (`Registry.multiprocess`), and a scrape answered by
+any worker sums the files: counters and histograms add up over all the workers that ever ran (those
+of recycled workers are merged into one archive file), so the series have no per-process label and
+do not reset when a worker is replaced; gauges add up (or take the largest value) over the live
+workers only.
+"""
+import asyncio
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Bucket bounds in seconds, from sub-millisecond in-process stages to LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Timer:
+    __slots__ = ("histogram", "label_values", "start")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+
+
+class Histogram:
+    """Distribution of observed values (seconds), per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [count per bucket (+Inf last), sum]
+
+    def observe(self, value, *label_values):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def time(self, *label_values):
+        """Context manager observing the duration of its block."""
+        return _Timer(self, label_values)
+
+    def timed(self, *label_values):
+        """Decorator observing the duration of each call of a function or coroutine function."""
+        def decorate(function):
+            if asyncio.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def async_wrapper(*args, **kwargs):
+                    with _Timer(self, label_values):
+                        return await function(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with _Timer(self, label_values):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def samples(self):
+        with self._lock:
+            series = {label_values: (list(counts), total) for label_values, (counts, total) in self._series.items()}
+        for label_values, (counts, total) in sorted(series.items()):
+            labels = list(zip(self.labelnames, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", labels + [("le", _number(bound))], cumulative
+            yield "_sum", labels, total
+            yield "_count", labels, cumulative
+
+
+class Counter:
+    """Monotonic count per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield "", list(zip(self.labelnames, label_values)), value
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(into, families, gauges=True):
+    """Adds the samples of `families` (see Registry._families) to `into`; gauges are skipped if not `gauges`."""
+    for name, (kind, documentation, aggregate, samples) in families.items():
+        if kind == "gauge" and not gauges:
+            continue
+        merged = into.setdefault(name, (kind, documentation, aggregate, {}))[3]
+        for key, value in samples.items():
+            if key not in merged:
+                merged[key] = value
+            elif kind == "gauge" and aggregate == "max":
+                merged[key] = max(merged[key], value)
+            else:
+                merged[key] += value
+    return into
+
+
+def _dump(families):
+    return [[name, kind, documentation, aggregate, [[sample, list(map(list, labels)), value] for (sample, labels), value in samples.items()]]
+            for name, (kind, documentation, aggregate, samples) in families.items()]
+
+
+def _load(dumped):
+    return {name: (kind, documentation, aggregate, {(sample, tuple(map(tuple, labels))): value for sample, labels, value in samples})
+            for name, kind, documentation, aggregate, samples in dumped}
+
+
+def _write_json(path, value):
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(value, f)
+    os.replace(temporary, path)
+
+
+class Registry:
+    """The metrics of a process and the collectors reading figures kept elsewhere."""
+
+    ARCHIVE = "archive.json"
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self.directory = None
+        self._path = None
+        self._flusher = None
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def collector(self, collect):
+        """
+        Registers `collect()`, called at every scrape, returning (name, kind, documentation, samples)
+        tuples with kind "counter" or "gauge" and samples a list of ({label: value}, number) pairs.
+        A gauge tuple may add how the figures of several workers combine: "sum" (the default) or
+        "max" (for a figure every worker reads from the same shared store). Usable as a decorator.
+        """
+        self._collectors.append(collect)
+        return collect
+
+    def multiprocess(self, directory, flush_interval=5.0):
+        """
+        Shares this process's figures with the other processes using `directory` (called in each
+        gunicorn worker after the fork): the figures inherited from the parent are dropped, the
+        worker's own are written to its file every `flush_interval` seconds (and by flush()), and
+        render() answers with those of all the processes.
+        """
+        for metric in self._metrics.values():
+            metric.clear()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self._path = os.path.join(directory, f"worker-{os.getpid()}-{os.urandom(4).hex()}.json")
+        self.flush()
+
+        def flush_periodically():
+            while True:
+                time.sleep(flush_interval)
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.warning(f"Could not write metrics to {self._path}: {e}")
+
+        self._flusher = threading.Thread(target=flush_periodically, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def flush(self):
+        """Writes this process's figures to its file in the multiprocess directory."""
+        if self._path is not None:
+            _write_json(self._path, {"pid": os.getpid(), "families": _dump(self._families())})
+
+    def _families(self):
+        """{name: (kind, documentation, gauge aggregation, {(sample name, label pairs): value})} of this process."""
+        families = {}
+        for metric in self._metrics.values():
+            samples = families.setdefault(metric.name, (metric.kind, metric.documentation, "sum", {}))[3]
+            for suffix, labels, value in metric.samples():
+                samples[(metric.name + suffix, tuple((name, str(label)) for name, label in labels))] = value
+        # Collectors may report samples of the same metric (e.g. the sync and async clients'); each
+        # metric is written once, with the samples of all of them
+        for collect in self._collectors:
+            for name, kind, documentation, samples, *aggregate in collect():
+                family = {name: (kind, documentation, aggregate[0] if aggregate else "sum",
+                                 {(name, tuple(sorted((key, str(label)) for key, label in labels.items()))): value
+                                  for labels, value in samples if value is not None})}
+                _merge(families, family)
+        return families
+
+    def _all_families(self):
+        """
+        The figures of every process writing to the multiprocess directory. The files of processes
+        that exited are merged into the archive (without their gauges) and removed.
+        """
+        import fcntl
+
+        self.flush()
+        with open(os.path.join(self.directory, ".lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, self.ARCHIVE)
+            try:
+                with open(archive_path) as f:
+                    archive = _load(json.load(f))
+            except FileNotFoundError:
+                archive = {}
+            live, exited = [], []
+            for file_name in sorted(os.listdir(self.directory)):
+                if not (file_name.startswith("worker-") and file_name.endswith(".json")):
+                    continue
+                path = os.path.join(self.directory, file_name)
+                try:
+                    with open(path) as f:
+                        written = json.load(f)
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Skipping unreadable metrics file {path}: {e}")
+                    continue
+                if _alive(written["pid"]):
+                    live.append(_load(written["families"]))
+                else:
+                    _merge(archive, _load(written["families"]), gauges=False)
+                    exited.append(path)
+            if exited:
+                _write_json(archive_path, _dump(archive))
+                for path in exited:
+                    os.remove(path)
+        families = _merge({}, archive)
+        for worker in live:
+            _merge(families, worker)
+        return families
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        families = self._all_families() if self.directory else self._families()
+        lines = []
+        for name, (kind, documentation, _, samples) in families.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (sample, labels), value in samples.items():
+                lines.append(f"{sample}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Time spent in each stage of a classification or chat request (see the stage names in
+# CHANGE_CLASSIFICATION.md); shared by the classifier, the web app and the ASGI entry point
+STAGE_SECONDS = REGISTRY.histogram("mpcdc_stage_seconds", "Time spent in each stage of the classify and chat paths.", ["stage"])
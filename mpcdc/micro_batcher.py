@@ -0,0 +1,198 @@
+"""
+Micro-batching of concurrent single-change predictions into multi-row endpoint calls.
+
+When many operators classify changes at the same moment, each request would otherwise become
+its own one-row call to the Databricks serving endpoint, which costs a round trip and counts
+against its rate limit. A batcher takes the first waiting feature vector with the ones queued
+behind it (at most `max_batch`), scores them with one call of `predict` (one multi-row
+dataframe_split request) and hands each caller its own prediction. The batch is held open for
+up to `max_wait` seconds after the first one to gather more, but only while other submitters are
+in flight (waiting for their own predictions): a request on an idle server is sent at once and
+gets no added latency. If the call fails, every caller of the batch gets the error.
+
+MicroBatcher serves threads: a dispatcher thread collects the batches and a small pool runs them,
+so a slow batch does not hold up the next one. Threads do not survive fork, so both are started
+by the first submit() of each process. AsyncMicroBatcher does the same on one event loop with a
+timer instead of threads.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .single_flight import shared_error
+
+
+class _BatchStats:
+    def _init_stats(self, max_batch, max_wait):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+
+    def _record(self, size):
+        self.batches += 1
+        self.rows += size
+        self.largest_batch = max(self.largest_batch, size)
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+            "batches": self.batches,
+            "rows": self.rows,
+            "mean_batch_size": round(self.rows / self.batches, 2) if self.batches else None,
+            "largest_batch": self.largest_batch,
+            "endpoint_calls_saved": self.rows - self.batches,
+        }
+
+
+class _Pending:
+    __slots__ = ("feature_vector", "done", "result", "error")
+
+    def __init__(self, feature_vector):
+        self.feature_vector = feature_vector
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher(_BatchStats):
+    """
+    Coalesces single feature vectors submitted from concurrent threads into calls of
+    `predict(feature_vectors) -> predictions`, at most `workers` of them running at once.
+    """
+
+    def __init__(self, predict, max_batch=16, max_wait=0.005, workers=4):
+        self._init_stats(max_batch, max_wait)
+        self.predict = predict
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._in_flight = 0  # submit() calls waiting for their prediction
+        self._pid = None
+        self._queue = None
+        self._executor = None
+
+    def submit(self, feature_vector):
+        """The prediction for one feature vector; raises what `predict` raised for its batch."""
+        if self._pid != os.getpid():
+            self._start()
+        pending = _Pending(feature_vector)
+        with self._lock:
+            self._in_flight += 1
+        try:
+            self._queue.put(pending)
+            pending.done.wait()
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        if pending.error is not None:
+            raise shared_error(pending.error)
+        return pending.result
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.SimpleQueue()
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="micro-batch")
+            threading.Thread(target=self._dispatch, args=(self._queue, self._executor),
+                             name="micro-batcher", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _dispatch(self, requests, executor):
+        while True:
+            batch = [requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(requests.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                # Nobody else in flight would join the batch: send it now
+                timeout = deadline - time.monotonic()
+                if self._in_flight <= len(batch) or timeout <= 0:
+                    break
+                try:
+                    batch.append(requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            predictions = self.predict([pending.feature_vector for pending in batch])
+            for pending, prediction in zip(batch, predictions):
+                pending.result = prediction
+        except Exception as e:  # handed to the callers, who raise it
+            for pending in batch:
+                pending.error = e
+        finally:
+            with self._lock:
+                self._record(len(batch))
+            for pending in batch:
+                pending.done.set()
+
+
+class AsyncMicroBatcher(_BatchStats):
+    """
+    asyncio version of MicroBatcher for a coroutine `predict(feature_vectors) -> predictions`;
+    create and use it on one event loop.
+    """
+
+    def __init__(self, predict, max_batch=16, max_wait=0.005):
+        self._init_stats(max_batch, max_wait)
+        self.predict = predict
+        self._batch = []
+        self._timer = None
+        self._tasks = set()
+        self._in_flight = 0  # submit() calls waiting for their prediction
+
+    async def submit(self, feature_vector):
+        future = asyncio.get_running_loop().create_future()
+        self._batch.append((feature_vector, future))
+        self._in_flight += 1
+        try:
+            if len(self._batch) >= self.max_batch:
+                self._flush()
+            elif self._timer is None:
+                # Collects the requests submitted in this loop iteration first
+                self._timer = asyncio.get_running_loop().call_soon(self._collected)
+            return await future
+        finally:
+            self._in_flight -= 1
+
+    def _collected(self):
+        # Held open up to max_wait only while other submitters are in flight
+        self._timer = None
+        if self._in_flight <= len(self._batch):
+            self._flush()
+        else:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)  # keep a reference until it is done
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        self._record(len(batch))
+        try:
+            predictions = await self.predict([feature_vector for feature_vector, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(shared_error(e))
+            return
+        for (_, future), prediction in zip(batch, predictions):
+            if not future.done():  # the caller may have been cancelled
+                future.set_result(prediction)
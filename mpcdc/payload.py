@@ -0,0 +1,60 @@
+"""
+Regression endpoint request bodies, serialized straight from the feature vectors.
+
+The MLflow serving endpoint takes one `features` column holding each change's feature vector
+(MPCDC_PAYLOAD_FORMAT), either as a dataframe_split
+    {"dataframe_split": {"columns": ["features"], "data": [[[f1, f2, ...]], ...]}}
+or as a tensor input
+    {"inputs": {"features": [[f1, f2, ...], ...]}}
+Only the rows change from one request to the next, so a body is a fixed prefix and suffix around
+the serialized rows; no DataFrame or intermediate dict is built. The rows are encoded with orjson
+when it is installed and with the json module otherwise. Non-finite values are refused with a
+ValueError, like json.dumps(allow_nan=False) does, since orjson would send them as null.
+"""
+import json
+import math
+from itertools import chain
+
+try:
+    import orjson
+except ImportError:  # Optional: the standard json module is used instead
+    orjson = None
+
+# Body prefix and suffix around the serialized data, and whether each row is wrapped in a
+# one-column list (dataframe_split rows hold one cell, the feature vector)
+PAYLOAD_FORMATS = {
+    "dataframe_split": (b'{"dataframe_split":{"columns":["features"],"data":', b"}}", True),
+    "inputs": (b'{"inputs":{"features":', b"}}", False),
+}
+
+
+def _json_default(obj):
+    """NumPy scalars and arrays that json.dumps does not encode itself."""
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def encode_json(value):
+    """Compact JSON bytes for plain lists and numbers (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, separators=(",", ":"), allow_nan=False, default=_json_default).encode("utf-8")
+
+
+class PayloadBuilder:
+    """Serializes feature vectors into request bodies of one of the PAYLOAD_FORMATS."""
+
+    def __init__(self, payload_format="dataframe_split"):
+        if payload_format not in PAYLOAD_FORMATS:
+            raise ValueError(f"Unknown payload format {payload_format!r} (expected one of {', '.join(PAYLOAD_FORMATS)})")
+        self.payload_format = payload_format
+        self._prefix, self._suffix, self._wrap_rows = PAYLOAD_FORMATS[payload_format]
+
+    def body(self, feature_vectors):
+        """JSON request body (bytes) for the feature vectors. Raises ValueError/TypeError for values JSON cannot carry."""
+        rows = [vector if isinstance(vector, list) else list(vector) for vector in feature_vectors]
+        if not all(map(math.isfinite, chain.from_iterable(rows))):
+            raise ValueError("Out of range float values are not JSON compliant")
+        data = encode_json([[row] for row in rows] if self._wrap_rows else rows)
+        return self._prefix + data + self._suffix
@@ -0,0 +1,257 @@
+"""
+Content-addressed cache for regression endpoint predictions.
+
+Entries are keyed by a hash of the assembled feature vector, scoped to a namespace built from the
+equivalence map version and the endpoint URL. When either changes the namespace changes, so stale
+predictions are never served: the process drops its in-memory entries, while the shared entries of
+other namespaces are left to age out (TTL, then LRU), since other workers may still be running
+with that map version (or already with a newer one).
+
+Two tiers:
+- MemoryCache: per-process LRU with a size bound and TTL.
+- SqliteCache: optional file-backed tier shared by all workers on the same host/volume, so a
+  prediction made by one worker is a hit for the others without any outside service.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def cache_namespace(encoder_version, endpoint_url):
+    """Namespace for cache keys: predictions are only valid for one map version and endpoint."""
+    return f"{encoder_version}|{endpoint_url}"
+
+
+def feature_key(feature_vector):
+    """Content hash of a feature vector (hex sha256 of its float64 values)."""
+    values = [float(value) for value in feature_vector]
+    return hashlib.sha256(struct.pack(f"<{len(values)}d", *values)).hexdigest()
+
+
+class MemoryCache:
+    """Thread-safe in-process LRU cache with a TTL."""
+
+    def __init__(self, max_entries=4096, ttl=3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SqliteCache:
+    """
+    File-backed cache shared between worker processes. Each thread uses its own connection;
+    the database runs in WAL mode so readers do not block the writer. Errors are logged and
+    treated as misses so a broken cache file never fails a classification.
+    """
+
+    # Bumped when the table layout changes; an older table is dropped (its entries are only a cache)
+    SCHEMA_VERSION = 2
+
+    def __init__(self, path, max_entries=100000, ttl=3600.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._writes = 0
+        self.evictions = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        # Workers open the file at the same time: one of them migrates it, the others wait for the lock
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            (version,) = conn.execute("PRAGMA user_version").fetchone()
+            if version < self.SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS predictions")
+            # Workers on different equivalence map versions share the file, so a key is only unique per namespace
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value REAL,"
+                " expires REAL NOT NULL, accessed REAL NOT NULL, PRIMARY KEY (namespace, key))")
+            conn.execute("CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions (accessed)")
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # A connection opened before a fork (e.g. gunicorn preload) must not be used by the child
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key, namespace):
+        try:
+            conn = self._connection()
+            # Workers reload the equivalence map independently, so entries of another version may be present
+            row = conn.execute("SELECT value, expires FROM predictions WHERE namespace = ? AND key = ?",
+                               (namespace, key)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if row[1] < now:
+                conn.execute("DELETE FROM predictions WHERE namespace = ? AND key = ?", (namespace, key))
+                return None
+            conn.execute("UPDATE predictions SET accessed = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+            return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Shared prediction cache read failed: {e}")
+            return None
+
+    def set(self, key, value, namespace):
+        try:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO predictions (namespace, key, value, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, value, now + self.ttl, now))
+            with self._stats_lock:
+                self._writes += 1
+                trim = self._writes % 64 == 0
+            # Trimming needs a COUNT(*), so only check the bound every few writes
+            if trim:
+                self._trim(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared prediction cache write failed: {e}")
+
+    def _trim(self, conn):
+        conn.execute("DELETE FROM predictions WHERE expires < ?", (time.time(),))
+        (count,) = conn.execute("SELECT COUNT(*) FROM predictions").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM predictions WHERE rowid IN (SELECT rowid FROM predictions ORDER BY accessed LIMIT ?)",
+                (excess,))
+            with self._stats_lock:
+                self.evictions += excess
+
+
+class PredictionCache:
+    """Two-tier (memory, then optional shared sqlite) prediction cache with hit/miss metrics."""
+
+    def __init__(self, memory, shared=None):
+        self.memory = memory
+        self.shared = shared
+        self.namespace = None
+        self._lock = threading.Lock()
+        # The counters are updated from every request thread
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def set_namespace(self, namespace):
+        """
+        Makes `namespace` current, dropping this process's cached predictions. Shared entries of
+        other namespaces are not deleted: a worker still on an older map version must not wipe
+        the entries of a newer one (and they are never served in another namespace anyway).
+        """
+        with self._lock:
+            if namespace == self.namespace:
+                return
+            if self.namespace is not None:
+                logger.info(f"Prediction cache namespace changed ({self.namespace} -> {namespace}). Invalidating cache.")
+                self.invalidations += 1
+            self.memory.clear()
+            self.namespace = namespace
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _in_namespace(self, namespace):
+        """
+        Whether a lookup in `namespace` may use the cache. The first namespace seen becomes current;
+        after that only set_namespace() changes it, and a request still running with a replaced
+        equivalence map version bypasses the cache instead of invalidating the new entries.
+        """
+        if self.namespace is None:
+            self.set_namespace(namespace)
+        return namespace == self.namespace
+
+    def get(self, feature_vector, namespace):
+        """Returns the cached prediction for the vector, or None on a miss."""
+        if not self._in_namespace(namespace):
+            self._count("misses")
+            return None
+        key = feature_key(feature_vector)
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("hits")
+            return value
+        if self.shared is not None:
+            value = self.shared.get(key, namespace)
+            if value is not None:
+                self.memory.set(key, value)
+                self._count("shared_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, feature_vector, namespace, value):
+        if not self._in_namespace(namespace):
+            return
+        key = feature_key(feature_vector)
+        self.memory.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, namespace)
+
+    def stats(self):
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "backend": "memory+sqlite" if self.shared is not None else "memory",
+            "entries": len(self.memory),
+            "max_entries": self.memory.max_entries,
+            "ttl_s": self.memory.ttl,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else None,
+            "evictions": self.memory.evictions + (self.shared.evictions if self.shared is not None else 0),
+            "invalidations": self.invalidations,
+            "namespace": self.namespace,
+        }
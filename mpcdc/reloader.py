@@ -0,0 +1,125 @@
+"""
+Hot reload of an object built from a file (the equivalence map's FeatureEncoder).
+
+A FileReloader holds the current version of the object and a background thread polls the file's
+stat signature (mtime, size, inode) every `interval` seconds. A changed file is rebuilt once its
+signature has been stable for one poll (so a file still being copied is not loaded half written),
+off the request path, and swapped in with a single reference assignment: requests that already
+took the old version finish with it, later ones get the new one. A build that fails or returns
+None keeps the current version.
+
+Threads do not survive fork, so the poller is started by the first `current()` call of each
+process (e.g. in every gunicorn worker, not in the master that built the first version).
+"""
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(path):
+    """(mtime_ns, size, inode) of a file, or None if it cannot be read."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class FileReloader:
+    """
+    Current version of `build()` (a zero-argument callable reading `path`), rebuilt when the file
+    changes. `version(obj)` names a built object (versions are compared to skip rebuilds of an
+    unchanged file); `on_swap(old, new)` is called after a new version is swapped in.
+    An interval <= 0 disables the polling thread (check() can still be called directly).
+    """
+
+    def __init__(self, build, path, interval=30.0, version=None, on_swap=None):
+        self.build = build
+        self.path = path
+        self.interval = interval
+        self.version = version or (lambda obj: None)
+        self.on_swap = on_swap
+        self._lock = threading.Lock()
+        self._poller_pid = None
+        self._pending = None
+        self._signature = file_signature(path)
+        self._current = build()
+        self.loaded_at = time.time()
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+
+    def current(self):
+        """The current version (None if no build has succeeded yet)."""
+        if self._poller_pid != os.getpid() and self.interval > 0:
+            self._start_poller()
+        return self._current
+
+    def _start_poller(self):
+        with self._lock:
+            if self._poller_pid == os.getpid():
+                return
+            self._poller_pid = os.getpid()
+            threading.Thread(target=self._poll, name="file-reloader", daemon=True).start()
+            logger.info(f"Watching {self.path} for changes every {self.interval:g}s.")
+
+    def _poll(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:  # the poller must survive anything a build raises
+                logger.exception(f"Reload check of {self.path} failed: {e}")
+
+    def check(self):
+        """Rebuilds and swaps in a new version if the file changed and has settled. Returns True on a swap."""
+        signature = file_signature(self.path)
+        if signature is None or signature == self._signature:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            # Changed since the last poll: wait one more interval for the writer to finish
+            self._pending = signature
+            return False
+        self._pending = None
+        self._signature = signature
+
+        started = time.perf_counter()
+        try:
+            built = self.build()
+            error = None if built is not None else "build returned nothing (see log)"
+        except Exception as e:
+            built, error = None, str(e)
+        if built is None:
+            self.failures += 1
+            self.last_error = error
+            logger.error(f"Reloading {self.path} failed ({error}); keeping version {self.version(self._current)}.")
+            return False
+
+        old = self._current
+        if old is not None and self.version(built) == self.version(old):
+            logger.info(f"{self.path} changed on disk but its version {self.version(old)} did not; keeping the loaded one.")
+            return False
+        self._current = built
+        self.loaded_at = time.time()
+        self.reloads += 1
+        self.last_error = None
+        logger.info(f"Reloaded {self.path}: version {self.version(old)} -> {self.version(built)} "
+                    f"in {time.perf_counter() - started:.2f}s.")
+        if self.on_swap is not None:
+            self.on_swap(old, built)
+        return True
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "version": self.version(self._current) if self._current is not None else None,
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.loaded_at)),
+            "reload_interval_s": self.interval if self.interval > 0 else None,
+            "reloads": self.reloads,
+            "reload_failures": self.failures,
+            "last_error": self.last_error,
+        }
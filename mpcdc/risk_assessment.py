@@ -0,0 +1,191 @@
+"""
+LLM risk-assessment stage run after a change has been classified.
+
+Builds the risk-assessment prompt from the change details and the predicted incident priority,
+asks the LLM for the JSON contract defined by the system prompt in app.py
+({"overall_explanation", "actionable_plans": [{"description", "confidence_score"}]}), and
+validates/normalizes the reply. Validated assessments are cached by (built prompt, predicted
+label, prompt version), so assessing a change with the same details again costs no LLM call. The
+feature vector is not enough: unseen dates and unmapped labels all encode to the unknown index,
+while the prompt (and so the assessment) names them.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Bump when the prompt template below changes; cached assessments of older versions are never served
+PROMPT_TEMPLATE_VERSION = "1"
+
+# A ```json ... ``` (or bare ```) block around the reply, which the model sometimes adds anyway
+_CODE_BLOCK = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL)
+
+
+class AssessmentValidationError(ValueError):
+    """The LLM reply is not a JSON object matching the assessment contract."""
+
+
+def prompt_version(system_prompt):
+    """Version of the whole prompt (template version + system prompt hash), part of the cache key."""
+    digest = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()[:12]
+    return f"{PROMPT_TEMPLATE_VERSION}-{digest}"
+
+
+def build_assessment_prompt(change, predicted_label, fields):
+    """User prompt for one change: the predicted priority plus the non-empty `fields` of the change."""
+    details = "Planned Change Details:\n"
+    for field in fields:
+        value = change.get(field)
+        if value is not None and value != "":
+            details += f"- {field}: {value}\n"
+    return (f"The following change has a predicted Priority of: {predicted_label}.\n\n{details}\n"
+            "Please analyze this change in the context of the provided cluster report and generate your "
+            "structured JSON output (overall_explanation and two actionable_plans with confidence scores).")
+
+
+def parse_assessment(text):
+    """
+    Parses and validates an LLM reply. Returns {"overall_explanation": str, "actionable_plans":
+    [{"description": str, "confidence_score": str or float}]}; raises AssessmentValidationError.
+    """
+    if not text or not text.strip():
+        raise AssessmentValidationError("Empty reply")
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        match = _CODE_BLOCK.search(text)
+        if not match:
+            raise AssessmentValidationError("Reply is not valid JSON")
+        try:
+            data = json.loads(match.group(1))
+        except json.JSONDecodeError as e:
+            raise AssessmentValidationError(f"JSON block in reply is not valid: {e}")
+
+    if not isinstance(data, dict):
+        raise AssessmentValidationError("Reply is not a JSON object")
+    explanation = data.get("overall_explanation")
+    if not isinstance(explanation, str) or not explanation.strip():
+        raise AssessmentValidationError("'overall_explanation' is missing or empty")
+    plans = data.get("actionable_plans")
+    if not isinstance(plans, list) or not plans:
+        raise AssessmentValidationError("'actionable_plans' is missing or empty")
+
+    normalized_plans = []
+    for plan in plans:
+        if not isinstance(plan, dict):
+            raise AssessmentValidationError("Every actionable plan must be an object")
+        # The model occasionally answers with 'plan_description' instead of the requested key
+        description = plan.get("description") or plan.get("plan_description")
+        if not isinstance(description, str) or not description.strip():
+            raise AssessmentValidationError("An actionable plan has no description")
+        confidence = plan.get("confidence_score")
+        if not isinstance(confidence, (str, int, float)) or isinstance(confidence, bool):
+            confidence = None
+        normalized_plans.append({"description": description.strip(), "confidence_score": confidence})
+
+    return {"overall_explanation": explanation.strip(), "actionable_plans": normalized_plans}
+
+
+class RiskAssessor:
+    """
+    Runs the assessment stage. `generate(prompt) -> str` calls the LLM (`generate_async` is the
+    coroutine version used by assess_async); `cache` is any object with get(key)/set(key, value)
+    (e.g. prediction_cache.MemoryCache), or None to disable caching. Invalid replies are retried up
+    to `max_attempts` times in total.
+    """
+
+    def __init__(self, generate, prompt_version, cache=None, max_attempts=2, generate_async=None):
+        self.generate = generate
+        self.generate_async = generate_async
+        self.prompt_version = prompt_version
+        self.cache = cache
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.llm_calls = 0
+        self.invalid_replies = 0
+
+    def cache_key(self, prompt, predicted_label, scope=""):
+        """Key of the (built prompt, predicted label, prompt version) tuple within a scope (map version)."""
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{scope}|{self.prompt_version}|{predicted_label}|{digest}"
+
+    def _cached(self, key):
+        assessment = self.cache.get(key) if self.cache is not None else None
+        with self._lock:
+            if assessment is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return assessment
+
+    def _validate(self, reply, attempt):
+        """Parsed assessment, or None if the reply is invalid and another attempt is left."""
+        try:
+            return parse_assessment(reply)
+        except AssessmentValidationError as e:
+            with self._lock:
+                self.invalid_replies += 1
+            logger.warning(f"Invalid risk assessment reply (attempt {attempt}/{self.max_attempts}): {e}")
+            if attempt == self.max_attempts:
+                raise
+            return None
+
+    def _count_llm_call(self):
+        with self._lock:
+            self.llm_calls += 1
+
+    def assess(self, change, predicted_label, fields, scope=""):
+        """
+        Returns (assessment, cached). Raises AssessmentValidationError when every attempt produced
+        an invalid reply; errors from `generate` propagate.
+        """
+        prompt = build_assessment_prompt(change, predicted_label, fields)
+        key = self.cache_key(prompt, predicted_label, scope)
+        assessment = self._cached(key)
+        if assessment is not None:
+            return assessment, True
+
+        for attempt in range(1, self.max_attempts + 1):
+            self._count_llm_call()
+            assessment = self._validate(self.generate(prompt), attempt)
+            if assessment is not None:
+                break
+
+        if self.cache is not None:
+            self.cache.set(key, assessment)
+        return assessment, False
+
+    async def assess_async(self, change, predicted_label, fields, scope=""):
+        """Coroutine version of assess() using `generate_async`."""
+        prompt = build_assessment_prompt(change, predicted_label, fields)
+        key = self.cache_key(prompt, predicted_label, scope)
+        assessment = self._cached(key)
+        if assessment is not None:
+            return assessment, True
+
+        for attempt in range(1, self.max_attempts + 1):
+            self._count_llm_call()
+            assessment = self._validate(await self.generate_async(prompt), attempt)
+            if assessment is not None:
+                break
+
+        if self.cache is not None:
+            self.cache.set(key, assessment)
+        return assessment, False
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "prompt_version": self.prompt_version,
+            "entries": len(self.cache) if self.cache is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "llm_calls": self.llm_calls,
+            "invalid_replies": self.invalid_replies,
+        }
@@ -0,0 +1,114 @@
+"""
+Single-flight execution: concurrent calls for the same key share one run of the work.
+
+A double-click on the form submit, or an integration retrying a request that is still being
+served, sends the same change twice within milliseconds. Neither copy finds the prediction cache
+filled yet, so each would make its own regression endpoint call. With `SingleFlight.do(key, fn)`
+the first caller for a key (the leader) runs `fn`; callers arriving with the same key while it
+runs wait for it and get the same result, or a copy of the same error. Nothing is kept once the
+leader finishes: later repeats are served by the prediction cache (or the idempotency store).
+
+SingleFlight serves threads; AsyncSingleFlight does the same for coroutines on one event loop.
+"""
+import asyncio
+import copy
+import threading
+
+
+def shared_error(error):
+    """A copy of an error for one of the callers sharing it, so concurrent raises do not share one traceback."""
+    try:
+        return copy.copy(error)
+    except Exception:
+        return error
+
+
+class _FlightStats:
+    def _init_stats(self):
+        self.leaders = 0
+        self.shared = 0
+
+    def stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "shared": self.shared,
+        }
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(_FlightStats):
+    """Runs `function` once per key at a time for concurrent threads."""
+
+    def __init__(self):
+        self._init_stats()
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function):
+        """(result of `function()`, whether it was shared with a call already in flight); raises what it raised."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise shared_error(call.error)
+            return call.result, True
+
+        try:
+            call.result = function()
+            return call.result, False
+        except BaseException as e:  # handed to the waiting callers too
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+class AsyncSingleFlight(_FlightStats):
+    """
+    asyncio version of SingleFlight for a coroutine function; use it on one event loop. The work
+    runs as its own task, so a caller that is cancelled does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._init_stats()
+        self._calls = {}
+
+    async def do(self, key, function):
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self.shared += 1
+        else:
+            task = self._calls[key] = asyncio.ensure_future(function())
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.leaders += 1
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            raise shared_error(e) if shared else e
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here too, in case every caller was cancelled
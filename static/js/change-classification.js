@@ -3,6 +3,20 @@ document.addEventListener('DOMContentLoaded', function() {
     const classificationResults = document.getElementById('classificationResults');
     const resultsContent = document.getElementById('resultsContent');
     const changeSection = document.getElementById('changeClassificationSection');
+    const submitButton = document.getElementById('submitChangeBtn');
+
+    // Idempotency-Key of the last submitted change: submitting the same change again (double click,
+    // retry after a network error) reuses it, so the server replays its response instead of scoring it again
+    let lastSubmission = { request: null, key: null };
+
+    function idempotencyKeyFor(request) {
+        if (lastSubmission.request !== request) {
+            const key = (window.crypto && crypto.randomUUID) ? crypto.randomUUID()
+                : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+            lastSubmission = { request: request, key: key };
+        }
+        return lastSubmission.key;
+    }
     
     // Add a click event to the chatbot message that mentions the form
     const chatMessages = document.getElementById('chatMessages');
@@ -25,6 +39,72 @@ document.addEventListener('DOMContentLoaded', function() {
         return `${year}-${month}-${day}T${hours}:${minutes}:${seconds}`;
     }
 
+    // Typeahead for the free-text fields: suggestions come from the equivalence map's labels
+    // (/mpcdc/labels/<column>), so operators pick labels the model knows instead of guessing
+    const typeaheadFields = [
+        "f01_chr_serviceid", "serviceci", "ASORG", "ASGRP", "categorization_tier_2", "categorization_tier_3",
+        "product_cat_tier_1", "product_cat_tier_2", "product_cat_tier_3"
+    ];
+    const TYPEAHEAD_DELAY_MS = 150;
+    const TYPEAHEAD_LIMIT = 20;
+    const suggestionCache = new Map(); // "column|prefix" -> labels
+
+    function setupTypeahead(column) {
+        const input = document.getElementById(column);
+        if (!input) return;
+        const datalist = document.createElement('datalist');
+        datalist.id = `${column}-labels`;
+        input.after(datalist);
+        input.setAttribute('list', datalist.id);
+        input.setAttribute('autocomplete', 'off');
+
+        let timer = null;
+        let controller = null;
+
+        function showSuggestions(labels) {
+            datalist.replaceChildren(...labels.map(label => {
+                const option = document.createElement('option');
+                option.value = label;
+                return option;
+            }));
+        }
+
+        async function fetchSuggestions(prefix) {
+            // Only the latest keystroke's suggestions matter
+            if (controller) controller.abort();
+            const key = `${column}|${prefix}`;
+            if (suggestionCache.has(key)) {
+                showSuggestions(suggestionCache.get(key));
+                return;
+            }
+            controller = new AbortController();
+            try {
+                const url = `/mpcdc/labels/${encodeURIComponent(column)}?prefix=${encodeURIComponent(prefix)}&limit=${TYPEAHEAD_LIMIT}`;
+                const response = await fetch(url, { signal: controller.signal });
+                if (!response.ok) return;
+                const data = await response.json();
+                suggestionCache.set(key, data.labels);
+                showSuggestions(data.labels);
+            } catch (error) {
+                if (error.name !== 'AbortError') {
+                    console.error(`Could not load suggestions for ${column}:`, error);
+                }
+            }
+        }
+
+        input.addEventListener('input', function() {
+            clearTimeout(timer);
+            const prefix = input.value.trim();
+            if (!prefix) {
+                showSuggestions([]);
+                return;
+            }
+            timer = setTimeout(() => fetchSuggestions(prefix), TYPEAHEAD_DELAY_MS);
+        });
+    }
+
+    typeaheadFields.forEach(setupTypeahead);
+
     // Function to scroll to the change form
     function scrollToChangeForm() {
         changeSection.scrollIntoView({ behavior: 'smooth' });
@@ -79,8 +159,17 @@ document.addEventListener('DOMContentLoaded', function() {
             const resultCard = createResultCard(data);
             resultsContent.appendChild(resultCard);
 
-            // Send the predicted label and change details to the chatbot
-            if (window.sendChatbotMessage) {
+            // Show the server-side risk assessment when it was produced (cached or fresh)
+            if (data.risk_assessment && window.showRiskAssessment) {
+                window.showRiskAssessment(data.risk_assessment, data.session_id);
+
+                const userInput = document.getElementById('userInput');
+                const sendButton = document.getElementById('sendButton');
+                if (userInput) userInput.disabled = false;
+                if (sendButton) sendButton.disabled = false;
+
+            // Otherwise send the predicted label and change details to the chatbot
+            } else if (window.sendChatbotMessage) {
                 let detailsString = "Planned Change Details:\n";
                 if (changeDetails) {
                     for (const key in changeDetails) {
@@ -228,16 +317,32 @@ document.addEventListener('DOMContentLoaded', function() {
             // If it's strictly required by the API and not just for model features, validation might be needed here or on the backend.
         }
 
+        // Ignore further submits while this one is pending
+        if (submitButton) {
+            if (submitButton.disabled) {
+                return;
+            }
+            submitButton.disabled = true;
+        }
+
         try {
             showLoading();
             
-            // Send data to the API
-            const response = await fetch('/mpcdc/classify_change', {
+            // Send data to the API; the risk assessment is recorded in this tab's chat conversation
+            const body = JSON.stringify(changeData);
+            const chatSessionId = sessionStorage.getItem('mpcdcChatSessionId');
+            // The session ID is part of the request too (the first response may have just assigned it)
+            const headers = {
+                'Content-Type': 'application/json',
+                'Idempotency-Key': idempotencyKeyFor(`${chatSessionId || ''} ${body}`)
+            };
+            if (chatSessionId) {
+                headers['X-Session-ID'] = chatSessionId;
+            }
+            const response = await fetch('/mpcdc/classify_change?assess=true', {
                 method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify(changeData)
+                headers: headers,
+                body: body
             });
             
             const results = await response.json();
@@ -256,6 +361,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 </div>
             `;
             classificationResults.classList.remove('hidden');
+        } finally {
+            if (submitButton) {
+                submitButton.disabled = false;
+            }
         }
     });
 
@@ -283,9 +392,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 li.className = 'actionable-plan-item'; // Add a class for styling
 
                 const planDesc = document.createElement('p');
-                // Correctly access plan.plan_description based on the actual key from LLM/console
-                console.log("Value of plan.plan_description BEFORE marked.parseInline:", plan.plan_description); 
-                planDesc.innerHTML = marked.parseInline(plan.plan_description || "No description provided."); 
+                // Server-side assessments use 'description'; raw chatbot replies may use 'plan_description'
+                const description = plan.description || plan.plan_description;
+                console.log("Value of plan description BEFORE marked.parseInline:", description); 
+                planDesc.innerHTML = marked.parseInline(description || "No description provided."); 
 
                 const planConfidence = document.createElement('p');
                 planConfidence.className = 'plan-confidence';
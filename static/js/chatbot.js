@@ -3,6 +3,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const userInput = document.getElementById('userInput');
     const sendButton = document.getElementById('sendButton');
 
+    // Conversation ID assigned by the server; kept per browser tab so each tab has its own history
+    let chatSessionId = sessionStorage.getItem('mpcdcChatSessionId');
+
     // Function to add a message to the chat
     function addMessage(message, isUser) {
         const messageDiv = document.createElement('div');
@@ -33,6 +36,18 @@ document.addEventListener('DOMContentLoaded', function() {
         setTimeout(() => {
             chatMessages.scrollTop = chatMessages.scrollHeight;
         }, 10);
+
+        return messageContent;
+    }
+
+    // Function to render (or re-render) bot Markdown into an existing message element
+    function renderBotMessage(messageContent, message) {
+        if (typeof marked !== 'undefined') {
+            messageContent.innerHTML = marked.parse(message);
+        } else {
+            messageContent.textContent = message;
+        }
+        chatMessages.scrollTop = chatMessages.scrollHeight;
     }
 
     // Function to show loading indicator
@@ -74,81 +89,184 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Function to send message to the server
+    // Function to remember the conversation ID returned by the server
+    function rememberSessionId(sessionId) {
+        if (sessionId && sessionId !== chatSessionId) {
+            chatSessionId = sessionId;
+            sessionStorage.setItem('mpcdcChatSessionId', chatSessionId);
+        }
+    }
+
+    // Function to extract the structured JSON output ({overall_explanation, actionable_plans}) from the LLM reply
+    function parseStructuredResponse(rawResponseText) {
+        try {
+            // First, try direct parsing
+            return JSON.parse(rawResponseText);
+        } catch (e) {
+            // If direct parsing fails, try to extract JSON from within markdown code blocks
+            console.warn("Direct JSON.parse failed. Attempting to extract JSON from markdown code block.", e);
+            const jsonRegex = /```json\s*([\s\S]*?)\s*```/; // Regex to find ```json ... ```
+            const match = rawResponseText.match(jsonRegex);
+            if (match && match[1]) {
+                try {
+                    const parsed = JSON.parse(match[1]);
+                    console.info("Successfully extracted and parsed JSON from markdown code block.");
+                    return parsed;
+                } catch (e2) {
+                    console.error("Failed to parse extracted JSON:", e2);
+                }
+            }
+            return null;
+        }
+    }
+
+    // Function to present the complete reply: explanation + actionable plans when it is structured JSON.
+    // messageContent is the bubble the reply was streamed into (null if nothing was shown yet).
+    function handleCompleteResponse(rawResponseText, messageContent) {
+        const llmResponse = parseStructuredResponse(rawResponseText);
+
+        if (llmResponse && llmResponse.overall_explanation) {
+            // Display explanation in chat (replacing the streamed raw JSON)
+            if (messageContent) {
+                renderBotMessage(messageContent, llmResponse.overall_explanation);
+            } else {
+                addMessage(llmResponse.overall_explanation, false);
+            }
+
+            // Log the actionable_plans to inspect their structure
+            console.log("Parsed actionable_plans from LLM:", llmResponse.actionable_plans);
+
+            if (llmResponse.actionable_plans && window.displayActionablePlans) {
+                window.displayActionablePlans(llmResponse.actionable_plans);
+            } else {
+                // If plans are expected but missing in valid JSON, inform the user or log
+                console.warn("Actionable plans missing or displayActionablePlans function not available.");
+                addMessage("AI provided an explanation, but no actionable plans were found or could be displayed.", false);
+            }
+        } else if (messageContent) {
+            // Free-form (non-JSON) reply: it has already been rendered as it streamed in
+            console.info("LLM reply is not structured JSON; keeping the streamed text.");
+        } else {
+            // If llmResponse is null or doesn't have the expected structure
+            console.error("Failed to parse LLM response as valid JSON or JSON structure is incorrect.");
+            console.error("Raw LLM response received:", rawResponseText);
+            // Display a user-friendly message and the raw response for debugging.
+            // The addMessage function will use marked.parse, so if the raw response is Markdown, it will render.
+            addMessage("The AI's response could not be fully processed into the expected format. Displaying raw response:\n\n" + rawResponseText, false);
+        }
+    }
+
+    // Function to send a message through the non-streaming endpoint (browsers without fetch streams)
+    async function sendMessageBuffered(message) {
+        const response = await fetch('/mpcdc/chat', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ message: message, session_id: chatSessionId })
+        });
+
+        const data = await response.json();
+        removeLoading();
+        rememberSessionId(data.session_id);
+
+        if (data.error) {
+            addMessage(`Error: ${data.error}`, false);
+        } else {
+            handleCompleteResponse(data.response, null);
+        }
+    }
+
+    // Function to send message to the server and render the reply as it streams in (Server-Sent Events)
     async function sendMessage(message) {
         try {
             showLoading();
-            
-            const response = await fetch('/mpcdc/chat', {
+
+            if (!window.ReadableStream || !window.TextDecoder) {
+                await sendMessageBuffered(message);
+                return;
+            }
+
+            const response = await fetch('/mpcdc/chat/stream', {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json'
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
                 },
-                body: JSON.stringify({ message: message })
+                body: JSON.stringify({ message: message, session_id: chatSessionId })
             });
-            
-            const data = await response.json();
-            
-            removeLoading();
-            
-            if (data.error) {
-                addMessage(`Error: ${data.error}`, false);
-            } else {
-                // Attempt to parse the response as JSON, with more robust extraction
-                let llmResponse;
-                let rawResponseText = data.response;
 
-                try {
-                    // First, try direct parsing
-                    llmResponse = JSON.parse(rawResponseText);
-                } catch (e) {
-                    // If direct parsing fails, try to extract JSON from within markdown code blocks
-                    console.warn("Direct JSON.parse failed. Attempting to extract JSON from markdown code block.", e);
-                    const jsonRegex = /```json\s*([\s\S]*?)\s*```/; // Regex to find ```json ... ```
-                    const match = rawResponseText.match(jsonRegex);
-                    if (match && match[1]) {
-                        try {
-                            llmResponse = JSON.parse(match[1]);
-                            console.info("Successfully extracted and parsed JSON from markdown code block.");
-                        } catch (e2) {
-                            console.error("Failed to parse extracted JSON:", e2);
-                            llmResponse = null; // Ensure llmResponse is null if extraction parsing fails
-                        }
-                    } else {
-                        llmResponse = null; // Ensure llmResponse is null if no JSON block found
-                    }
+            if (!response.ok || !response.body) {
+                removeLoading();
+                const data = await response.json().catch(() => ({}));
+                addMessage(`Error: ${data.error || response.statusText}`, false);
+                return;
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let rawResponseText = '';
+            let messageContent = null;
+            let finished = false;
+
+            while (!finished) {
+                const { value, done } = await reader.read();
+                if (done) {
+                    break;
                 }
+                buffer += decoder.decode(value, { stream: true });
 
-                if (llmResponse && llmResponse.overall_explanation) {
-                    addMessage(llmResponse.overall_explanation, false); // Display explanation in chat
+                // SSE events are separated by a blank line; keep any partial event in the buffer
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
 
-                    // Log the actionable_plans to inspect their structure
-                    console.log("Parsed actionable_plans from LLM:", llmResponse.actionable_plans);
+                for (const rawEvent of events) {
+                    const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+                    if (!dataLine) {
+                        continue;
+                    }
+                    const event = JSON.parse(dataLine.slice(6));
 
-                    if (llmResponse.actionable_plans && window.displayActionablePlans) {
-                        window.displayActionablePlans(llmResponse.actionable_plans);
-                    } else {
-                        // If plans are expected but missing in valid JSON, inform the user or log
-                        console.warn("Actionable plans missing or displayActionablePlans function not available.");
-                        addMessage("AI provided an explanation, but no actionable plans were found or could be displayed.", false);
+                    if (event.type === 'session') {
+                        rememberSessionId(event.session_id);
+                    } else if (event.type === 'chunk') {
+                        rawResponseText += event.text;
+                        if (!messageContent) {
+                            // First token: replace the loading indicator with the reply bubble
+                            removeLoading();
+                            messageContent = addMessage('', false);
+                        }
+                        renderBotMessage(messageContent, rawResponseText);
+                    } else if (event.type === 'error') {
+                        removeLoading();
+                        addMessage(`Error: ${event.message}`, false);
+                        finished = true;
+                    } else if (event.type === 'done') {
+                        finished = true;
                     }
-                } else {
-                    // If llmResponse is null or doesn't have the expected structure
-                    console.error("Failed to parse LLM response as valid JSON or JSON structure is incorrect.");
-                    console.error("Raw LLM response received:", rawResponseText);
-                    // Display a user-friendly message and the raw response for debugging.
-                    // The addMessage function will use marked.parse, so if the raw response is Markdown, it will render.
-                    addMessage("The AI's response could not be fully processed into the expected format. Displaying raw response:\n\n" + rawResponseText, false);
                 }
             }
+
+            removeLoading();
+            if (rawResponseText) {
+                handleCompleteResponse(rawResponseText, messageContent);
+            }
         } catch (error) {
             removeLoading();
             addMessage(`Error: ${error.message}`, false);
         }
     }
 
-    // Expose sendMessage function globally
+    // Function to show a risk assessment produced by /mpcdc/classify_change?assess=true
+    function showRiskAssessment(assessment, sessionId) {
+        rememberSessionId(sessionId);
+        handleCompleteResponse(JSON.stringify(assessment), null);
+    }
+
+    // Expose sendMessage and showRiskAssessment functions globally
     window.sendChatbotMessage = sendMessage;
+    window.showRiskAssessment = showRiskAssessment;
 
     // Event listener for send button
     sendButton.addEventListener('click', function() {
@@ -0,0 +1,49 @@
+"""
+Environment of the offline test suite.
+
+mpcdc.config reads its settings once, when it is first imported, so the stub regression endpoint
+is started and the settings the tests rely on are set here, before any test module imports the
+package or the apps. Settings read at call time (e.g. MPCDC_SINGLE_FLIGHT) are patched per test
+with monkeypatch.
+"""
+import logging
+import os
+
+import pytest
+
+from .support import StubEndpoint
+
+# Small limits and timeouts, so overload and failure scenarios play out in about a second
+READ_TIMEOUT = 0.5
+QUEUE_TIMEOUT = 0.3
+OPEN_SECONDS = 1.0
+MAX_IN_FLIGHT = 4
+MAX_QUEUE = 4
+
+STUB_ENDPOINT = StubEndpoint(hang_seconds=READ_TIMEOUT * 10)
+
+os.environ.update({
+    "MPCDC_REGRESSION_ENDPOINT": STUB_ENDPOINT.url, "DATABRICKS_TOKEN": "stub", "GENAI_API_KEY": "",
+    "PREDICTION_CACHE_SIZE": "0", "PREDICTION_BACKEND_MODE": "remote", "EQUIVALENCE_RELOAD_INTERVAL": "0",
+    "DATABRICKS_READ_TIMEOUT": str(READ_TIMEOUT), "DATABRICKS_MAX_RETRIES": "0", "DATABRICKS_POOL_SIZE": "32",
+    "MPCDC_MAX_IN_FLIGHT": str(MAX_IN_FLIGHT), "MPCDC_MAX_QUEUE": str(MAX_QUEUE),
+    "MPCDC_QUEUE_TIMEOUT": str(QUEUE_TIMEOUT), "MPCDC_BREAKER_OPEN_SECONDS": str(OPEN_SECONDS),
+    "MPCDC_BREAKER_WINDOW": "10", "MPCDC_BREAKER_MIN_CALLS": "5",
+    # One endpoint call per request, so that calls can be counted
+    "MPCDC_MICRO_BATCH_SIZE": "1",
+})
+
+
+@pytest.fixture
+def stub_endpoint():
+    """The stub regression endpoint, healthy again after the test."""
+    yield STUB_ENDPOINT
+    STUB_ENDPOINT.reset()
+
+
+@pytest.fixture(scope="session")
+def web():
+    """The Flask app module (app.py), imported with the test environment."""
+    logging.disable(logging.CRITICAL)  # failed calls and missing labels log errors on purpose
+    import app
+    return app
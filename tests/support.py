@@ -0,0 +1,155 @@
+"""
+Stand-ins shared by the offline tests (and the benchmarks that time the same code paths).
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from mpcdc.local_model import TreeEnsembleModel
+
+# A change with a few mapped and unmapped labels, posted by the classification tests
+CHANGE = {
+    "f01_chr_serviceid": "SERVEI-001", "serviceci": "CI-001", "ASORG": "ORG", "ASGRP": "GRP",
+    "categorization_tier_1": "INFRAESTRUCTURA", "change_request_status": 1,
+}
+
+
+def synthetic_forest(n_trees, depth, n_features, seed=7):
+    """Random complete binary trees with integer-ish thresholds like StringIndexer indices."""
+    rng = np.random.default_rng(seed)
+    feature, threshold, left, right, value, roots = [], [], [], [], [], []
+    for _ in range(n_trees):
+        roots.append(len(feature))
+        # Breadth-first layout of a complete tree: children of node i are at 2i+1 and 2i+2
+        n_nodes = 2 ** (depth + 1) - 1
+        base = len(feature)
+        for i in range(n_nodes):
+            if 2 * i + 1 < n_nodes:
+                feature.append(int(rng.integers(n_features)))
+                threshold.append(float(rng.integers(0, 50)) + 0.5)
+                left.append(base + 2 * i + 1)
+                right.append(base + 2 * i + 2)
+                value.append(0.0)
+            else:
+                feature.append(-1)
+                threshold.append(0.0)
+                left.append(-1)
+                right.append(-1)
+                value.append(float(rng.random()))
+    return TreeEnsembleModel(feature, threshold, left, right, value, roots, n_features)
+
+
+def reference_proba(model, vector):
+    """Mean leaf value of a vector, walking the node arrays directly."""
+    total = 0.0
+    for root in model.roots:
+        node = root
+        while model.left[node] >= 0:
+            node = model.left[node] if vector[model.feature[node]] <= model.threshold[node] else model.right[node]
+        total += model.value[node]
+    return total / model.n_trees
+
+
+class StubEndpoint:
+    """
+    Regression endpoint stand-in on localhost, answering one prediction per row. `mode` is
+    "healthy" (answers after `latency`), "failing" (HTTP 500), "rejecting" (HTTP 400, as for a
+    malformed request) or "hanging" (answers after `hang_seconds`, beyond the client's read timeout).
+    """
+
+    def __init__(self, latency=0.02, hang_seconds=5.0):
+        self.latency = latency
+        self.hang_seconds = hang_seconds
+        self.mode = "healthy"
+        self.calls = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stub.calls += 1
+                if stub.mode in ("failing", "rejecting"):
+                    self.send_response(500 if stub.mode == "failing" else 400)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                time.sleep(stub.hang_seconds if stub.mode == "hanging" else stub.latency)
+                payload = json.dumps({"predictions": [1.0] * len(body["dataframe_split"]["data"])}).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except OSError:
+                    pass  # the client gave up (read timeout)
+
+            def log_message(self, *args):
+                pass
+
+        ThreadingHTTPServer.request_queue_size = 256
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/invocations"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self, latency=0.02):
+        self.mode = "healthy"
+        self.latency = latency
+
+
+class StubHost:
+    """
+    One local web host for the ASTRA search tests: GET serves a result page with `page_headers`
+    (answering 304 to a matching If-None-Match / If-Modified-Since), POST serves search `results`
+    like Serper.dev. Counts the requests it gets.
+    """
+
+    def __init__(self, latency=0.0, page_headers=None, results=None):
+        self.requests = 0
+        self.not_modified = 0
+        page_headers = page_headers or {}
+        host = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                host.requests += 1
+                time.sleep(latency)
+                etag, last_modified = page_headers.get("ETag"), page_headers.get("Last-Modified")
+                if (etag and self.headers.get("If-None-Match") == etag) or \
+                        (last_modified and self.headers.get("If-Modified-Since") == last_modified):
+                    host.not_modified += 1
+                    self.send_response(304)
+                    for name, value in page_headers.items():
+                        self.send_header(name, value)
+                    self.end_headers()
+                    return
+                self.reply(b"<html><head><title>Page</title><script>skip()</script></head>"
+                           b"<body><p>Change window guidance for " + self.path.encode() + b".</p></body></html>",
+                           "text/html; charset=utf-8", page_headers)
+
+            def do_POST(self):
+                host.requests += 1
+                self.rfile.read(int(self.headers["Content-Length"]))
+                time.sleep(latency)
+                self.reply(json.dumps({"organic": results or []}).encode(), "application/json", {})
+
+            def reply(self, body, content_type, headers):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
@@ -0,0 +1,138 @@
+"""
+On-disk web cache of the ASTRA assistant (astra_cache.py) and its use by astra_search.py, against
+stub search and page hosts whose responses carry different caching headers.
+"""
+import time
+
+import pytest
+
+import astra_search
+from astra_cache import WebCache, freshness_lifetime, normalize_query
+
+from .support import StubHost
+
+# Caching headers of each stub page
+PAGES = {
+    "fresh": {"Cache-Control": "max-age=3600"},
+    "default": {},
+    "etag": {"Cache-Control": "max-age=0", "ETag": '"v1"'},
+    "last_modified": {"Cache-Control": "no-cache", "Last-Modified": "Tue, 01 Sep 2026 10:00:00 GMT"},
+    "no_store": {"Cache-Control": "no-store"},
+}
+
+
+@pytest.mark.parametrize("headers, lifetime", [
+    ({}, 3600.0),
+    ({"Cache-Control": "public, max-age=120"}, 120.0),
+    ({"Cache-Control": 'max-age="60"'}, 60.0),
+    ({"Cache-Control": "max-age=abc"}, 0.0),
+    ({"Cache-Control": "no-cache"}, 0.0),
+    ({"Cache-Control": "no-store, max-age=60"}, None),
+    ({"Expires": "Tue, 01 Sep 2026 11:00:00 GMT", "Date": "Tue, 01 Sep 2026 10:00:00 GMT"}, 3600.0),
+    ({"Expires": "0"}, 0.0),
+])
+def test_freshness_lifetime(headers, lifetime):
+    assert freshness_lifetime(headers, 3600.0) == lifetime
+
+
+def test_queries_differing_in_case_and_spacing_share_a_key():
+    assert normalize_query("  CAB  change\tfreeze ") == normalize_query("cab change freeze")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return WebCache(str(tmp_path / "web_cache.sqlite"))
+
+
+@pytest.fixture
+def hosts(monkeypatch, cache):
+    """Stub pages and a search API listing them, wired into astra_search with `cache`."""
+    pages = {name: StubHost(page_headers=headers) for name, headers in PAGES.items()}
+    search_api = StubHost(results=[{"title": name, "link": host.url + name} for name, host in pages.items()])
+    monkeypatch.setattr(astra_search, "SEARCH_URL", search_api.url + "search")
+    monkeypatch.setattr(astra_search, "get_web_cache", lambda: cache)
+    return pages, search_api
+
+
+def search(hosts, query):
+    """(context entries, search API calls, names of the pages requested) of one search."""
+    pages, search_api = hosts
+    counts = {name: host.requests for name, host in pages.items()}
+    searches = search_api.requests
+    results = astra_search.web_search_with_scraping(query)
+    return results, search_api.requests - searches, {name for name, host in pages.items() if host.requests > counts[name]}
+
+
+def test_repeat_search_is_served_from_the_cache(hosts):
+    pages, _ = hosts
+    first, searches, fetched = search(hosts, "CAB change freeze")
+    assert searches == 1 and fetched == set(PAGES)
+    assert all("Change window guidance" in entry for entry in first)
+
+    repeat, searches, fetched = search(hosts, "  cab CHANGE   freeze ")
+    assert repeat == first
+    assert searches == 0, "the search API is not called again"
+    assert fetched == {"etag", "last_modified", "no_store"}, "only stale and uncacheable pages are requested"
+    assert pages["etag"].not_modified == 1 and pages["last_modified"].not_modified == 1, "stale pages are revalidated"
+
+
+def test_fully_cached_search_makes_no_request(hosts, cache, monkeypatch):
+    pages, _ = hosts
+    # Without the pages that must be revalidated, a repeat search needs no request at all
+    cached = {name: host for name, host in pages.items() if name in ("fresh", "default")}
+    only_cached = StubHost(results=[{"title": name, "link": host.url + name} for name, host in cached.items()])
+    monkeypatch.setattr(astra_search, "SEARCH_URL", only_cached.url + "search")
+    search(hosts, "cached pages only")
+
+    start = time.perf_counter()
+    results, searches, fetched = search(hosts, "cached pages only")
+    assert time.perf_counter() - start < 0.05
+    assert only_cached.requests == 1 and not fetched and len(results) == 2
+    assert cache.stats()["hits"] >= 3
+
+
+def test_failed_search_is_not_cached(monkeypatch, cache):
+    monkeypatch.setattr(astra_search, "SEARCH_URL", "http://127.0.0.1:9/search")  # nothing listens there
+    monkeypatch.setattr(astra_search, "get_web_cache", lambda: cache)
+    assert astra_search.web_search_with_scraping("anything")[0].startswith("Search failed")
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = WebCache(str(tmp_path / "small.sqlite"), max_entries=50)
+    for i in range(128):
+        cache.set("page", f"http://example.test/{i}", "snippet", 3600)
+    assert cache.stats()["entries"] <= 50 + 63 and cache.evictions > 0
+    assert cache.get("page", "http://example.test/127") is not None, "recent entries are kept"
+    assert cache.get("page", "http://example.test/0") is None, "the least recently used entries go first"
+
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    cache = WebCache(str(tmp_path / "short.sqlite"), ttl=0.2)
+    cache.set("page", "http://example.test/", "snippet", 3600)
+    entry = cache.get("page", "http://example.test/")
+    assert entry.fresh and entry.value == "snippet"
+    time.sleep(0.25)
+    assert cache.get("page", "http://example.test/") is None, "a long freshness lifetime does not outlive the TTL"
+
+
+def test_refresh_makes_a_stale_entry_fresh(cache):
+    cache.set("page", "http://example.test/", "snippet", 0, etag='"v1"')
+    entry = cache.get("page", "http://example.test/")
+    assert not entry.fresh and entry.validators() == {"If-None-Match": '"v1"'}
+    cache.refresh("page", "http://example.test/", 60)
+    assert cache.get("page", "http://example.test/").fresh
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_no_store_responses_are_not_kept(cache):
+    cache.set("search", "query", "[]", None)
+    assert cache.get("search", "query") is None
+
+
+def test_a_broken_cache_file_counts_as_a_miss(tmp_path):
+    path = tmp_path / "broken.sqlite"
+    cache = WebCache(str(path))
+    cache._connection().execute("DROP TABLE web_cache")
+    assert cache.get("page", "http://example.test/") is None
+    cache.set("page", "http://example.test/", "snippet", 60)  # logged, not raised
@@ -0,0 +1,39 @@
+"""
+Per-host spacing of the ASTRA assistant's page fetches (astra_search.HostGate).
+"""
+import threading
+import time
+
+import pytest
+
+from astra_search import HostGate
+
+
+def test_requests_to_one_host_are_spaced():
+    gate = HostGate(min_interval=0.05)
+    times = [gate.run("http://a.example/1", time.monotonic), gate.run("http://A.example/2", time.monotonic)]
+    assert times[1] - times[0] >= 0.05
+
+
+def test_idle_hosts_are_forgotten():
+    gate = HostGate(min_interval=0.01)
+    for i in range(50):
+        gate.run(f"http://host{i}.example/", lambda: None)
+    time.sleep(0.02)
+    gate.run("http://last.example/", lambda: None)
+    assert len(gate) == 1
+
+
+def test_a_request_behind_a_hanging_one_gives_up_at_its_deadline():
+    gate = HostGate(min_interval=0.0)
+    release = threading.Event()
+    holder = threading.Thread(target=gate.run, args=("http://slow.example/a", release.wait))
+    holder.start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        gate.run("http://slow.example/b", lambda: None, deadline=start + 0.1)
+    assert time.monotonic() - start < 0.5
+    release.set()
+    holder.join()
+    assert gate.run("http://slow.example/c", lambda: "ok", deadline=time.monotonic() + 1) == "ok"
@@ -0,0 +1,74 @@
+"""
+Batch classification: parsing of the request body (parse_change_batch), per-row results of
+classify_rows and the /mpcdc/classify_changes route against the stub endpoint.
+"""
+import json
+
+import pytest
+
+from mpcdc import config
+from mpcdc.classifier import parse_change_batch
+
+from .support import CHANGE
+
+# Service IDs of the equivalence map, so these changes get distinct feature vectors
+FIRST = {**CHANGE, "f01_chr_serviceid": "ST.APP.02516", "infrastructure_change_id": "CRQ-1"}
+SECOND = {**CHANGE, "f01_chr_serviceid": "ST.APP.01889", "infrastructure_change_id": "CRQ-2"}
+
+
+def test_json_arrays_and_ndjson_bodies_give_one_row_per_change():
+    assert parse_change_batch(json.dumps([FIRST, 42, SECOND]), "application/json") == [
+        (FIRST, None), (None, "Row is not a JSON object"), (SECOND, None)]
+
+    rows = parse_change_batch(f"{json.dumps(FIRST)}\n\n{{not json\n[1]\n{json.dumps(SECOND)}\n", "application/x-ndjson")
+    assert [record for record, _ in rows] == [FIRST, None, None, SECOND], "blank lines are skipped"
+    assert rows[1][1].startswith("Invalid JSON") and rows[2][1] == "Row is not a JSON object"
+    # NDJSON is recognized without its content type too
+    assert parse_change_batch(f"{json.dumps(FIRST)}\n{json.dumps(SECOND)}", "application/json") == [(FIRST, None), (SECOND, None)]
+
+
+@pytest.mark.parametrize("body", ['{"a": 1}', "not json", ""])
+def test_bodies_that_are_not_batches_are_refused(body):
+    with pytest.raises(ValueError):
+        parse_change_batch(body, "application/json")
+
+
+def test_batch_route_reports_each_row_in_input_order(web, stub_endpoint, monkeypatch):
+    monkeypatch.setattr(config, "MPCDC_BATCH_CHUNK_SIZE", 1)
+    client = web.app.test_client()
+    calls = stub_endpoint.calls
+    body = "\n".join([json.dumps(FIRST), "{broken", json.dumps(SECOND), '"text"', json.dumps(FIRST)])
+    response = client.post("/mpcdc/classify_changes", data=body, content_type="application/x-ndjson")
+
+    assert response.status_code == 200
+    answer = response.get_json()
+    results = answer["results"]
+    assert [result["index"] for result in results] == [0, 1, 2, 3, 4]
+    assert [result["status"] for result in results] == ["success", "error", "success", "error", "success"]
+    assert [result.get("infrastructure_change_id") for result in results] == ["CRQ-1", None, "CRQ-2", None, "CRQ-1"]
+    assert results[1]["message"].startswith("Invalid JSON") and results[3]["message"] == "Row is not a JSON object"
+    assert results[0]["predicted_label"] == results[4]["predicted_label"] == "P1"
+    assert answer["status"] == "partial"
+    assert answer["summary"] == {"total": 5, "succeeded": 3, "failed": 2, "endpoint_calls": 2}
+    assert stub_endpoint.calls - calls == 2, "the repeated change is sent once"
+
+
+def test_batch_route_keeps_row_errors_when_the_endpoint_fails(web, stub_endpoint):
+    stub_endpoint.mode = "rejecting"
+    client = web.app.test_client()
+    response = client.post("/mpcdc/classify_changes", json=[FIRST, None, SECOND])
+
+    answer = response.get_json()
+    assert response.status_code == 200 and answer["status"] == "error"
+    assert [result["index"] for result in answer["results"]] == [0, 1, 2]
+    assert all(result["status"] == "error" for result in answer["results"])
+    assert answer["results"][1]["message"] == "Row is not a JSON object"
+    assert answer["results"][0]["message"] == answer["results"][2]["message"] != "Row is not a JSON object"
+
+
+def test_batch_route_refuses_empty_and_oversized_batches(web, monkeypatch):
+    client = web.app.test_client()
+    assert client.post("/mpcdc/classify_changes", json=[]).status_code == 400
+    assert client.post("/mpcdc/classify_changes", data="{}", content_type="application/json").status_code == 400
+    monkeypatch.setattr(config, "MPCDC_BATCH_MAX_ROWS", 2)
+    assert client.post("/mpcdc/classify_changes", json=[FIRST, SECOND, FIRST]).status_code == 413
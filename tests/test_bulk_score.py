@@ -0,0 +1,62 @@
+"""Offline bulk scoring (mpcdc/bulk_score.py): an interrupted run resumed from its checkpoint."""
+import csv
+import json
+
+from mpcdc import bulk_score, classifier, config
+
+from .support import CHANGE
+
+N_ROWS = 11
+CHUNK_SIZE = 2
+FAILING_CHUNK = 3
+
+
+def write_input(path):
+    columns = list(config.MODEL_INPUT_FEATURES) + [bulk_score.ID_COLUMN]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for row in range(N_ROWS):
+            writer.writerow({**CHANGE, bulk_score.ID_COLUMN: f"CRQ-{row}"})
+
+
+def test_resumed_run_writes_every_row_once_in_order(web, stub_endpoint, monkeypatch, tmp_path):
+    input_path, output_path = str(tmp_path / "changes.csv"), str(tmp_path / "scored.csv")
+    write_input(input_path)
+    arguments = [input_path, "-o", output_path, "--chunk-size", str(CHUNK_SIZE), "--parallelism", "2"]
+
+    # The first run stops at a chunk, as if the process had been killed there
+    classify_rows = classifier.classify_rows
+
+    def interrupted(rows, batch_size=None):
+        if rows[0][0][bulk_score.ID_COLUMN] == f"CRQ-{FAILING_CHUNK * CHUNK_SIZE}":
+            raise RuntimeError("interrupted")
+        return classify_rows(rows, batch_size)
+
+    monkeypatch.setattr(classifier, "classify_rows", interrupted)
+    assert bulk_score.main(arguments) == 1
+    with open(bulk_score.checkpoint_path(output_path)) as f:
+        checkpoint = json.load(f)
+    assert checkpoint["rows_done"] == FAILING_CHUNK * CHUNK_SIZE and not checkpoint["complete"]
+    # Bytes written after the last checkpoint (a chunk cut short by the crash) are dropped on resume
+    with open(output_path, "a") as f:
+        f.write("6,CRQ-6,succ")
+
+    monkeypatch.setattr(classifier, "classify_rows", classify_rows)
+    calls = stub_endpoint.calls
+    assert bulk_score.main(arguments + ["--resume"]) == 0
+    remaining_chunks = -(-(N_ROWS - FAILING_CHUNK * CHUNK_SIZE) // CHUNK_SIZE)
+    assert stub_endpoint.calls - calls == remaining_chunks, "the chunks written before the interruption are not scored again"
+
+    with open(output_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["row"] for row in rows] == [str(row) for row in range(N_ROWS)]
+    assert [row[bulk_score.ID_COLUMN] for row in rows] == [f"CRQ-{row}" for row in range(N_ROWS)]
+    assert all(row["status"] == "success" for row in rows)
+    with open(bulk_score.checkpoint_path(output_path)) as f:
+        checkpoint = json.load(f)
+    assert checkpoint["complete"] and checkpoint["rows_done"] == N_ROWS and checkpoint["succeeded"] == N_ROWS
+
+    assert bulk_score.main(arguments + ["--resume"]) == 0, "a complete output is left as it is"
+    with open(output_path, newline="") as f:
+        assert len(list(csv.DictReader(f))) == N_ROWS
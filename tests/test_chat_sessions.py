@@ -0,0 +1,60 @@
+"""
+Chat sessions (mpcdc/chat_sessions.py): atomic appends across workers and the summary fold.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from mpcdc.chat_sessions import ChatSessionManager, MemorySessionStore, SqliteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def stores(request, tmp_path):
+    """Two stores over the same sessions: one memory store, or two workers' handles on one sqlite file."""
+    if request.param == "memory":
+        store = MemorySessionStore()
+        return store, store
+    path = str(tmp_path / "chat_sessions.sqlite")
+    return SqliteSessionStore(path), SqliteSessionStore(path)
+
+
+def test_concurrent_exchanges_of_one_conversation_are_all_kept(stores):
+    workers = [ChatSessionManager(store, max_turns=100) for store in stores]
+
+    def record(i):
+        workers[i % 2].record("session-0001", f"question {i}", f"answer {i}")
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(record, range(40)))
+    turns = stores[0].get("session-0001")["turns"]
+    assert sorted(turn["text"] for turn in turns if turn["role"] == "user") == sorted(f"question {i}" for i in range(40))
+
+
+def test_the_summarizer_runs_outside_the_store_update(stores):
+    summarizing = threading.Event()
+    finish = threading.Event()
+
+    def summarize(summary, dropped):
+        return " / ".join(filter(None, [summary] + [turn["text"] for turn in dropped]))
+
+    def slow_summarizer(summary, dropped):
+        summarizing.set()
+        assert finish.wait(5), "another request of the conversation was blocked by the summary"
+        return summarize(summary, dropped)
+
+    slow = ChatSessionManager(stores[0], max_turns=1, summarizer=slow_summarizer)
+    other = ChatSessionManager(stores[1], max_turns=1, summarizer=summarize)
+    slow.record("session-0002", "q1", "a1")
+    folding = threading.Thread(target=slow.record, args=("session-0002", "q2", "a2"))
+    folding.start()
+    assert summarizing.wait(5)
+    other.record("session-0002", "q3", "a3")  # would wait for the summary if it held a lock
+    finish.set()
+    folding.join()
+
+    # The second request folded every dropped turn; the slow summary found them folded and was discarded
+    session = stores[0].get("session-0002")
+    assert session["summary"] == "q1 / a1 / q2 / a2"
+    assert session["turns"] == [{"role": "user", "text": "q3"}, {"role": "model", "text": "a3"}]
+    assert session["unsummarized"] == []
@@ -0,0 +1,185 @@
+"""
+Circuit breaker and load shedding around the regression endpoint (mpcdc/circuit_breaker.py),
+on their own and through POST /mpcdc/classify_change against the stub endpoint.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from mpcdc import config
+from mpcdc.circuit_breaker import (
+    CLOSED, HALF_OPEN, OPEN, AsyncConcurrencyLimiter, CallRejected, CircuitBreaker, ConcurrencyLimiter
+)
+
+from .conftest import MAX_IN_FLIGHT, MAX_QUEUE, OPEN_SECONDS, QUEUE_TIMEOUT, READ_TIMEOUT
+from .support import CHANGE
+
+
+def record_calls(breaker, outcomes, duration=0.01):
+    for ok in outcomes:
+        breaker.before_call()
+        breaker.record(ok, duration)
+
+
+def test_breaker_opens_on_the_failure_rate_once_min_calls_are_seen():
+    breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=4, open_seconds=60)
+    record_calls(breaker, [False, False, False])
+    assert breaker.state == CLOSED, "fewer than min_calls calls never open the circuit"
+    record_calls(breaker, [True])
+    assert breaker.state == OPEN
+    with pytest.raises(CallRejected) as rejected:
+        breaker.before_call()
+    assert rejected.value.reason == "circuit_open" and rejected.value.retry_after >= 59
+    assert breaker.rejected == 1
+
+
+def test_breaker_opens_on_the_slow_call_rate():
+    breaker = CircuitBreaker(slow_call_seconds=0.1, slow_call_rate=0.5, window=4, min_calls=4, open_seconds=60)
+    record_calls(breaker, [True, True], duration=0.01)
+    record_calls(breaker, [True, True], duration=0.2)
+    assert breaker.state == OPEN
+
+
+def test_half_open_probe_closes_or_reopens_the_circuit():
+    breaker = CircuitBreaker(window=4, min_calls=2, open_seconds=0.05, half_open_probes=1)
+    record_calls(breaker, [False, False])
+    assert breaker.state == OPEN
+    time.sleep(0.06)
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    with pytest.raises(CallRejected):
+        breaker.before_call()  # only one probe at a time
+    breaker.record(False, 0.01)
+    assert breaker.state == OPEN, "a failed probe reopens the circuit"
+
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
+    assert breaker.transitions == {OPEN: 2, HALF_OPEN: 2, CLOSED: 1}
+
+
+def test_limiter_queues_then_sheds():
+    limiter = ConcurrencyLimiter(max_in_flight=1, max_queue=1, queue_timeout=0.1)
+    limiter.acquire()
+    with pytest.raises(CallRejected) as rejected:
+        limiter.acquire()  # waits in the queue, times out
+    assert rejected.value.reason == "queue_timeout"
+
+    queued = threading.Thread(target=lambda: pytest.raises(CallRejected, limiter.acquire))
+    queued.start()
+    time.sleep(0.02)
+    with pytest.raises(CallRejected) as rejected:
+        limiter.acquire()  # the queue is taken
+    assert rejected.value.reason == "queue_full"
+    queued.join()
+    limiter.release()
+    limiter.acquire()
+    assert limiter.stats()["in_flight"] == 1 and limiter.stats()["shed"] == {"queue_timeout": 2, "queue_full": 1}
+
+
+def test_async_limiter_hands_a_released_slot_to_a_queued_caller():
+    async def scenario():
+        limiter = AsyncConcurrencyLimiter(max_in_flight=1, max_queue=1, queue_timeout=1.0)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        with pytest.raises(CallRejected):
+            await limiter.acquire()
+        limiter.release()
+        await waiter
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["in_flight"] == 1 and stats["shed"] == {"queue_full": 1}
+
+
+def run_phase(client, requests, concurrency):
+    """Posts `requests` changes from `concurrency` threads; returns [(status, latency, Retry-After)]."""
+    def post(_):
+        start = time.perf_counter()
+        response = client.post("/mpcdc/classify_change", json=CHANGE)
+        return response.status_code, time.perf_counter() - start, response.headers.get("Retry-After")
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(post, range(requests)))
+
+
+def statuses(results):
+    counts = {}
+    for status, _, _ in results:
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def test_classify_route_sheds_load_opens_and_recovers(web, stub_endpoint, monkeypatch):
+    # Every request sends the same change: without this they would share one endpoint call
+    monkeypatch.setattr(config, "MPCDC_SINGLE_FLIGHT", False)
+    from mpcdc import classifier
+    client = web.app.test_client()
+    breaker = classifier.get_regression_breaker()
+    requests = 60
+    bound = READ_TIMEOUT + QUEUE_TIMEOUT + 0.5  # connect + scheduling slack
+
+    assert statuses(run_phase(client, requests, MAX_IN_FLIGHT)) == {200: requests}
+    assert breaker.state == CLOSED
+
+    # Slower than the queue timeout: callers beyond the in-flight limit and the queue are shed
+    stub_endpoint.latency = QUEUE_TIMEOUT
+    results = run_phase(client, requests, 2 * (MAX_IN_FLIGHT + MAX_QUEUE))
+    assert statuses(results).get(503) and statuses(results).get(200)
+    assert all(retry for status, _, retry in results if status == 503), "shed requests carry Retry-After"
+    assert breaker.state == CLOSED, "shedding does not count against the circuit"
+    stub_endpoint.latency = 0.02
+
+    for mode in ("failing", "hanging"):
+        stub_endpoint.mode = mode
+        calls = stub_endpoint.calls
+        results = run_phase(client, requests, 16)
+        counts = statuses(results)
+        # Calls admitted before the circuit opened fail with the endpoint's 502
+        assert set(counts) <= {502, 503} and counts.get(503), f"{mode}: {counts}"
+        assert all(retry for status, _, retry in results if status == 503), f"{mode}: 503 responses carry Retry-After"
+        assert breaker.state == OPEN
+        assert stub_endpoint.calls - calls < requests / 2, f"{mode}: most requests never reach the endpoint"
+        assert max(latency for _, latency, _ in results) < bound, f"{mode}: the tail stays within the timeouts"
+        time.sleep(OPEN_SECONDS)  # the next phase starts with a probe
+
+    stub_endpoint.mode = "healthy"
+    time.sleep(OPEN_SECONDS)
+    assert statuses(run_phase(client, requests, 16)).get(200)
+    assert breaker.state == CLOSED
+
+    protection = client.get("/mpcdc/status").get_json()["regression_endpoint_protection"]
+    assert protection["circuit_breaker"]["transitions"][OPEN] >= 2 and protection["concurrency"]["shed"]
+
+
+@pytest.mark.parametrize("status_code, counted", [(None, True), (500, True), (503, True), (429, True),
+                                                  (400, False), (404, False), (422, False)])
+def test_only_endpoint_failures_count_against_the_circuit(status_code, counted):
+    from mpcdc.classifier import upstream_failure
+    assert upstream_failure(status_code) == counted
+
+
+def test_rejected_requests_do_not_open_the_circuit(web, stub_endpoint, monkeypatch):
+    monkeypatch.setattr(config, "MPCDC_SINGLE_FLIGHT", False)
+    from mpcdc import classifier
+    client = web.app.test_client()
+    breaker = classifier.get_regression_breaker()
+    if breaker.state != CLOSED:
+        time.sleep(OPEN_SECONDS)
+        run_phase(client, 1, 1)  # the probe closes it
+    assert breaker.state == CLOSED
+
+    stub_endpoint.mode = "rejecting"
+    calls = stub_endpoint.calls
+    results = run_phase(client, 20, 4)
+    assert statuses(results) == {502: 20}, "every request reaches the endpoint and gets its 400 as a 502"
+    assert stub_endpoint.calls - calls == 20
+    assert breaker.state == CLOSED
+
+    stub_endpoint.mode = "healthy"
+    assert statuses(run_phase(client, 4, 2)) == {200: 4}
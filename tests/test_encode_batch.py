@@ -0,0 +1,80 @@
+"""
+Batch encoding (FeatureEncoder.encode_batch, used by classify_rows and bulk scoring) gives the
+vectors create_feature_vector gives one change at a time, under every missing/unknown policy.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mpcdc import classifier, config
+from mpcdc.equivalence import REJECT
+
+from .support import CHANGE
+
+
+def sample_records(encoder):
+    known = {name: next(iter(encoder.tables[name])) for name in config.MODEL_INPUT_FEATURES if len(encoder.tables.get(name, {}))}
+    return [
+        known,
+        CHANGE,
+        {**known, "f01_chr_serviceid": "ST.APP.02516"},
+        {**known, "serviceci": None, "ASORG": "", "ASGRP": float("nan")},  # missing in every form
+        {name: label for name, label in known.items() if name != "categorization_tier_1"},  # absent field
+        {**known, "f01_chr_serviceid": "NOT-A-SERVICE", "serviceci": ["unhashable"]},  # unknown labels
+        {**known, "f01_chr_serviceid": " st.app.02516 "},  # resolved by the label matcher
+        {**known, "change_request_status": 1, "submit_date": "2024-03-01 10:00:00"},
+        {},
+    ]
+
+
+def vector_of(record):
+    """create_feature_vector's vector for a record, or None if the policies reject it."""
+    try:
+        return classifier.create_feature_vector(record, {}, classifier.get_feature_encoder())
+    except ValueError:
+        return None
+
+
+def same_vector(row, vector):
+    return len(row) == len(vector) and all(
+        (math.isnan(a) and math.isnan(b)) or a == b for a, b in zip(row.tolist(), vector))
+
+
+@pytest.mark.parametrize("as_frame", [False, True], ids=["records", "dataframe"])
+@pytest.mark.parametrize("missing_value, unknown_value", [(0.0, 0.0), (7.0, 9.0), (REJECT, 0.0), (0.0, REJECT), (REJECT, REJECT)])
+def test_batch_rows_match_single_change_vectors(web, monkeypatch, missing_value, unknown_value, as_frame):
+    monkeypatch.setattr(config, "MPCDC_MISSING_INDEX", missing_value)
+    monkeypatch.setattr(config, "MPCDC_UNKNOWN_INDEX", unknown_value)
+    encoder = classifier.get_feature_encoder()
+    records = sample_records(encoder)
+    if as_frame:
+        batch = pd.DataFrame.from_records(records, columns=config.MODEL_INPUT_FEATURES)
+        # A DataFrame holds an absent field as a null cell
+        records = [{name: record.get(name) for name in config.MODEL_INPUT_FEATURES} for record in records]
+    else:
+        batch = records
+
+    matrix, missing_counts, unknown_counts, rejected, _ = encoder.encode_batch(batch, missing_value, unknown_value)
+
+    expected_missing, expected_unknown = {}, {}
+    for row, record in enumerate(records):
+        vector = vector_of(record)
+        _, missing, unknown, _ = encoder.encode(record, missing_value, unknown_value)
+        for names, counts in ((missing, expected_missing), (unknown, expected_unknown)):
+            for name in names:
+                counts[name] = counts.get(name, 0) + 1
+        if vector is None:
+            assert rejected is not None and rejected[row].any(), (row, record)
+            flagged = [name for name, flag in zip(encoder.features, rejected[row]) if flag]
+            assert flagged == [name for name in encoder.features
+                               if (name in missing and missing_value == REJECT) or (name in unknown and unknown_value == REJECT)]
+            assert same_vector(matrix[row], encoder.encode(record, missing_value, unknown_value)[0])
+        else:
+            assert rejected is None or not rejected[row].any(), (row, record)
+            assert same_vector(matrix[row], vector), (row, record)
+    assert missing_counts == expected_missing and unknown_counts == expected_unknown
+    assert matrix.shape == (len(records), len(encoder.features)) and matrix.flags.c_contiguous
+    if REJECT not in (missing_value, unknown_value):
+        assert rejected is None and not np.isnan(matrix).any()
@@ -0,0 +1,108 @@
+"""
+Equivalence map snapshots (mpcdc/equivalence.py): lookups match the CSV-built tables, hash slot
+collisions are probed through, and a stale or unreadable snapshot falls back to the CSV.
+"""
+import os
+import zlib
+
+import pytest
+
+from mpcdc import config
+from mpcdc.equivalence import (
+    FeatureEncoder, SnapshotTable, _slot_count, compile_snapshot, file_sha256, load_encoder, open_snapshot,
+    read_csv_tables, source_version
+)
+
+COLUMN = "f01_chr_serviceid"
+
+
+def write_map(path, tables):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Column,Index,Label\n")
+        for column, table in tables.items():
+            f.writelines(f"{column},{index},{label}\n" for label, index in table.items())
+
+
+def assert_same_lookups(snapshot_tables, csv_tables, absent=()):
+    assert snapshot_tables.keys() == csv_tables.keys()
+    for column, table in csv_tables.items():
+        snapshot = snapshot_tables[column]
+        assert len(snapshot) == len(table)
+        assert dict(snapshot.items()) == table
+        assert list(snapshot.keys()) == sorted(table, key=lambda label: label.encode("utf-8"))
+        for label, index in table.items():
+            assert snapshot.get(label) == index, (column, label)
+        for label in absent:
+            assert snapshot.get(label) is None and label not in snapshot
+
+
+def test_snapshot_of_the_shipped_map_matches_the_csv(tmp_path):
+    snapshot_path = str(tmp_path / "map.eqsnap")
+    csv_tables = read_csv_tables(config.EQUIVALENCE_CSV_PATH)
+    assert compile_snapshot(config.EQUIVALENCE_CSV_PATH, snapshot_path) == sum(map(len, csv_tables.values()))
+    source_hash, tables = open_snapshot(snapshot_path)
+    assert source_hash == file_sha256(config.EQUIVALENCE_CSV_PATH)
+    assert_same_lookups(tables, csv_tables, absent=["", "not a label", "ST.APP.0020", "ST.APP.002066"])
+    assert tables[COLUMN].get(None) is None and tables[COLUMN].get(3.0) is None and tables[COLUMN].get(["x"]) is None
+
+
+def labels_in_slot(slot, mask, count, start=0):
+    """`count` code-like labels whose crc32 home slot is `slot`."""
+    found = []
+    number = start
+    while len(found) < count:
+        label = f"ST.APP.{number:05d}"
+        if zlib.crc32(label.encode("utf-8")) & mask == slot:
+            found.append(label)
+        number += 1
+    return found
+
+
+def test_labels_sharing_hash_slots_are_probed_through(tmp_path):
+    mask = _slot_count(16) - 1
+    # Runs of labels with the same home slot, the second one starting inside the first, and a wrap-around
+    colliding = labels_in_slot(5, mask, 6) + labels_in_slot(6, mask, 4) + labels_in_slot(mask, mask, 3)
+    labels = colliding + ["Gestión", "Gestió", "AM14-CPD1-CLOUD"]
+    assert _slot_count(len(labels)) - 1 == mask
+    csv_path, snapshot_path = str(tmp_path / "map.csv"), str(tmp_path / "map.eqsnap")
+    write_map(csv_path, {COLUMN: {label: float(position) for position, label in enumerate(labels)}})
+    compile_snapshot(csv_path, snapshot_path)
+
+    # Absent labels whose home slot is in a run must walk it to an empty slot
+    absent = labels_in_slot(5, mask, 3, start=100000) + labels_in_slot(mask, mask, 3, start=100000) + ["Gesti", "AM14-"]
+    assert_same_lookups(open_snapshot(snapshot_path)[1], read_csv_tables(csv_path), absent=absent)
+
+
+def test_a_stale_or_unreadable_snapshot_falls_back_to_the_csv(tmp_path):
+    csv_path, snapshot_path = str(tmp_path / "map.csv"), str(tmp_path / "map.eqsnap")
+    write_map(csv_path, {COLUMN: {"ST.APP.00001": 1.0, "ST.APP.00002": 2.0}})
+    compile_snapshot(csv_path, snapshot_path)
+    fresh = load_encoder(csv_path, [COLUMN], snapshot_path)
+    assert isinstance(fresh.tables[COLUMN], SnapshotTable)
+    assert fresh.version == source_version(file_sha256(csv_path))
+
+    # The CSV was edited after the snapshot was compiled
+    write_map(csv_path, {COLUMN: {"ST.APP.00001": 5.0, "ST.APP.00003": 3.0}})
+    stale = load_encoder(csv_path, [COLUMN], snapshot_path)
+    assert not isinstance(stale.tables[COLUMN], SnapshotTable)
+    assert stale.tables == read_csv_tables(csv_path) and stale.version == source_version(file_sha256(csv_path))
+    assert stale.encode({COLUMN: "ST.APP.00001"})[0] == [5.0]
+
+    with open(snapshot_path, "r+b") as f:
+        f.write(b"NOTASNAP")
+    assert load_encoder(csv_path, [COLUMN], snapshot_path).tables == read_csv_tables(csv_path)
+
+
+def test_a_snapshot_without_its_csv_is_used_unverified(tmp_path):
+    csv_path, snapshot_path = str(tmp_path / "map.csv"), str(tmp_path / "map.eqsnap")
+    write_map(csv_path, {COLUMN: {"ST.APP.00001": 1.0}})
+    compile_snapshot(csv_path, snapshot_path)
+    version = source_version(file_sha256(csv_path))
+    os.remove(csv_path)
+    encoder = load_encoder(csv_path, [COLUMN], snapshot_path)
+    assert isinstance(encoder, FeatureEncoder) and encoder.version == version
+    assert encoder.encode({COLUMN: "ST.APP.00001"})[0] == [1.0]
+
+    os.remove(snapshot_path)
+    with pytest.raises(FileNotFoundError):
+        load_encoder(csv_path, [COLUMN], snapshot_path)
@@ -0,0 +1,42 @@
+"""
+Typeahead label catalog (mpcdc/label_catalog.py): lazy per-column indexing and paging.
+"""
+from mpcdc.label_catalog import LabelCatalog
+
+TABLE = {
+    "Tramitacio electronica": 1.0,
+    "MTES - MODUL DE TRAMITACIO ELECTRONICA SEGURA": 2.0,
+    "GESTIO - TRAMITS I TRAMITACIO": 3.0,
+    "ARXIU - TRAMIT": 4.0,
+    "TRAMITS": 5.0,
+    "Registre": 6.0,
+}
+
+
+def all_pages(catalog, prefix, limit):
+    labels, offset = [], 0
+    while True:
+        page, has_more = catalog.search("serviceci", prefix, offset, limit)
+        labels += page
+        offset += len(page)
+        if not has_more:
+            return labels
+
+
+def test_columns_are_indexed_on_their_first_search():
+    catalog = LabelCatalog({"serviceci": TABLE, "ASGRP": {}})
+    assert "serviceci" in catalog and "ASGRP" in catalog and not catalog._columns
+    catalog.search("serviceci", "reg")
+    assert list(catalog._columns) == ["serviceci"]
+
+
+def test_every_page_size_lists_each_label_once_in_order():
+    catalog = LabelCatalog({"serviceci": TABLE})
+    expected = [
+        "Tramitacio electronica", "TRAMITS",  # starting with the prefix
+        "ARXIU - TRAMIT", "GESTIO - TRAMITS I TRAMITACIO", "MTES - MODUL DE TRAMITACIO ELECTRONICA SEGURA",
+    ]
+    for limit in range(1, 7):
+        assert all_pages(catalog, "tramit", limit) == expected, limit
+    assert catalog.search("serviceci", "tramit", 3, 1) == (["GESTIO - TRAMITS I TRAMITACIO"], True)
+    assert catalog.search("serviceci", "tramit", 5, 2) == ([], False)
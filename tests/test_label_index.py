@@ -0,0 +1,53 @@
+"""
+Normalized and approximate label matching (mpcdc/label_index.py) on code-like and free-text labels.
+"""
+import random
+
+from mpcdc.label_index import APPROXIMATE, NORMALIZED, LabelIndex, edit_distance
+
+
+def levenshtein(a, b):
+    previous = list(range(len(b) + 1))
+    for i, char in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        previous = current
+    return previous[-1]
+
+
+def test_edit_distance_agrees_with_the_dynamic_programming_one():
+    rng = random.Random(3)
+    for _ in range(2000):
+        a = "".join(rng.choice("ab.0") for _ in range(rng.randrange(12)))
+        b = "".join(rng.choice("ab.0") for _ in range(rng.randrange(12)))
+        limit = rng.randrange(8)
+        assert edit_distance(a, b, limit) == min(levenshtein(a, b), limit + 1), (a, b, limit)
+
+
+def test_index_is_built_on_the_first_lookup():
+    index = LabelIndex({"Gestión": 1.0}, approximate=True)
+    assert not index.is_built
+    assert index.match(" gestion ") == (1.0, "Gestión", 1.0, NORMALIZED)
+    assert index.is_built
+
+
+def test_a_dropped_character_matching_two_codes_is_refused():
+    index = LabelIndex({"ST.APP.00794": 1.0, "ST.APP.00074": 2.0, "ST.APP.01234": 3.0}, approximate=True)
+    assert index.match("ST.APP.0074") is None, "one edit from two codes of different indices"
+    assert index.match("ST.APP.0123")[:2] == (3.0, "ST.APP.01234"), "no other code is one edit away"
+
+
+def test_edit_distance_outranks_trigram_similarity():
+    index = LabelIndex({"AM14-CPD1-CLOUD": 1.0, "AM14-CLOUD": 2.0}, approximate=True)
+    assert index.match("AM14-CP1-CLOUD") == (1.0, "AM14-CPD1-CLOUD", round(1 - 1 / 15, 3), APPROXIMATE)
+
+
+def test_a_close_runner_up_lowers_the_confidence():
+    alone = LabelIndex({"ST.APP.00794": 1.0}, approximate=True)
+    crowded = LabelIndex({"ST.APP.00794": 1.0, "ST.APP.00714": 2.0}, approximate=True)
+    assert alone.match("ST.APP.0794")[2] == round(1 - 1 / 12, 3)
+    index, label, confidence, tier = crowded.match("ST.APP.0794")
+    assert (index, tier) == (1.0, APPROXIMATE)
+    assert confidence == round(1 - 2 / 12, 3), "ST.APP.00714 is only one more edit away"
+    assert LabelIndex({"ST.APP.00794": 1.0, "ST.APP.00714": 2.0}, approximate=True, min_confidence=0.9).match("ST.APP.0794") is None
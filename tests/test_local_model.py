@@ -0,0 +1,80 @@
+"""In-process tree-ensemble scorer (mpcdc/local_model.py) and its prediction backend."""
+import numpy as np
+import pytest
+
+from mpcdc import classifier, config
+from mpcdc.local_model import SCALAR_PATH_MAX_ROWS, TreeEnsembleModel
+
+from .support import reference_proba, synthetic_forest
+
+N_FEATURES = len(config.FEATURE_ORDER)
+
+
+@pytest.fixture(scope="module")
+def model():
+    return synthetic_forest(20, 6, N_FEATURES)
+
+
+@pytest.fixture(scope="module")
+def matrix():
+    return np.random.default_rng(11).integers(0, 60, size=(200, N_FEATURES)).astype(np.float64)
+
+
+def test_scalar_and_vectorized_walks_match_the_reference(model, matrix):
+    expected = np.array([reference_proba(model, row) for row in matrix])
+    scalar = np.concatenate([model.predict_proba(matrix[i:i + 1]) for i in range(len(matrix))])
+    assert len(matrix) > SCALAR_PATH_MAX_ROWS
+    assert np.allclose(scalar, expected)
+    assert np.allclose(model.predict_proba(matrix), expected)
+
+
+def test_predictions_use_the_decision_threshold(model, matrix):
+    expected = (np.array([reference_proba(model, row) for row in matrix]) >= model.decision_threshold).astype(float)
+    assert np.array_equal(model.predict(matrix), expected)
+    assert set(model.predict(matrix).tolist()) <= {0.0, 1.0}
+
+
+def test_npz_round_trip_keeps_scores_and_sets_a_version(model, matrix, tmp_path):
+    path = str(tmp_path / "model.npz")
+    model.save(path)
+    loaded = TreeEnsembleModel.load(path)
+    assert loaded.n_trees == model.n_trees and loaded.n_features == N_FEATURES
+    assert loaded.version and len(loaded.version) == 16
+    assert np.allclose(loaded.predict_proba(matrix), model.predict_proba(matrix))
+
+
+def test_wrong_input_width_is_refused(model):
+    with pytest.raises(ValueError):
+        model.predict_proba(np.zeros((1, N_FEATURES + 1)))
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda arrays: arrays.update(feature=np.where(arrays["left"] >= 0, N_FEATURES, -1)),
+    lambda arrays: arrays.update(left=np.where(arrays["left"] >= 0, len(arrays["left"]), -1)),
+    lambda arrays: arrays.update(value=arrays["value"][:-1]),
+    lambda arrays: arrays.update(roots=np.array([], dtype=np.int32)),
+    lambda arrays: arrays.update(roots=np.array([-1], dtype=np.int32)),
+    # An internal node whose right child is -1 would index the last node
+    lambda arrays: arrays["right"].__setitem__(0, -1),
+    # A node that is its own child, or a child of the root (node 1) pointing back at it, would loop forever
+    lambda arrays: arrays["left"].__setitem__(0, 0),
+    lambda arrays: arrays["right"].__setitem__(1, 0),
+])
+def test_inconsistent_models_are_refused(model, corrupt):
+    arrays = {name: getattr(model, name).copy() for name in ("feature", "threshold", "left", "right", "value", "roots")}
+    corrupt(arrays)
+    with pytest.raises(ValueError):
+        TreeEnsembleModel(n_features=N_FEATURES, **arrays)
+
+
+def test_backend_loads_a_matching_model_and_skips_others(tmp_path):
+    matching, other = str(tmp_path / "matching.npz"), str(tmp_path / "other.npz")
+    synthetic_forest(5, 4, N_FEATURES).save(matching)
+    synthetic_forest(5, 4, N_FEATURES + 2).save(other)
+
+    backend = classifier.load_local_backend(matching)
+    assert backend.name == "local" and backend.cache_scope() == f"local:{backend.model.version}"
+    assert backend.predict([[1.0] * N_FEATURES, [40.0] * N_FEATURES]) in ([0.0, 0.0], [0.0, 1.0], [1.0, 0.0], [1.0, 1.0])
+    assert classifier.load_local_backend(other) is None
+    assert classifier.load_local_backend(str(tmp_path / "missing.npz")) is None
+    assert classifier.load_local_backend("") is None
@@ -0,0 +1,71 @@
+"""
+Prometheus export (mpcdc/metrics.py): one process's figures, and those of several workers summed
+through the multiprocess directory.
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+from mpcdc.config import PROJECT_ROOT
+from mpcdc.metrics import Registry
+
+
+def worker_registry():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests.", ["route"])
+    latency = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    registry.collector(lambda: [("in_flight", "gauge", "In flight.", [({}, 2)]),
+                                ("sessions", "gauge", "Shared sessions.", [({}, 5)], "max")])
+    return registry, requests, latency
+
+
+def samples(rendered):
+    return dict(line.rsplit(" ", 1) for line in rendered.splitlines() if not line.startswith("#"))
+
+
+def test_a_single_process_has_no_per_process_label():
+    registry, requests, latency = worker_registry()
+    requests.inc("/a")
+    latency.observe(0.5)
+    assert samples(registry.render()) == {
+        'requests_total{route="/a"}': "1",
+        'latency_seconds_bucket{le="0.1"}': "0", 'latency_seconds_bucket{le="1.0"}': "1",
+        'latency_seconds_bucket{le="+Inf"}': "1", "latency_seconds_sum": "0.5", "latency_seconds_count": "1",
+        "in_flight": "2", "sessions": "5",
+    }
+
+
+def test_workers_are_summed_and_exited_ones_are_kept(tmp_path):
+    directory = str(tmp_path)
+    # A worker that served two requests and was recycled
+    subprocess.run([sys.executable, "-c", textwrap.dedent(f"""
+        from tests.test_metrics import worker_registry
+        registry, requests, latency = worker_registry()
+        registry.multiprocess({directory!r}, flush_interval=60)
+        requests.inc("/a", amount=2)
+        latency.observe(0.05)
+        registry.flush()
+    """)], cwd=PROJECT_ROOT, check=True)
+
+    registry, requests, latency = worker_registry()
+    requests.inc("/a")  # before multiprocess(): a figure inherited from the gunicorn master
+    registry.multiprocess(directory, flush_interval=60)
+    requests.inc("/a")
+    requests.inc("/b")
+    latency.observe(0.5)
+    other, other_requests, _ = worker_registry()
+    other.multiprocess(directory, flush_interval=60)
+    other_requests.inc("/b")
+    other.flush()  # as its periodic write would
+
+    totals = samples(registry.render())
+    assert totals['requests_total{route="/a"}'] == "3"
+    assert totals['requests_total{route="/b"}'] == "2"
+    assert totals['latency_seconds_bucket{le="0.1"}'] == "1" and totals["latency_seconds_count"] == "2"
+    assert totals["in_flight"] == "4", "gauges of the two live workers only"
+    assert totals["sessions"] == "5"
+    assert not any("pid" in sample for sample in totals)
+    assert sorted(name for name in os.listdir(directory) if name.endswith(".json"))[0] == Registry.ARCHIVE
+    assert len(os.listdir(directory)) == 4, "the exited worker's file was merged into the archive"
+    assert samples(other.render()) == totals
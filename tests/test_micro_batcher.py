@@ -0,0 +1,62 @@
+"""
+Micro-batching of concurrent single-change predictions (mpcdc/micro_batcher.py).
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mpcdc.micro_batcher import AsyncMicroBatcher, MicroBatcher
+
+
+def recording_predict(calls, latency=0.05):
+    def predict(feature_vectors):
+        calls.append(len(feature_vectors))
+        time.sleep(latency)
+        return [sum(vector) for vector in feature_vectors]
+    return predict
+
+
+def test_a_lone_request_is_not_held_for_the_wait():
+    calls = []
+    batcher = MicroBatcher(recording_predict(calls, latency=0.0), max_batch=16, max_wait=1.0)
+    start = time.perf_counter()
+    assert batcher.submit([1.0, 2.0]) == 3.0
+    assert batcher.submit([2.0, 2.0]) == 4.0
+    assert time.perf_counter() - start < 0.5, "nobody else was in flight, so nothing to wait for"
+    assert calls == [1, 1]
+
+
+def test_concurrent_requests_share_endpoint_calls():
+    calls = []
+    batcher = MicroBatcher(recording_predict(calls), max_batch=16, max_wait=0.02)
+    barrier = threading.Barrier(12)
+
+    def submit(i):
+        barrier.wait()
+        return batcher.submit([float(i)])
+
+    with ThreadPoolExecutor(12) as pool:
+        assert list(pool.map(submit, range(12))) == [float(i) for i in range(12)]
+    assert sum(calls) == 12 and len(calls) < 12
+    assert batcher.stats()["endpoint_calls_saved"] == 12 - len(calls)
+
+
+def test_async_lone_request_is_sent_at_once_and_concurrent_ones_together():
+    calls = []
+
+    async def predict(feature_vectors):
+        calls.append(len(feature_vectors))
+        await asyncio.sleep(0.02)
+        return [sum(vector) for vector in feature_vectors]
+
+    async def scenario():
+        batcher = AsyncMicroBatcher(predict, max_batch=16, max_wait=1.0)
+        start = time.perf_counter()
+        assert await batcher.submit([1.0]) == 1.0
+        assert time.perf_counter() - start < 0.5
+        results = await asyncio.gather(*(batcher.submit([float(i)]) for i in range(8)))
+        assert results == [float(i) for i in range(8)]
+
+    asyncio.run(scenario())
+    assert calls == [1, 8]
@@ -0,0 +1,61 @@
+"""Regression request bodies (mpcdc/payload.py) against the DataFrame-built payload they replace."""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mpcdc import config, payload
+from mpcdc.classifier import serialize_regression_payload
+from mpcdc.payload import PayloadBuilder
+
+N_FEATURES = len(config.FEATURE_ORDER)
+
+
+def dataframe_split_payload(feature_vectors):
+    """The payload as it used to be built: a one-column DataFrame in split orientation, without its index."""
+    split = pd.DataFrame({"features": list(feature_vectors)}).to_dict(orient="split")
+    del split["index"]
+    return {"dataframe_split": split}
+
+
+def vectors(n_rows, seed=5):
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, 3000, size=(n_rows, N_FEATURES)).astype(np.float64)
+    rows[:, 0] = 0.0  # the missing/unknown index
+    rows[-1, -1] = 1234.5
+    return rows
+
+
+@pytest.mark.parametrize("n_rows", [1, 7])
+@pytest.mark.parametrize("as_lists", [True, False], ids=["lists", "arrays"])
+@pytest.mark.parametrize("use_orjson", [True, False], ids=["orjson", "json"])
+def test_dataframe_split_body_matches_the_dataframe_payload(n_rows, as_lists, use_orjson, monkeypatch):
+    if use_orjson and payload.orjson is None:
+        pytest.skip("orjson is not installed")
+    if not use_orjson:
+        monkeypatch.setattr(payload, "orjson", None)
+    rows = vectors(n_rows)
+    feature_vectors = rows.tolist() if as_lists else list(rows)
+    body = PayloadBuilder("dataframe_split").body(feature_vectors)
+    assert json.loads(body) == json.loads(serialize_regression_payload(dataframe_split_payload(feature_vectors)))
+
+
+def test_inputs_body_holds_the_rows_as_one_tensor():
+    rows = vectors(3)
+    assert json.loads(PayloadBuilder("inputs").body(rows)) == {"inputs": {"features": rows.tolist()}}
+
+
+@pytest.mark.parametrize("value", [float("nan"), float("inf")])
+def test_non_finite_values_are_refused_like_the_dataframe_payload(value):
+    rows = vectors(2).tolist()
+    rows[1][3] = value
+    with pytest.raises(ValueError):
+        serialize_regression_payload(dataframe_split_payload(rows))
+    with pytest.raises(ValueError):
+        PayloadBuilder().body(rows)
+
+
+def test_unknown_formats_are_refused():
+    with pytest.raises(ValueError):
+        PayloadBuilder("records")
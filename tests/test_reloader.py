@@ -0,0 +1,99 @@
+"""Hot reload of the equivalence map (mpcdc/reloader.py) through the classifier's reloader."""
+import os
+
+import pytest
+
+from mpcdc import classifier, config
+from mpcdc.lazy import lazy
+from mpcdc.prediction_cache import MemoryCache, PredictionCache
+from mpcdc.reloader import FileReloader
+
+from .support import CHANGE
+
+SERVICE = "f01_chr_serviceid"
+
+
+def write_map(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("Column,Index,Label\n")
+        f.writelines(f"{column},{index},{label}\n" for column, index, label in rows)
+
+
+@pytest.fixture
+def reloader(monkeypatch, tmp_path):
+    """A fresh equivalence map reloader on a temporary CSV (no snapshot, no poller), with a prediction cache."""
+    csv_path = str(tmp_path / "equivalence.csv")
+    write_map(csv_path, [(SERVICE, 1.0, CHANGE[SERVICE])])
+    monkeypatch.setattr(config, "EQUIVALENCE_CSV_PATH", csv_path)
+    monkeypatch.setattr(config, "EQUIVALENCE_SNAPSHOT_PATH", str(tmp_path / "missing.snapshot"))
+    cache = PredictionCache(MemoryCache(16, 60))
+    monkeypatch.setattr(classifier, "get_prediction_cache", lambda: cache)
+    monkeypatch.setattr(classifier, "get_equivalence_reloader", lazy(classifier.get_equivalence_reloader.__wrapped__))
+    return classifier.get_equivalence_reloader()
+
+
+def reload(reloader):
+    """Polls the file twice, as the poller would: a change is loaded once it has settled."""
+    assert reloader.check() is False, "a just-changed file is not loaded yet"
+    return reloader.check()
+
+
+def service_index(encoder):
+    return encoder.encode(CHANGE)[0][encoder.features.index(SERVICE)]
+
+
+def test_a_rewritten_map_is_swapped_in_with_a_new_cache_namespace(reloader):
+    first = classifier.get_feature_encoder()
+    assert service_index(first) == 1.0
+    vector = first.encode(CHANGE)[0]
+    classifier.get_prediction_cache().set(vector, classifier.prediction_cache_namespace(first.version), 1.0)
+    assert classifier.cached_classification(vector, first.version)["cached"] is True
+
+    write_map(config.EQUIVALENCE_CSV_PATH, [(SERVICE, 2.0, CHANGE[SERVICE]), (SERVICE, 3.0, "ST.NEW.00001")])
+    assert reload(reloader) is True
+    second = classifier.get_feature_encoder()
+    assert second.version != first.version and service_index(second) == 2.0
+    assert classifier.get_prediction_cache().namespace == classifier.prediction_cache_namespace(second.version)
+    assert classifier.cached_classification(vector, second.version) is None, "predictions of the old map were dropped"
+    assert classifier.cached_classification(vector, first.version) is None, "a request still on the old map bypasses the cache"
+    assert reloader.stats()["reloads"] == 1 and reloader.stats()["version"] == second.version
+
+
+def test_a_malformed_map_keeps_the_loaded_one(reloader):
+    loaded = classifier.get_feature_encoder()
+    namespace = classifier.get_prediction_cache().namespace
+
+    with open(config.EQUIVALENCE_CSV_PATH, "w") as f:
+        f.write("not,an,equivalence map\n1,2,3\n")
+    assert reload(reloader) is False
+    assert classifier.get_feature_encoder() is loaded and service_index(loaded) == 1.0
+    assert classifier.get_prediction_cache().namespace == namespace
+    assert reloader.stats()["reload_failures"] == 1 and reloader.stats()["last_error"]
+
+    # The next good version is loaded, and clears the error
+    write_map(config.EQUIVALENCE_CSV_PATH, [(SERVICE, 4.0, CHANGE[SERVICE])])
+    assert reload(reloader) is True
+    assert service_index(classifier.get_feature_encoder()) == 4.0 and reloader.stats()["last_error"] is None
+
+
+def test_a_file_being_written_is_not_loaded_until_it_settles(tmp_path):
+    path = str(tmp_path / "data.txt")
+    with open(path, "w") as f:
+        f.write("1")
+    built = []
+
+    def build():
+        with open(path) as f:
+            built.append(f.read())
+        return built[-1]
+
+    reloader = FileReloader(build, path, interval=0, version=lambda value: value)
+    with open(path, "a") as f:
+        f.write("2")
+    assert reloader.check() is False
+    with open(path, "a") as f:
+        f.write("3")
+    os.utime(path, ns=(1, 1))  # a new signature even on coarse-grained file systems
+    assert reloader.check() is False, "still changing"
+    assert reloader.check() is True and reloader.current() == "123"
+    assert built == ["1", "123"]
@@ -0,0 +1,41 @@
+"""
+Risk-assessment stage (mpcdc/risk_assessment.py): reply validation and the assessment cache.
+"""
+import json
+
+from mpcdc import classifier, config
+from mpcdc.prediction_cache import MemoryCache
+from mpcdc.risk_assessment import RiskAssessor
+
+from .support import CHANGE
+
+
+def echoing_generate(prompts):
+    """An LLM stand-in whose explanation quotes the dates of the prompt it was given."""
+    def generate(prompt):
+        prompts.append(prompt)
+        dates = [line for line in prompt.splitlines() if "_date:" in line]
+        return json.dumps({"overall_explanation": " ".join(dates),
+                           "actionable_plans": [{"description": "Review", "confidence_score": "High"}]})
+    return generate
+
+
+def test_changes_sharing_a_feature_vector_get_their_own_assessment():
+    first = {**CHANGE, "submit_date": "2026-09-01 10:00:00", "scheduled_start_date": "2026-09-02 22:00:00"}
+    second = {**CHANGE, "submit_date": "2026-10-05 09:30:00", "scheduled_start_date": "2026-10-06 23:00:00"}
+    encoder = classifier.get_feature_encoder()
+    assert classifier.create_feature_vector(first, encoder=encoder) == classifier.create_feature_vector(second, encoder=encoder), \
+        "unseen dates encode to the same index"
+
+    prompts = []
+    assessor = RiskAssessor(echoing_generate(prompts), "1-test", cache=MemoryCache(16))
+    fields = config.MODEL_INPUT_FEATURES
+    first_assessment, first_cached = assessor.assess(first, "P3", fields, scope=encoder.version)
+    second_assessment, second_cached = assessor.assess(second, "P3", fields, scope=encoder.version)
+    assert not first_cached and not second_cached
+    assert "2026-09-02 22:00:00" in first_assessment["overall_explanation"]
+    assert "2026-10-06 23:00:00" in second_assessment["overall_explanation"]
+
+    # The same details again are served from the cache
+    assert assessor.assess(dict(second), "P3", fields, scope=encoder.version) == (second_assessment, True)
+    assert len(prompts) == 2
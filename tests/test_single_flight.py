@@ -0,0 +1,238 @@
+"""
+In-flight deduplication (mpcdc/single_flight.py) and Idempotency-Key replay (mpcdc/idempotency.py),
+on their own and through /mpcdc/classify_change on the Flask and ASGI apps.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from mpcdc.idempotency import (
+    IdempotencyConflict, IdempotencyStore, SqliteResponseStore, request_fingerprint, valid_idempotency_key
+)
+from mpcdc.single_flight import AsyncSingleFlight, SingleFlight
+
+from .support import CHANGE
+
+DUPLICATES = 16
+# Service IDs of the equivalence map, so these changes get distinct feature vectors
+SERVICE_IDS = ["ST.APP.02516", "ST.LLT.LT2", "ST.APP.01889", "ST.APP.00432", "CP.APP.00021.01"]
+
+
+def test_concurrent_calls_for_a_key_share_one_run():
+    flights = SingleFlight()
+    runs = []
+    release = threading.Event()
+
+    def work():
+        runs.append(1)
+        release.wait()
+        return "result"
+
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(flights.do, "key", work) for _ in range(8)]
+        while flights.stats()["shared"] < 7:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result() for future in futures]
+    assert len(runs) == 1
+    assert sorted(shared for _, shared in results) == [False] + [True] * 7
+    assert all(result == "result" for result, _ in results)
+    assert flights.stats() == {"in_flight": 0, "leaders": 1, "shared": 7}
+    assert flights.do("key", lambda: "again") == ("again", False), "nothing is kept once the leader is done"
+
+
+def test_callers_sharing_a_call_get_copies_of_its_error():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait()
+        raise ValueError("endpoint down")
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flights.do, "key", fail) for _ in range(4)]
+        while flights.stats()["shared"] < 3:
+            time.sleep(0.001)
+        release.set()
+        errors = [future.exception() for future in futures]
+    assert all(isinstance(error, ValueError) and str(error) == "endpoint down" for error in errors)
+    assert len({id(error) for error in errors}) == 4
+
+
+def test_async_flight_survives_a_cancelled_caller():
+    async def scenario():
+        flights = AsyncSingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        first = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, len(runs), flights.stats()
+
+    (result, shared), runs, stats = asyncio.run(scenario())
+    assert (result, shared, runs) == ("result", True, 1)
+    assert stats["in_flight"] == 0
+
+
+def test_idempotency_store_replays_and_refuses_conflicts():
+    store = IdempotencyStore(max_entries=10, ttl=60)
+    calls = []
+
+    def compute(status=200):
+        calls.append(1)
+        return {"prediction": "P1"}, status
+
+    fingerprint = request_fingerprint({"a": 1, "b": 2})
+    assert request_fingerprint({"b": 2, "a": 1}) == fingerprint, "key order does not matter"
+    assert store.run("k", fingerprint, compute) == ({"prediction": "P1"}, 200, False)
+    assert store.run("k", fingerprint, compute) == ({"prediction": "P1"}, 200, True)
+    with pytest.raises(IdempotencyConflict):
+        store.run("k", request_fingerprint({"a": 2}), compute)
+    assert len(calls) == 1
+
+    store.run("failed", fingerprint, lambda: compute(502))
+    assert store.run("failed", fingerprint, compute)[2] is False, "5xx responses are served again"
+    assert store.stats()["replays"] == 1 and store.stats()["conflicts"] == 1
+
+
+def test_shared_idempotency_store_replays_across_workers(tmp_path):
+    path = str(tmp_path / "idempotency.sqlite")
+    # Two stores on one file stand for two gunicorn workers
+    first, second = (IdempotencyStore(ttl=60, responses=SqliteResponseStore(path, ttl=60)) for _ in range(2))
+    fingerprint = request_fingerprint({"a": 1})
+    assert first.run("k", fingerprint, lambda: ({"prediction": "P1"}, 200)) == ({"prediction": "P1"}, 200, False)
+    assert second.run("k", fingerprint, lambda: ({"prediction": "P3"}, 200)) == ({"prediction": "P1"}, 200, True)
+    with pytest.raises(IdempotencyConflict):
+        second.run("k", request_fingerprint({"a": 2}), lambda: ({}, 200))
+    assert second.stats()["backend"] == "sqlite" and second.stats()["entries"] == 1
+
+
+def test_shared_idempotency_store_replaces_expired_responses(tmp_path):
+    responses = SqliteResponseStore(str(tmp_path / "idempotency.sqlite"), ttl=0.05)
+    responses.set("k", ["fp", {"n": 1}, 200])
+    time.sleep(0.06)
+    assert responses.get("k") is None
+    responses.set("k", ["fp", {"n": 2}, 200])
+    assert responses.get("k") == ("fp", {"n": 2}, 200)
+
+
+def test_async_idempotency_store_does_not_block_the_event_loop():
+    class SlowResponses(dict):
+        """A response store whose reads and writes block, like sqlite waiting on another process's lock."""
+        def get(self, key):
+            time.sleep(0.1)
+            return super().get(key)
+
+        def set(self, key, entry):
+            time.sleep(0.1)
+            self[key] = entry
+
+    store = IdempotencyStore(responses=SlowResponses())
+    fingerprint = request_fingerprint({"a": 1})
+
+    async def compute():
+        return {"prediction": "P1"}, 200
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        first = await store.run_async("k", fingerprint, compute)
+        second = await store.run_async("k", fingerprint, compute)
+        ticker.cancel()
+        return first, second, ticks
+
+    first, second, ticks = asyncio.run(main())
+    assert (first[2], second[2]) == (False, True)
+    assert ticks >= 10, "the loop kept running while the store was read and written"
+
+
+@pytest.mark.parametrize("key, valid", [("3f2c-uuid", True), ("x" * 255, True), ("", False), ("x" * 256, False),
+                                        ("café", False), ("tab\tkey", False), (None, False)])
+def test_idempotency_key_format(key, valid):
+    assert valid_idempotency_key(key) is valid
+
+
+def flask_posts(client, requests):
+    """Posts (change, headers) pairs at once from threads; returns [(status, headers, json)]."""
+    def post(request):
+        change, headers = request
+        response = client.post("/mpcdc/classify_change", json=change, headers=headers)
+        return response.status_code, response.headers, response.get_json()
+
+    with ThreadPoolExecutor(len(requests)) as pool:
+        return list(pool.map(post, requests))
+
+
+def asgi_posts(client, requests):
+    """Same as flask_posts through the ASGI app, as concurrent tasks of one event loop."""
+    async def post_all():
+        async def post(request):
+            change, headers = request
+            response = await client.post("/mpcdc/classify_change", json=change, headers=headers)
+            return response.status_code, response.headers, response.json()
+        return await asyncio.gather(*(post(request) for request in requests))
+
+    return asyncio.run(post_all())
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def posts(request, web):
+    if request.param == "flask":
+        client = web.app.test_client()
+        return lambda requests: flask_posts(client, requests)
+    import httpx
+
+    import asgi
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi.application), base_url="http://mpcdc")
+    return lambda requests: asgi_posts(client, requests)
+
+
+def test_identical_concurrent_changes_make_one_endpoint_call(posts, stub_endpoint):
+    stub_endpoint.latency = 0.2
+    calls = stub_endpoint.calls
+    results = posts([(CHANGE, {})] * DUPLICATES)
+    assert all(status == 200 for status, _, _ in results)
+    assert stub_endpoint.calls - calls == 1
+
+
+def test_distinct_concurrent_changes_are_scored_separately(posts, stub_endpoint):
+    stub_endpoint.latency = 0.2
+    calls = stub_endpoint.calls
+    distinct = [({**CHANGE, "f01_chr_serviceid": service_id}, {}) for service_id in SERVICE_IDS[:-1]]
+    assert all(status == 200 for status, _, _ in posts(distinct))
+    assert stub_endpoint.calls - calls == len(distinct)
+
+
+def test_idempotency_key_replays_the_stored_response(posts, stub_endpoint):
+    key = {"Idempotency-Key": str(uuid.uuid4())}
+    change = {**CHANGE, "f01_chr_serviceid": SERVICE_IDS[-1]}
+    calls = stub_endpoint.calls
+    (status, headers, body), = posts([(change, key)])
+    assert status == 200 and "Idempotent-Replayed" not in headers
+    repeats = posts([(change, key)] * 4)
+    assert all(status == 200 and headers.get("Idempotent-Replayed") == "true" and repeat == body
+               for status, headers, repeat in repeats)
+    assert stub_endpoint.calls - calls == 1
+
+    (status, _, _), = posts([(CHANGE, key)])
+    assert status == 422, "a key reused for another change is refused"
+    (status, _, _), = posts([(CHANGE, {"Idempotency-Key": "x" * 256})])
+    assert status == 400, "a malformed key is refused"